@@ -2,7 +2,7 @@ import sys
 from PySide6.QtWidgets import QApplication, QMessageBox
 
 from core.session import Session
-from core.vault import load_vault, save_vault
+from core.vault import create_vault_key, open_vault, save_vault
 
 from ui_qt.vault_picker import VaultPicker
 from ui_qt.unlock_window import UnlockWindow
@@ -47,14 +47,15 @@ def main():
         vault = create_empty_vault()
 
         try:
-            save_vault(vault, unlock.password, picker.selected_path)
+            key = create_vault_key(unlock.password)
+            save_vault(vault, key, picker.selected_path)
         except Exception as e:
             QMessageBox.critical(None, "Ошибка", str(e))
             return
 
         session.unlock(
             vault,
-            unlock.password,
+            key,
             picker.selected_path
         )
 
@@ -67,15 +68,23 @@ def main():
             return
 
         try:
-            vault = load_vault(unlock.password, picker.selected_path)
+            vault, key, write_lock = open_vault(unlock.password, picker.selected_path)
         except Exception as e:
             QMessageBox.critical(None, "Ошибка", str(e))
             return
 
         session.unlock(
             vault,
-            unlock.password,
-            picker.selected_path
+            key,
+            picker.selected_path,
+            write_lock,
+        )
+
+    if session.read_only:
+        QMessageBox.warning(
+            None, "ZipPass",
+            "Хранилище открыто для записи другим процессом (например, агентом).\n"
+            "Изменения не будут сохранены.",
         )
 
     # ===============================
@@ -84,6 +93,9 @@ def main():
     window = MainWindow(session)
     window.show()
 
+    # Pending background saves must hit the disk before exit
+    app.aboutToQuit.connect(session.flush)
+
     sys.exit(app.exec())
 
 
@@ -0,0 +1,86 @@
+"""
+Payload cipher micro-benchmark: Fernet vs AEAD.
+
+    python -m benchmarks.bench_cipher [--sizes 1000 10000 100000]
+
+For every cipher and vault size reports file size, save time,
+unlock time (index only) and the time to decrypt every entry.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from cryptography.fernet import Fernet
+
+from core import storage
+from core.crypto import CIPHERS
+from core.keys import VaultKey
+from core.vault import load_vault, save_vault
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+def make_vault(count: int) -> dict:
+    categories = [{"id": f"c{i}", "name": f"Category {i}"} for i in range(10)]
+    entries = [
+        {
+            "id": f"e{i:08d}",
+            "service": f"service-{i % 500}",
+            "login": f"user{i % 97}@example.com",
+            "url": f"https://service-{i % 500}.example.com/login",
+            "password": os.urandom(12).hex(),
+            "note": "",
+            "category_id": f"c{i % 10}",
+            "created_at": 1700000000.0 + i,
+            "updated_at": 1700000000.0 + i,
+        }
+        for i in range(count)
+    ]
+    return {"meta": {}, "categories": categories, "entries": entries}
+
+
+def run(cipher: str, vault: dict, directory: str) -> dict:
+    path = os.path.join(directory, f"{cipher}.zippass")
+    key = VaultKey(Fernet.generate_key(), cipher=cipher)
+
+    t0 = time.perf_counter()
+    save_vault(vault, key, path)
+    t1 = time.perf_counter()
+    loaded = load_vault(key, path)
+    t2 = time.perf_counter()
+    for entry in loaded["entries"]:
+        entry["password"]
+    t3 = time.perf_counter()
+
+    return {
+        "size": os.path.getsize(path),
+        "save_ms": (t1 - t0) * 1000,
+        "unlock_ms": (t2 - t1) * 1000,
+        "decrypt_ms": (t3 - t2) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    storage.set_fsync_policy(storage.FSYNC_NEVER)
+
+    print(f"{'entries':>8} {'cipher':<18} {'size KiB':>9} "
+          f"{'save ms':>9} {'unlock ms':>10} {'decrypt ms':>11}")
+
+    for count in args.sizes:
+        vault = make_vault(count)
+        with tempfile.TemporaryDirectory() as directory:
+            for cipher in CIPHERS:
+                r = run(cipher, vault, directory)
+                print(f"{count:>8} {cipher:<18} {r['size'] / 1024:>9.1f} "
+                      f"{r['save_ms']:>9.1f} {r['unlock_ms']:>10.1f} "
+                      f"{r['decrypt_ms']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Payload codec round-trip / throughput benchmark: JSON vs compact.
+
+    python -m benchmarks.bench_codec [--sizes 1000 10000 100000]
+
+Encodes and decodes the vault index and every record with each codec,
+checks the round trip and reports sizes, MB/s and decode time per
+entry. MB/s is of each codec's own output, so the smaller compact
+encoding reads lower for the same time: compare the last column.
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_cipher import make_vault
+from core.codec import CODECS, make_codec
+from core.records import INDEX_FIELDS
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+def make_index(vault: dict) -> dict:
+    rows = [
+        [e.get(f, "") for f in INDEX_FIELDS] + [i * 300, 300]
+        for i, e in enumerate(vault["entries"])
+    ]
+    return {
+        "meta": vault["meta"],
+        "categories": vault["categories"],
+        "fields": list(INDEX_FIELDS),
+        "entries": rows,
+    }
+
+
+def run(name: str, vault: dict) -> dict:
+    codec = make_codec(name)
+    index = make_index(vault)
+
+    t0 = time.perf_counter()
+    index_blob = codec.encode(index)
+    record_blobs = [codec.encode_record(e) for e in vault["entries"]]
+    t1 = time.perf_counter()
+    decoded_index = codec.decode(index_blob)
+    decoded = [codec.decode_record(b) for b in record_blobs]
+    t2 = time.perf_counter()
+
+    if decoded_index != index or decoded != vault["entries"]:
+        raise AssertionError(f"{name}: round trip changed the data")
+
+    size = len(index_blob) + sum(map(len, record_blobs))
+    return {
+        "index": len(index_blob),
+        "size": size,
+        "encode_ms": (t1 - t0) * 1000,
+        "decode_ms": (t2 - t1) * 1000,
+        "index_decode_ms": _time(codec.decode, index_blob),
+    }
+
+
+def _time(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'codec':<8} {'index KiB':>10} {'total KiB':>10} "
+          f"{'enc MB/s':>9} {'dec MB/s':>9} {'index dec ms':>13} {'dec us/entry':>13}")
+
+    for count in args.sizes:
+        vault = make_vault(count)
+        for name in CODECS:
+            r = run(name, vault)
+            mb = r["size"] / 1e6
+            print(f"{count:>8} {name:<8} {r['index'] / 1024:>10.1f} "
+                  f"{r['size'] / 1024:>10.1f} "
+                  f"{mb / (r['encode_ms'] / 1000):>9.1f} "
+                  f"{mb / (r['decode_ms'] / 1000):>9.1f} "
+                  f"{r['index_decode_ms']:>13.1f} "
+                  f"{r['decode_ms'] * 1000 / count:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+URL lookup benchmark: domain trie vs linear scan.
+
+    python -m benchmarks.bench_domains [--sizes 10000 100000]
+
+Reports the one-off DomainIndex build time, then for a few URLs the
+worst of several lookups (best 20, and all matches) against a scan
+comparing the site of every entry.
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_cipher import make_vault
+from core.domains import DomainIndex, host_of, site_of
+from core.entry_store import EntryStore
+
+DEFAULT_SIZES = (10_000, 100_000)
+
+URLS = (
+    "https://service-42.example.com/login",
+    "https://accounts.service-7.example.com",
+    "example.com",
+    "https://nowhere.example.org",
+)
+
+REPEAT = 20
+
+
+def scan(entries, url: str) -> list[dict]:
+    site = site_of(host_of(url))
+    return [e for e in entries if site_of(host_of(e.get("url"))) == site]
+
+
+def worst(fn, url: str) -> float:
+    worst = 0.0
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(url)
+        worst = max(worst, time.perf_counter() - start)
+    return worst * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'url':<40} {'top20 ms':>9} {'all ms':>8} "
+          f"{'scan ms':>8} {'hits':>6}")
+
+    for count in args.sizes:
+        store = EntryStore(make_vault(count)["entries"])
+        index = DomainIndex(store)
+
+        start = time.perf_counter()
+        index.build()
+        print(f"{count:>8} {'(build)':<40} {(time.perf_counter() - start) * 1000:>9.1f}")
+
+        for url in URLS:
+            hits = index.match(url)
+            if sorted(e["id"] for e in hits) != sorted(e["id"] for e in scan(store, url)):
+                raise AssertionError(f"{url!r}: index and scan disagree")
+
+            top_ms = worst(lambda u: index.match(u, 20), url)
+            all_ms = worst(index.match, url)
+            scan_ms = worst(lambda u: scan(store, u), url) if count <= 10_000 else float("nan")
+            print(f"{count:>8} {url:<40} {top_ms:>9.3f} {all_ms:>8.1f} "
+                  f"{scan_ms:>8.1f} {len(hits):>6}")
+
+
+if __name__ == "__main__":
+    main()
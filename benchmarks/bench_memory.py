@@ -0,0 +1,79 @@
+"""
+Peak memory of save / load / stream at growing vault sizes.
+
+    python -m benchmarks.bench_memory [--sizes 10000 50000 100000]
+
+Peaks are measured with tracemalloc above what was allocated before
+the call, so the vault being saved is not counted.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from cryptography.fernet import Fernet
+
+from benchmarks.bench_cipher import make_vault
+from core import records, storage
+from core.crypto import DEFAULT_CIPHER
+from core.keys import VaultKey
+from core.vault import load_vault, save_vault, stream_vault
+
+DEFAULT_SIZES = (10_000, 50_000, 100_000)
+
+
+def measure(fn, *args) -> tuple[float, float]:
+    """
+    (peak MiB above the starting point, wall ms)
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (peak - base) / 2 ** 20, elapsed
+
+
+def stream_all(key: VaultKey, path: str) -> None:
+    _, entries = stream_vault(key, path)
+    for _ in entries:
+        pass
+
+
+def load_all(key: VaultKey, path: str) -> None:
+    vault = load_vault(key, path)
+    records.release(vault)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    storage.set_fsync_policy(storage.FSYNC_NEVER)
+    key = VaultKey(Fernet.generate_key(), cipher=DEFAULT_CIPHER)
+
+    print(f"{'entries':>8} {'file MiB':>9} {'save MiB':>9} {'load MiB':>9} "
+          f"{'stream MiB':>11} {'stream ms':>10}")
+
+    for count in args.sizes:
+        vault = make_vault(count)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.zippass")
+
+            save_peak, _ = measure(save_vault, vault, key, path)
+            load_peak, _ = measure(load_all, key, path)
+            stream_peak, stream_ms = measure(stream_all, key, path)
+
+            print(f"{count:>8} {os.path.getsize(path) / 2 ** 20:>9.1f} "
+                  f"{save_peak:>9.1f} {load_peak:>9.1f} "
+                  f"{stream_peak:>11.1f} {stream_ms:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
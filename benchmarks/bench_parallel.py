@@ -0,0 +1,70 @@
+"""
+Wall time of save / unlock / full decrypt against crypto worker count.
+
+    python -m benchmarks.bench_parallel [--sizes 10000 100000 500000]
+                                        [--workers 1 2 4 8]
+
+Save and unlock work in row chunks of core.records.INDEX_CHUNK_ROWS;
+the full decrypt pass is stream_vault (every record).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from cryptography.fernet import Fernet
+
+from benchmarks.bench_cipher import make_vault
+from core import records, storage
+from core.crypto import DEFAULT_CIPHER
+from core.keys import VaultKey
+from core.vault import load_vault, save_vault, stream_vault
+
+DEFAULT_SIZES = (10_000, 100_000, 500_000)
+DEFAULT_WORKERS = (1, 2, 4, 8)
+
+
+def timed(fn, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def decrypt_all(key: VaultKey, path: str) -> None:
+    _, entries = stream_vault(key, path)
+    for _ in entries:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--workers", type=int, nargs="+", default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    storage.set_fsync_policy(storage.FSYNC_NEVER)
+    key = VaultKey(Fernet.generate_key(), cipher=DEFAULT_CIPHER)
+
+    print(f"cpu count: {os.cpu_count()}")
+    print(f"{'entries':>8} {'workers':>8} {'save ms':>9} {'unlock ms':>10} "
+          f"{'decrypt ms':>11}")
+
+    for count in args.sizes:
+        vault = make_vault(count)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.zippass")
+            for workers in args.workers:
+                records.set_workers(workers)
+
+                save_ms, _ = timed(save_vault, vault, key, path)
+                unlock_ms, loaded = timed(load_vault, key, path)
+                records.release(loaded)
+                decrypt_ms, _ = timed(decrypt_all, key, path)
+
+                print(f"{count:>8} {workers:>8} {save_ms:>9.0f} "
+                      f"{unlock_ms:>10.0f} {decrypt_ms:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Search-as-you-type benchmark: trigram index vs linear scan.
+
+    python -m benchmarks.bench_search [--sizes 10000 100000]
+
+Types a few queries one character at a time and reports the worst
+keystroke for the core SearchIndex, for ranked (fuzzy top-k) search
+and for the old per-keystroke haystack scan, plus the one-off index
+build time and the time to restore it from its saved form. Each
+keystroke is timed as the best of --repeat runs.
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_cipher import make_vault
+from core.entry_store import EntryStore
+from core.search import SavedIndex, SearchIndex
+
+DEFAULT_SIZES = (10_000, 100_000)
+
+QUERIES = ("service-42", "user13@", "login", "zzz", "srvce-42", "sevrice-7")
+
+
+def scan(entries, query: str) -> list[dict]:
+    query = query.lower()
+    return [
+        e for e in entries
+        if query in " ".join((
+            e.get("service", ""), e.get("login", ""),
+            e.get("url", ""), e.get("note", ""),
+        )).lower()
+    ]
+
+
+def worst_keystroke(fn, query: str, repeat: int = 1) -> float:
+    worst = 0.0
+    for i in range(1, len(query) + 1):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(query[:i])
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        worst = max(worst, best)
+    return worst * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'query':<12} {'index ms':>9} {'rank ms':>8} "
+          f"{'scan ms':>8} {'hits':>6} {'best'}")
+
+    for count in args.sizes:
+        store = EntryStore(make_vault(count)["entries"])
+        index = SearchIndex(store)
+
+        start = time.perf_counter()
+        index.build()
+        print(f"{count:>8} {'(build)':<12} {(time.perf_counter() - start) * 1000:>9.1f}")
+
+        saved = SavedIndex(index.snapshot().encode(0), 0)
+        start = time.perf_counter()
+        SearchIndex(store, saved).prepare()
+        print(f"{count:>8} {'(restore)':<12} {(time.perf_counter() - start) * 1000:>9.1f}")
+
+        for query in QUERIES:
+            hits = index.search(query)
+            if [e["id"] for e in hits] != [e["id"] for e in scan(store, query)]:
+                raise AssertionError(f"{query!r}: index and scan disagree")
+
+            index_ms = worst_keystroke(index.search, query, args.repeat)
+            rank_ms = worst_keystroke(index.rank, query, args.repeat)
+            scan_ms = worst_keystroke(lambda q: scan(store, q), query, args.repeat)
+            ranked = index.rank(query)
+            best = ranked[0]["service"] if ranked else "-"
+            print(f"{count:>8} {query:<12} {index_ms:>9.1f} {rank_ms:>8.1f} "
+                  f"{scan_ms:>8.1f} {len(hits):>6} {best}")
+
+
+if __name__ == "__main__":
+    main()
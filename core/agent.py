@@ -0,0 +1,449 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from core import query
+from core.frecency import Frecency
+from core.native_host import RequestError
+from core.records import INDEX_FIELDS
+from core.search import SearchIndex, peek_fields
+from core.session import Session
+from core.vault import open_vault
+
+# =====================
+# Unlock agent
+# =====================
+#
+# Long-running process that keeps one vault unlocked in a Session, so
+# scripts ask it instead of deriving the key and decrypting the vault
+# on every run (like ssh-agent for keys). Clients connect to a Unix
+# socket only the owner can open and exchange JSON lines, one request
+# per line, answered in order:
+#
+#   -> {"id": 1, "action": "search", "query": "mail login:bob"}
+#   <- {"id": 1, "ok": true, "entries": [{"id": ..., "service": ...}]}
+#
+# Requests of all clients run one at a time on the event loop; those
+# that take long (unlock, the first index build) run on a worker
+# thread while the others wait. The session locks itself after
+# session.auto_lock_minutes without requests; an "unlock" request
+# opens it again.
+
+SOCKET_ENV = "ZIPPASS_AGENT_SOCK"
+
+# Longest request line
+MAX_LINE = 1024 * 1024
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 10_000
+
+# Search results kept for repeated queries, until the vault changes
+RESULT_CACHE = 64
+
+# How often the auto-lock timer is checked
+INACTIVITY_CHECK = 10.0
+
+# Fields "add" accepts
+ENTRY_FIELDS = ("service", "login", "password", "url", "note", "category_id")
+
+
+def default_socket_path() -> str:
+    """
+    $ZIPPASS_AGENT_SOCK, else a socket in the user's runtime directory.
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "zippass", "agent.sock")
+    return os.path.join(tempfile.gettempdir(), f"zippass-{os.getuid()}", "agent.sock")
+
+
+class Agent:
+    """
+    Serves one vault from an unlocked core.session.Session. Unix only.
+    `is_weak` is the password check of "weak:" queries (core.query).
+    """
+
+    def __init__(
+        self,
+        vault_path: str,
+        socket_path: str | None = None,
+        session: Session | None = None,
+        is_weak: Callable[[str], bool] | None = None,
+    ):
+        self.vault_path = vault_path
+        self.socket_path = socket_path or default_socket_path()
+        self.session = session or Session()
+        self.is_weak = is_weak
+        self.index: SearchIndex | None = None
+        self.frecency: Frecency | None = None
+        self._results: OrderedDict[tuple, list[dict]] = OrderedDict()
+        self._weak_verdicts: dict = {}
+        self._busy = asyncio.Lock()
+        self._server: asyncio.AbstractServer | None = None
+
+        self._actions = {
+            "status": self._status,
+            "unlock": self._unlock,
+            "lock": self._lock_vault,
+            "get": self._get,
+            "search": self._search,
+            "list": self._list,
+            "categories": self._categories,
+            "add": self._add,
+        }
+
+    # =========================
+    # Serving
+    # =========================
+
+    async def serve(self) -> None:
+        """
+        Listen until cancelled, then lock the vault and remove the socket.
+        """
+        self._server = await self._listen()
+        watch = asyncio.create_task(self._watch_inactivity())
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            watch.cancel()
+            self._close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def start(self, vault: dict, key, write_lock=None) -> None:
+        """
+        Serve a vault the caller already unlocked with open_vault
+        (zippass_agent.py asks for the password on the terminal).
+        """
+        self.session.unlock(vault, key, self.vault_path, write_lock)
+        await self._opened()
+
+    async def _listen(self) -> asyncio.AbstractServer:
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            if _is_live(self.socket_path):
+                raise RuntimeError(f"Agent already running on {self.socket_path}")
+            os.unlink(self.socket_path)
+
+        # No window where the socket is open to others
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(
+                self._client, path=self.socket_path, limit=MAX_LINE,
+            )
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        return server
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            if not _same_user(writer.get_extra_info("socket")):
+                return
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_LINE: the stream can't be resynced
+                    writer.write(_line({"id": None, "ok": False, "error": "too_large"}))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                writer.write(_line(await self.handle(line)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return {"id": None, "ok": False, "error": "bad_message"}
+        if not isinstance(request, dict):
+            return {"id": None, "ok": False, "error": "bad_message"}
+
+        response = {"id": request.get("id")}
+        action = self._actions.get(request.get("action"))
+        try:
+            if action is None:
+                raise RequestError("unknown_action")
+            async with self._busy:
+                self.session.check_inactivity()
+                result = await action(request)
+                self.session.notify_activity()
+        except RequestError as e:
+            response.update(ok=False, error=e.code)
+            if str(e) != e.code:
+                response["message"] = str(e)
+            return response
+        except Exception as e:
+            response.update(ok=False, error="internal", message=str(e))
+            return response
+        response["ok"] = True
+        response.update(result)
+        return response
+
+    async def _watch_inactivity(self) -> None:
+        while True:
+            await asyncio.sleep(INACTIVITY_CHECK)
+            async with self._busy:
+                self.session.check_inactivity()
+
+    # =========================
+    # Actions
+    # =========================
+
+    async def _status(self, request: dict) -> dict:
+        status = {"unlocked": self.session.is_unlocked, "vault": self.vault_path}
+        if self.session.is_unlocked:
+            status["entries"] = len(self.session.vault["entries"])
+            status["read_only"] = self.session.read_only
+        return status
+
+    async def _unlock(self, request: dict) -> dict:
+        password = request.get("password")
+        if not isinstance(password, str):
+            raise RequestError("bad_request", "password is required")
+        if self.session.is_unlocked:
+            return {}
+        loop = asyncio.get_running_loop()
+        try:
+            vault, key, write_lock = await loop.run_in_executor(
+                None, open_vault, password, self.vault_path,
+            )
+        except FileNotFoundError:
+            raise RequestError("not_found", "vault file not found") from None
+        except Exception:
+            raise RequestError("unlock_failed") from None
+        self.session.unlock(vault, key, self.vault_path, write_lock)
+        await self._opened()
+        return {}
+
+    async def _lock_vault(self, request: dict) -> dict:
+        if not self._close():
+            raise RequestError("save_failed", self.session.saver.state().error or "")
+        return {}
+
+    async def _get(self, request: dict) -> dict:
+        store = self._store()
+        entry = store.get(request.get("entry"))
+        if entry is None:
+            raise RequestError("not_found", "no such entry")
+        load = getattr(entry, "load", None)
+        if load is not None:
+            load()
+        return {"entry": dict(entry)}
+
+    async def _search(self, request: dict) -> dict:
+        self._store()
+        text = request.get("query", "")
+        category_id = request.get("category", "all")
+        if not isinstance(text, str) or not isinstance(category_id, str):
+            raise RequestError("bad_request", "query and category must be strings")
+        limit = _limit(request)
+        rows = await self._query(text, category_id)
+        return {"total": len(rows), "entries": [_summary(e) for e in rows[:limit]]}
+
+    async def _query(self, text: str, category_id: str) -> list[dict]:
+        """
+        Rows of a core.query query; repeats are answered from
+        RESULT_CACHE while the store and usage counters are unchanged.
+        """
+        key = (text, category_id, self.index.store.version, self.frecency.version)
+        rows = self._results.get(key)
+        if rows is not None:
+            self._results.move_to_end(key)
+            return rows
+        if not self.index.is_built:
+            await asyncio.get_running_loop().run_in_executor(None, self.index.prepare)
+        rows = query.execute(
+            query.parse(text),
+            self.index,
+            category_id,
+            categories=self.session.vault.get("categories", []),
+            is_weak=self.is_weak,
+            frecency=self.frecency,
+            weak_verdicts=self._weak_verdicts,
+        )
+        self._results[key] = rows
+        if len(self._results) > RESULT_CACHE:
+            self._results.popitem(last=False)
+        return rows
+
+    async def _list(self, request: dict) -> dict:
+        store = self._store()
+        category_id = request.get("category", "all")
+        offset = request.get("offset", 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise RequestError("bad_request", "offset must be a non-negative integer")
+        limit = _limit(request)
+        rows = store if category_id == "all" else store.in_category(category_id)
+        return {
+            "total": len(rows),
+            "entries": [_summary(e) for e in rows[offset:offset + limit]],
+        }
+
+    async def _categories(self, request: dict) -> dict:
+        self._store()
+        return {"categories": self.session.vault.get("categories", [])}
+
+    async def _add(self, request: dict) -> dict:
+        store = self._store()
+        if self.session.read_only:
+            raise RequestError("read_only", "the vault is open for writing in another process")
+        fields = request.get("entry")
+        if not isinstance(fields, dict):
+            raise RequestError("bad_request", "entry must be an object")
+        unknown = set(fields) - set(ENTRY_FIELDS)
+        if unknown:
+            raise RequestError("bad_request", f"unknown fields: {', '.join(sorted(unknown))}")
+        if not all(isinstance(v, str) for v in fields.values()):
+            raise RequestError("bad_request", "entry fields must be strings")
+
+        now = time.time()
+        entry = {
+            "id": os.urandom(8).hex(),
+            "service": "",
+            "login": "",
+            "password": "",
+            "url": "",
+            "note": "",
+            "category_id": "all",
+            **fields,
+            "created_at": now,
+            "updated_at": now,
+        }
+        changes = store.add(entry)
+        self.index.changed([entry["id"]])
+        self.session.mark_dirty(changes)
+        # Scripts take the answer as saved
+        saver = self.session.saver
+        if not await asyncio.get_running_loop().run_in_executor(None, saver.flush):
+            raise RequestError("save_failed", saver.state().error or "")
+        return {"entry": entry["id"]}
+
+    # =========================
+    # Helpers
+    # =========================
+
+    async def _opened(self) -> None:
+        vault = self.session.vault
+        self.session.on_lock = self._locked
+        self.frecency = Frecency(vault)
+        self.index = SearchIndex.for_vault(vault)
+        # Restored or built now, so the first search is as fast as the rest
+        await asyncio.get_running_loop().run_in_executor(None, self.index.prepare)
+
+    def _store(self):
+        if not self.session.is_unlocked:
+            raise RequestError("locked")
+        return self.session.vault["entries"]
+
+    def _locked(self, reason: str) -> None:
+        self.index = None
+        self.frecency = None
+        self._results.clear()
+        self._weak_verdicts.clear()
+
+    def _close(self) -> bool:
+        return self.session.lock(reason="closed")
+
+
+def _limit(request: dict) -> int:
+    limit = request.get("limit", DEFAULT_LIMIT)
+    if not isinstance(limit, int) or not 0 < limit <= MAX_LIMIT:
+        raise RequestError("bad_request", f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def _summary(entry: dict) -> dict:
+    return dict(zip(INDEX_FIELDS, peek_fields(entry, INDEX_FIELDS)))
+
+
+def _line(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _same_user(sock: socket.socket | None) -> bool:
+    """
+    Peer runs as our user. Where the OS can't tell (no SO_PEERCRED),
+    the socket's permissions are the only check.
+    """
+    if sock is None or not hasattr(socket, "SO_PEERCRED"):
+        return True
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid == os.getuid()
+
+
+def _is_live(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+# =====================
+# Client
+# =====================
+
+
+class AgentClient:
+    """
+    Blocking client for scripts: one connection, one request at a time.
+    """
+
+    def __init__(self, socket_path: str | None = None, timeout: float | None = 30.0):
+        self.socket_path = socket_path or default_socket_path()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(self.socket_path)
+        self._file = self._sock.makefile("rwb")
+        self._next_id = 0
+
+    def request(self, action: str, **params) -> dict:
+        """
+        Result fields of the response; RequestError if it failed.
+        """
+        self._next_id += 1
+        self._file.write(_line({"id": self._next_id, "action": action, **params}))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Agent closed the connection")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise RequestError(response.get("error", "internal"), response.get("message", ""))
+        for key in ("id", "ok"):
+            response.pop(key, None)
+        return response
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self) -> AgentClient:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import json
+import struct
+from functools import lru_cache
+from typing import Any
+
+# =====================
+# Payload codecs
+# =====================
+#
+# How records, the index and journal frames are turned into bytes
+# before compression and encryption. The codec is recorded in the
+# plaintext header as {"codec": {...}}; files without it use JSON.
+#
+# json    - json.dumps / json.loads, the original format
+# compact - binary, see CompactCodec
+#
+# JSON stays the default. Compact output is about a third smaller and
+# its index decodes faster, but records decode at about the speed of
+# json.loads (C) and encode at less than half of json.dumps
+# (benchmarks/bench_codec): it pays off for size, not for speed.
+
+CODEC_JSON = "json"
+CODEC_COMPACT = "compact"
+
+CODECS = (CODEC_JSON, CODEC_COMPACT)
+
+# Entry fields in record order (core.models.Entry)
+RECORD_SCHEMA = (
+    "id",
+    "service",
+    "login",
+    "password",
+    "url",
+    "category_id",
+    "note",
+    "created_at",
+    "updated_at",
+)
+
+
+class JsonCodec:
+    name = CODEC_JSON
+
+    def to_header(self) -> dict:
+        return {"name": self.name}
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data.decode("utf-8"))
+
+    # Records are plain values in JSON
+    encode_record = encode
+    decode_record = decode
+
+
+# =====================
+# Compact codec
+# =====================
+#
+# u32 string count | u32[count] string lengths (characters)
+# u32 text size | UTF-8 text of all strings | value
+#
+# Every distinct string is stored once; values refer to it by index.
+# Lists of same-shaped dicts (categories) or same-length lists (index
+# rows) are stored as tables: keys once, then one typed column per key,
+# so a column of strings or numbers decodes with a single unpack.
+# Records use the header's schema: values in schema order, no keys.
+
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+_NONE = b"N"
+_TRUE = b"T"
+_FALSE = b"F"
+_INT = b"i"
+_FLOAT = b"f"
+_STR = b"s"
+_LIST = b"l"
+_DICT = b"d"
+_TABLE = b"t"       # list of dicts with the same keys
+_ROWS = b"r"        # list of lists with the same length
+_RECORD = b"e"      # dict laid out by the record schema
+_MISSING = b"M"     # schema field the record doesn't have
+_COLUMN = b"v"      # column of mixed values
+
+_INT_MIN = -(2 ** 63)
+_INT_MAX = 2 ** 63 - 1
+
+# Tags as byte values, for reading them straight out of the data
+_STR_TAG = _STR[0]
+_FLOAT_TAG = _FLOAT[0]
+_MISSING_TAG = _MISSING[0]
+_RECORD_TAG = _RECORD[0]
+_NO_EXTRA = _DICT + _U32.pack(0)
+
+
+@lru_cache(maxsize=256)
+def _array(fmt: str, count: int) -> struct.Struct:
+    """
+    Compiled struct for `count` values of `fmt`; records repeat the
+    same few string counts, so each is built once.
+    """
+    return struct.Struct(f"<{count}{fmt}")
+
+
+class _Writer:
+    def __init__(self):
+        self.out = bytearray()
+        self.strings: dict[str, int] = {}
+
+    def ref(self, s: str) -> int:
+        i = self.strings.get(s)
+        if i is None:
+            i = self.strings[s] = len(self.strings)
+        return i
+
+    def finish(self) -> bytes:
+        strings = list(self.strings)
+        text = "".join(strings).encode("utf-8", "surrogatepass")
+        return b"".join((
+            _U32.pack(len(strings)),
+            _array("I", len(strings)).pack(*map(len, strings)),
+            _U32.pack(len(text)),
+            text,
+            self.out,
+        ))
+
+
+def _read_strings(data: bytes) -> tuple[list[str], int]:
+    """
+    String table of an encoded value, and where the value starts.
+    """
+    (count,) = _U32.unpack_from(data, 0)
+    lengths = _array("I", count).unpack_from(data, 4)
+    pos = 4 + 4 * count
+    (size,) = _U32.unpack_from(data, pos)
+    pos += 4
+    text = str(data[pos:pos + size], "utf-8", "surrogatepass")
+
+    strings = []
+    append = strings.append
+    start = 0
+    for length in lengths:
+        end = start + length
+        append(text[start:end])
+        start = end
+    return strings, pos + size
+
+
+class _Reader:
+    def __init__(self, data: bytes, strings: list[str] | None = None, pos: int = 0):
+        self.data = data
+        if strings is None:
+            strings, pos = _read_strings(data)
+        self.strings = strings
+        self.pos = pos
+
+    def tag(self) -> bytes:
+        tag = self.data[self.pos:self.pos + 1]
+        self.pos += 1
+        return bytes(tag)
+
+    def u32(self) -> int:
+        (value,) = _U32.unpack_from(self.data, self.pos)
+        self.pos += 4
+        return value
+
+    def unpack(self, fmt: str, count: int) -> tuple:
+        compiled = _array(fmt, count)
+        values = compiled.unpack_from(self.data, self.pos)
+        self.pos += compiled.size
+        return values
+
+
+class CompactCodec:
+    name = CODEC_COMPACT
+
+    def __init__(self, schema: tuple[str, ...] | list[str] = RECORD_SCHEMA):
+        self.schema = tuple(schema)
+
+    def to_header(self) -> dict:
+        return {"name": self.name, "schema": list(self.schema)}
+
+    # ---- API ----
+
+    def encode(self, value: Any) -> bytes:
+        w = _Writer()
+        self._value(w, value)
+        return w.finish()
+
+    def decode(self, data: bytes) -> Any:
+        r = _Reader(data)
+        return self._read(r)
+
+    def encode_record(self, entry: dict) -> bytes:
+        w = _Writer()
+        w.out += _RECORD
+        for field in self.schema:
+            if field in entry:
+                self._value(w, entry[field])
+            else:
+                w.out += _MISSING
+        extra = {k: v for k, v in entry.items() if k not in self.schema}
+        self._value(w, extra)
+        return w.finish()
+
+    def decode_record(self, data: bytes) -> dict:
+        # Hot path of loading entries: string and float fields (nearly
+        # all of them) are read inline, anything else through _read
+        strings, pos = _read_strings(data)
+        if data[pos] != _RECORD_TAG:
+            raise ValueError("Not a compact record")
+        pos += 1
+        u32, f64 = _U32.unpack_from, _F64.unpack_from
+        entry = {}
+        for field in self.schema:
+            tag = data[pos]
+            if tag == _STR_TAG:
+                entry[field] = strings[u32(data, pos + 1)[0]]
+                pos += 5
+            elif tag == _FLOAT_TAG:
+                entry[field] = f64(data, pos + 1)[0]
+                pos += 9
+            elif tag == _MISSING_TAG:
+                pos += 1
+            else:
+                r = _Reader(data, strings, pos)
+                entry[field] = self._read(r)
+                pos = r.pos
+        if data[pos:pos + 5] != _NO_EXTRA:
+            entry.update(self._read(_Reader(data, strings, pos)))
+        return entry
+
+    # ---- encoding ----
+
+    def _value(self, w: _Writer, value: Any) -> None:
+        out = w.out
+        if value is None:
+            out += _NONE
+        elif value is True:
+            out += _TRUE
+        elif value is False:
+            out += _FALSE
+        elif isinstance(value, int):
+            if not _INT_MIN <= value <= _INT_MAX:
+                raise ValueError("Integer out of range for compact codec")
+            out += _INT + _I64.pack(value)
+        elif isinstance(value, float):
+            out += _FLOAT + _F64.pack(value)
+        elif isinstance(value, str):
+            out += _STR + _U32.pack(w.ref(value))
+        elif isinstance(value, dict):
+            out += _DICT + _U32.pack(len(value))
+            for k, v in value.items():
+                out += _U32.pack(w.ref(str(k)))
+                self._value(w, v)
+        elif isinstance(value, (list, tuple)):
+            self._sequence(w, value)
+        else:
+            raise TypeError(f"Cannot encode {type(value).__name__}")
+
+    def _sequence(self, w: _Writer, items) -> None:
+        out = w.out
+
+        if len(items) >= 2 and all(type(i) is dict for i in items):
+            keys = tuple(items[0])
+            if all(tuple(i) == keys for i in items):
+                out += _TABLE + _U32.pack(len(keys)) + _U32.pack(len(items))
+                for k in keys:
+                    out += _U32.pack(w.ref(str(k)))
+                for k in keys:
+                    self._column(w, [i[k] for i in items])
+                return
+
+        if len(items) >= 2 and all(type(i) in (list, tuple) for i in items):
+            width = len(items[0])
+            if all(len(i) == width for i in items):
+                out += _ROWS + _U32.pack(width) + _U32.pack(len(items))
+                for col in range(width):
+                    self._column(w, [i[col] for i in items])
+                return
+
+        out += _LIST + _U32.pack(len(items))
+        for item in items:
+            self._value(w, item)
+
+    def _column(self, w: _Writer, values: list) -> None:
+        out = w.out
+        n = len(values)
+        types = {type(v) for v in values}
+
+        if types == {str}:
+            out += _STR + struct.pack(f"<{n}I", *map(w.ref, values))
+        elif types == {int} and all(_INT_MIN <= v <= _INT_MAX for v in values):
+            out += _INT + struct.pack(f"<{n}q", *values)
+        elif types == {float}:
+            out += _FLOAT + struct.pack(f"<{n}d", *values)
+        else:
+            out += _COLUMN
+            for v in values:
+                self._value(w, v)
+
+    # ---- decoding ----
+
+    def _read(self, r: _Reader) -> Any:
+        tag = r.tag()
+
+        if tag == _STR:
+            return r.strings[r.u32()]
+        if tag == _INT:
+            return r.unpack("q", 1)[0]
+        if tag == _FLOAT:
+            return r.unpack("d", 1)[0]
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+
+        if tag == _DICT:
+            n = r.u32()
+            value = {}
+            for _ in range(n):
+                key = r.strings[r.u32()]
+                value[key] = self._read(r)
+            return value
+
+        if tag == _LIST:
+            n = r.u32()
+            return [self._read(r) for _ in range(n)]
+
+        if tag == _TABLE:
+            width, n = r.u32(), r.u32()
+            keys = [r.strings[i] for i in r.unpack("I", width)]
+            columns = [self._read_column(r, n) for _ in range(width)]
+            return [dict(zip(keys, row)) for row in zip(*columns)]
+
+        if tag == _ROWS:
+            width, n = r.u32(), r.u32()
+            columns = [self._read_column(r, n) for _ in range(width)]
+            return [list(row) for row in zip(*columns)]
+
+        raise ValueError(f"Unknown compact codec tag: {tag!r}")
+
+    def _read_column(self, r: _Reader, n: int) -> list:
+        tag = r.tag()
+        if tag == _STR:
+            strings = r.strings
+            return [strings[i] for i in r.unpack("I", n)]
+        if tag == _INT:
+            return list(r.unpack("q", n))
+        if tag == _FLOAT:
+            return list(r.unpack("d", n))
+        if tag == _COLUMN:
+            return [self._read(r) for _ in range(n)]
+        raise ValueError(f"Unknown compact column tag: {tag!r}")
+
+
+# =====================
+# Selection
+# =====================
+
+def from_header(data: dict | None) -> JsonCodec | CompactCodec:
+    """
+    Codec of a file; None (no "codec" field) means JSON.
+    """
+    if data is None or data.get("name") == CODEC_JSON:
+        return JsonCodec()
+    if data.get("name") == CODEC_COMPACT:
+        return CompactCodec(data.get("schema", RECORD_SCHEMA))
+    raise ValueError(f"Unsupported vault codec: {data.get('name')!r}")
+
+
+def make_codec(name: str) -> JsonCodec | CompactCodec:
+    if name == CODEC_JSON:
+        return JsonCodec()
+    if name == CODEC_COMPACT:
+        return CompactCodec()
+    raise ValueError(f"Unknown vault codec: {name!r}")
+
+
+CODEC = JsonCodec()
+
+
+def set_codec(name: str) -> None:
+    """
+    Codec for vaults written from now on.
+    """
+    global CODEC
+    CODEC = make_codec(name)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import lzma
+import time
+import zlib
+from dataclasses import dataclass
+
+# =====================
+# Payload compression
+# =====================
+#
+# Vault blobs are compressed before they are encrypted. Files written
+# with compression carry {"compression": {...}} in the header; every
+# blob then starts with a one-byte marker, so blobs written with other
+# settings (copied records, older journal frames) still decode:
+#
+#   0x00 stored | 0x01 zlib | 0x02 lzma
+#
+# Files without the header field have no markers at all.
+
+COMPRESS_NONE = "none"
+COMPRESS_ZLIB = "zlib"
+COMPRESS_LZMA = "lzma"   # smaller index, but slow on many short records
+
+COMPRESSORS = (COMPRESS_NONE, COMPRESS_ZLIB, COMPRESS_LZMA)
+
+DEFAULT_LEVEL = 6   # zlib 0-9, lzma presets 0-9
+
+_MARK_STORED = 0
+_MARK_ZLIB = 1
+_MARK_LZMA = 2
+
+
+@dataclass(frozen=True, slots=True)
+class Compression:
+    name: str = COMPRESS_ZLIB
+    level: int = DEFAULT_LEVEL
+
+    def __post_init__(self):
+        if self.name not in COMPRESSORS:
+            raise ValueError(f"Unknown compression: {self.name!r}")
+        if not 0 <= self.level <= 9:
+            raise ValueError(f"Invalid compression level: {self.level}")
+
+    def to_header(self) -> dict:
+        return {"name": self.name, "level": self.level}
+
+    @staticmethod
+    def from_header(data: dict) -> "Compression":
+        return Compression(data["name"], int(data["level"]))
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Marker + payload. Falls back to stored when compression
+        doesn't pay off (short records).
+        """
+        if self.name == COMPRESS_ZLIB:
+            packed = bytes((_MARK_ZLIB,)) + zlib.compress(data, self.level)
+        elif self.name == COMPRESS_LZMA:
+            packed = bytes((_MARK_LZMA,)) + lzma.compress(data, preset=self.level)
+        else:
+            packed = None
+
+        if packed is None or len(packed) > len(data):
+            return bytes((_MARK_STORED,)) + data
+        return packed
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    Inverse of Compression.compress, whatever settings wrote `data`.
+    """
+    if not data:
+        raise ValueError("Empty compressed blob")
+
+    mark = data[0]
+    try:
+        if mark == _MARK_STORED:
+            return data[1:]
+        if mark == _MARK_ZLIB:
+            return zlib.decompress(data[1:])
+        if mark == _MARK_LZMA:
+            return lzma.decompress(data[1:])
+    except (zlib.error, lzma.LZMAError):
+        raise ValueError("Corrupted compressed blob")
+
+    raise ValueError(f"Unknown compression marker: {mark}")
+
+
+# =====================
+# Statistics
+# =====================
+
+@dataclass(slots=True)
+class CompressionStats:
+    name: str
+    level: int
+    raw_bytes: int = 0
+    packed_bytes: int = 0
+    compress_ms: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """
+        Packed / raw size; lower is better.
+        """
+        if not self.raw_bytes:
+            return 1.0
+        return self.packed_bytes / self.raw_bytes
+
+    def add(self, other: "CompressionStats") -> None:
+        self.raw_bytes += other.raw_bytes
+        self.packed_bytes += other.packed_bytes
+        self.compress_ms += other.compress_ms
+
+
+class Compressor:
+    """
+    Compression.compress with statistics over many blobs.
+    """
+
+    def __init__(self, settings: Compression):
+        self.settings = settings
+        self.stats = CompressionStats(settings.name, settings.level)
+
+    def compress(self, data: bytes) -> bytes:
+        start = time.perf_counter()
+        packed = self.settings.compress(data)
+        self.stats.compress_ms += (time.perf_counter() - start) * 1000
+        self.stats.raw_bytes += len(data)
+        self.stats.packed_bytes += len(packed)
+        return packed
+
+
+# =====================
+# Policy
+# =====================
+
+COMPRESSION = Compression()
+
+
+def set_compression(name: str, level: int = DEFAULT_LEVEL) -> None:
+    """
+    Compression for vaults written from now on. Existing files keep
+    theirs until their next full save.
+    """
+    global COMPRESSION
+    COMPRESSION = Compression(name, level)
@@ -1,11 +1,163 @@
 import base64
 import hashlib
-from cryptography.fernet import Fernet
+import math
+import os
+import time
+from dataclasses import dataclass
 
-def derive_key(master_password: str) -> bytes:
-    hash_bytes = hashlib.sha256(master_password.encode()).digest()
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+# =====================
+# Key derivation
+# =====================
+
+KDF_LEGACY = "sha256"   # unsalted, v1 vaults only
+KDF_SCRYPT = "scrypt"
+
+SALT_SIZE = 16
+
+# Calibration bounds: scrypt needs 128 * n * r bytes of memory
+DEFAULT_UNLOCK_MS = 500
+MIN_SCRYPT_N = 2 ** 14
+MAX_SCRYPT_N = 2 ** 17
+
+
+@dataclass(frozen=True, slots=True)
+class KdfParams:
+    salt: bytes
+    n: int = MIN_SCRYPT_N
+    r: int = 8
+    p: int = 1
+
+    def to_header(self) -> dict:
+        return {
+            "name": KDF_SCRYPT,
+            "salt": base64.b64encode(self.salt).decode("ascii"),
+            "n": self.n,
+            "r": self.r,
+            "p": self.p,
+        }
+
+    @staticmethod
+    def from_header(data: dict) -> "KdfParams":
+        if data.get("name") != KDF_SCRYPT:
+            raise ValueError(f"Unsupported key derivation: {data.get('name')!r}")
+        return KdfParams(
+            salt=base64.b64decode(data["salt"]),
+            n=int(data["n"]),
+            r=int(data["r"]),
+            p=int(data["p"]),
+        )
+
+
+def derive_key(master_password: str, params: KdfParams | None = None) -> bytes:
+    """
+    Fernet key for `master_password`.
+    Without params this is the legacy unsalted SHA-256 of v1 vaults.
+    """
+    if params is None:
+        hash_bytes = hashlib.sha256(master_password.encode()).digest()
+    else:
+        hash_bytes = hashlib.scrypt(
+            master_password.encode(),
+            salt=params.salt,
+            n=params.n,
+            r=params.r,
+            p=params.p,
+            maxmem=_scrypt_memory(params.n, params.r) + 1024 * 1024,
+            dklen=32,
+        )
     return base64.urlsafe_b64encode(hash_bytes)
 
+
+def calibrate_kdf(target_ms: int = DEFAULT_UNLOCK_MS, r: int = 8) -> KdfParams:
+    """
+    Pick scrypt cost so one derivation takes about `target_ms` here.
+    Memory cost (n) grows first; past MAX_SCRYPT_N the rest goes to p.
+    """
+    probe = KdfParams(salt=os.urandom(SALT_SIZE), n=MIN_SCRYPT_N, r=r)
+
+    start = time.perf_counter()
+    derive_key("calibration", probe)
+    elapsed_ms = max((time.perf_counter() - start) * 1000, 0.1)
+
+    scale = target_ms / elapsed_ms
+    n = MIN_SCRYPT_N
+    while n < MAX_SCRYPT_N and scale >= 2:
+        n *= 2
+        scale /= 2
+
+    p = max(1, math.floor(scale)) if n == MAX_SCRYPT_N else 1
+
+    return KdfParams(salt=os.urandom(SALT_SIZE), n=n, r=r, p=p)
+
+
+def _scrypt_memory(n: int, r: int) -> int:
+    return 128 * n * r
+
+
+# =====================
+# Payload ciphers
+# =====================
+#
+# fernet            - base64 token (AES-CBC + HMAC), v1 and early v2 vaults
+# aes-256-gcm       - nonce | ciphertext | tag, raw binary
+# chacha20-poly1305 - same layout, faster without AES-NI
+
+CIPHER_FERNET = "fernet"
+CIPHER_AES_GCM = "aes-256-gcm"
+CIPHER_CHACHA = "chacha20-poly1305"
+
+CIPHERS = (CIPHER_FERNET, CIPHER_AES_GCM, CIPHER_CHACHA)
+DEFAULT_CIPHER = CIPHER_AES_GCM
+
+NONCE_SIZE = 12
+
+
+class PayloadCipher:
+    """
+    Encrypts vault blobs with the data key.
+    decrypt() takes bytes or a memoryview (e.g. a slice of an mmap),
+    so AEAD payloads are never copied before decryption.
+    Raises ValueError on a wrong key or tampered data.
+    """
+
+    def __init__(self, name: str, key: bytes):
+        if name not in CIPHERS:
+            raise ValueError(f"Unsupported vault cipher: {name!r}")
+
+        self.name = name
+        if name == CIPHER_FERNET:
+            self._fernet = Fernet(key)
+            self._aead = None
+        else:
+            raw = base64.urlsafe_b64decode(key)
+            self._fernet = None
+            self._aead = AESGCM(raw) if name == CIPHER_AES_GCM else ChaCha20Poly1305(raw)
+
+    def encrypt(self, data: bytes, aad: bytes = b"") -> bytes:
+        if self._fernet is not None:
+            return self._fernet.encrypt(data)
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, data, aad)
+
+    def decrypt(self, data: bytes | memoryview, aad: bytes = b"") -> bytes:
+        try:
+            if self._fernet is not None:
+                return self._fernet.decrypt(bytes(data))
+            with memoryview(data) as view, \
+                    view[:NONCE_SIZE] as nonce, view[NONCE_SIZE:] as body:
+                return self._aead.decrypt(nonce, body, aad)
+        except (InvalidToken, InvalidTag):
+            raise ValueError("Invalid key or corrupted data")
+
+
+# =====================
+# Simple helpers
+# =====================
+
 def encrypt(data: bytes, password: str) -> bytes:
     return Fernet(derive_key(password)).encrypt(data)
 
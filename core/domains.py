@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import bisect
+import heapq
+import ipaddress
+import math
+from functools import lru_cache
+from operator import itemgetter
+from typing import TYPE_CHECKING, Iterable
+from urllib.parse import urlsplit
+
+from core.records import peek_fields
+
+if TYPE_CHECKING:
+    from core.frecency import Frecency
+
+# =====================
+# Hostnames
+# =====================
+#
+# Entries are matched to a URL by host, compared label by label from
+# the right: "login.example.co.uk" is the path uk -> co -> example ->
+# login. The site of a host is its registrable domain, one label more
+# than its public suffix (core.public_suffix): "example.co.uk", not
+# "co.uk". Entries of one site may share passwords; entries of two
+# sites never match each other.
+
+
+def host_of(url: str | None) -> str:
+    """
+    Normalized host of `url`: lowercase, ASCII (punycode), without
+    port, trailing dot or "www."; "" if there is none.
+    """
+    if not url:
+        return ""
+    url = url.strip()
+    if "://" not in url:
+        url = "//" + url
+    try:
+        host = urlsplit(url).hostname or ""
+    except ValueError:
+        return ""
+    host = host.rstrip(".").lower()
+    if not host.isascii():
+        try:
+            host = host.encode("idna").decode("ascii")
+        except UnicodeError:
+            pass
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+def domain_of(url: str | None) -> str:
+    """
+    Lowercase host of `url` without "www.", "" if there is none or
+    it can't be parsed (e.g. "http://[bad"). Plainer than host_of and
+    kept that way: search keys (core.search) use it, and SQLite vaults
+    store keyed MACs of it (core.sqlite_vault).
+    """
+    if not url:
+        return ""
+    if "://" not in url:
+        url = "//" + url
+    try:
+        host = (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+def _is_ip(host: str) -> bool:
+    if not host or not (host[-1].isdigit() or ":" in host):
+        return False
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def _labels(host: str) -> list[str]:
+    """
+    Labels of a normalized host, rightmost first. An IP address is
+    one label.
+    """
+    if _is_ip(host):
+        return [host]
+    return [label for label in reversed(host.split(".")) if label]
+
+
+@lru_cache(maxsize=None)
+def _suffix_rules() -> tuple[frozenset[str], frozenset[str]]:
+    # Parsed on first use: most sessions never match a URL
+    from core.public_suffix import RULES
+
+    rules, exceptions = set(), set()
+    for line in RULES.splitlines():
+        for rule in line.split("//", 1)[0].split():
+            if rule.startswith("!"):
+                exceptions.add(rule[1:])
+            else:
+                rules.add(rule)
+    return frozenset(rules), frozenset(exceptions)
+
+
+def _suffix_length(labels: list[str]) -> int:
+    """
+    Number of labels of the public suffix, for labels rightmost first.
+    Public Suffix List rules: an exception wins, then the longest rule;
+    a single label is a suffix by default.
+    """
+    rules, exceptions = _suffix_rules()
+    for i in range(len(labels), 1, -1):
+        name = ".".join(reversed(labels[:i]))
+        if name in exceptions:
+            return i - 1
+        if name in rules or "*" + name[name.index("."):] in rules:
+            return i
+    return 1
+
+
+def public_suffix(host: str) -> str:
+    labels = _labels(host)
+    if len(labels) <= 1:
+        return host
+    return ".".join(reversed(labels[:_suffix_length(labels)]))
+
+
+def registrable_domain(host: str) -> str:
+    """
+    Site of a normalized host: "example.co.uk" for
+    "login.example.co.uk"; "" if the host is itself a public suffix.
+    An IP address is its own site.
+    """
+    labels = _labels(host)
+    if len(labels) == 1:
+        return host if _is_ip(host) else ""
+    length = _suffix_length(labels)
+    if len(labels) <= length:
+        return ""
+    return ".".join(reversed(labels[:length + 1]))
+
+
+def site_of(host: str) -> str:
+    """
+    Registrable domain, or the host itself when it has none, for
+    grouping entries by site.
+    """
+    return registrable_domain(host) or host
+
+
+@lru_cache(maxsize=65536)
+def _split(host: str) -> tuple[tuple[str, ...], str]:
+    # Vaults hold many entries per host: (labels, site) computed once
+    return tuple(_labels(host)), site_of(host)
+
+
+# =====================
+# Domain index
+# =====================
+
+
+class _Node:
+    __slots__ = ("children", "seqs")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.seqs: list[int] = []   # entries with this host, in vault order
+
+
+class DomainIndex:
+    """
+    Entries of an EntryStore by host, in a trie of reversed labels,
+    built on the first lookup and kept up to date through changed()
+    like core.search.SearchIndex. A lookup walks the branch of one
+    site, so its cost depends on the hosts of that site, not on the
+    size of the vault.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._version = None
+        self._root = _Node()
+        self._hosts: dict[str, str] = {}              # entry id -> host
+        self._sites: dict[str, dict[str, None]] = {}  # site -> entry ids
+        self._seqs: dict[str, int] = {}               # entry id -> vault order
+        self._ids: dict[int, str] = {}
+        self._next_seq = 0
+
+    @property
+    def is_built(self) -> bool:
+        return self._version == self.store.version
+
+    # =========================
+    # Maintenance
+    # =========================
+
+    def build(self) -> None:
+        self._version = None
+        self._root = _Node()
+        self._hosts = {}
+        self._sites = {}
+        self._seqs = {}
+        self._ids = {}
+        self._next_seq = 0
+        version = self.store.version
+        for entry in self.store:
+            self._add(entry)
+        self._version = version
+
+    def changed(self, ids: Iterable[str]) -> None:
+        """
+        Re-index entries that were added, edited or removed by the
+        latest store mutation. Call once per mutation.
+        """
+        if self._version is None:
+            return
+        if self.store.version not in (self._version, self._version + 1):
+            self._version = None   # missed a change: rebuild on next lookup
+            return
+        for entry_id in ids:
+            seq = self._remove(entry_id)
+            entry = self.store.get(entry_id)
+            if entry is not None:
+                self._add(entry, seq=seq)
+        self._version = self.store.version
+
+    def prepare(self) -> None:
+        if not self.is_built:
+            self.build()
+
+    # =========================
+    # Lookups
+    # =========================
+
+    def match(
+        self,
+        url: str,
+        limit: int | None = None,
+        frecency: Frecency | None = None,
+    ) -> list[dict]:
+        """
+        Entries of the site of `url`, best first:
+
+            1. same host
+            2. a parent domain of it (nearest first)
+            3. a subdomain of it
+            4. any other host of the site (nearest branch first)
+
+        Within a group by use (core.frecency) if given, then in vault
+        order. A bare public suffix ("co.uk") only matches itself.
+        """
+        host = host_of(url)
+        if not host:
+            return []
+        self.prepare()
+
+        labels = _labels(host)
+        site = registrable_domain(host)
+        site_depth = len(_labels(site)) if site else len(labels)
+        hot = self._hot(site_of(host), labels, frecency)
+        skip = {self._seqs[i] for ids in hot.values() for i in ids}
+
+        found: list[str] = []
+        for group, nodes in self._groups(labels, site_depth, below=bool(site)):
+            if limit is not None and len(found) >= limit:
+                break
+            found += hot.get(group, ())
+            runs = [node.seqs for node in nodes if node.seqs]
+            if limit is not None:
+                # Each node keeps its entries in vault order, so the
+                # first `wanted` of the group are in the `wanted` runs
+                # that start first
+                wanted = limit - len(found) + len(skip)
+                if wanted < len(runs):
+                    runs = heapq.nsmallest(wanted, runs, key=itemgetter(0))
+                runs = [run[:wanted] for run in runs]
+            for seq in heapq.merge(*runs):
+                if limit is not None and len(found) >= limit:
+                    break
+                if seq not in skip:
+                    found.append(self._ids[seq])
+        if limit is not None:
+            del found[limit:]
+        get = self.store.get
+        return [get(entry_id) for entry_id in found]
+
+    def sites(self) -> list[tuple[str, int]]:
+        """
+        (site, entry count) for every site with entries, by name.
+        """
+        self.prepare()
+        return sorted((site, len(ids)) for site, ids in self._sites.items())
+
+    def in_site(self, site: str) -> list[dict]:
+        self.prepare()
+        ids = self._sites.get(site, ())
+        get = self.store.get
+        return [get(i) for i in sorted(ids, key=self._seqs.__getitem__)]
+
+    def host(self, entry_id: str) -> str:
+        self.prepare()
+        return self._hosts.get(entry_id, "")
+
+    # =========================
+    # Helpers
+    # =========================
+
+    def _groups(self, labels: list[str], site_depth: int, below: bool):
+        """
+        (group, trie nodes) in rank order, see match(). Lazy: a lookup
+        that is done after the first groups never walks the others.
+        """
+        path = [self._root]
+        for label in labels:
+            node = path[-1].children.get(label)
+            if node is None:
+                break
+            path.append(node)
+        depth = len(path) - 1
+        exact = depth == len(labels)
+        top = min(depth, len(labels) - 1)
+
+        if exact:
+            yield (0, 0), [path[-1]]
+        for d in range(top, site_depth - 1, -1):
+            yield (1, -d), [path[d]]
+        if not below:
+            return
+        if exact:
+            yield (2, 0), self._below(path[-1])
+        for d in range(top, site_depth - 1, -1):
+            yield (3, -d), self._below(path[d], skip=path[d + 1] if d < depth else None)
+
+    @staticmethod
+    def _group(host_labels: tuple[str, ...], labels: list[str]) -> tuple[int, int]:
+        shared = 0
+        for a, b in zip(host_labels, labels):
+            if a != b:
+                break
+            shared += 1
+        if shared == len(host_labels) == len(labels):
+            return 0, 0
+        if shared == len(host_labels):
+            return 1, -shared
+        if shared == len(labels):
+            return 2, 0
+        return 3, -shared
+
+    def _hot(self, site: str, labels: list[str], frecency: Frecency | None) -> dict:
+        """
+        Used entries of the site by group, most used first. Found from
+        whichever is smaller, the site or the usage counters.
+        """
+        if frecency is None:
+            return {}
+        ids = self._sites.get(site)
+        if not ids:
+            return {}
+        used = frecency.usage
+        if len(used) < len(ids):
+            candidates = [i for i in list(used) if i in ids]
+        else:
+            candidates = [i for i in ids if i in used]
+        seqs = self._seqs
+        candidates.sort(key=lambda i: (-frecency.key(i), seqs[i]))
+
+        hot: dict[tuple[int, int], list[str]] = {}
+        for entry_id in candidates:
+            if frecency.key(entry_id) == -math.inf:
+                continue
+            group = self._group(_split(self._hosts[entry_id])[0], labels)
+            hot.setdefault(group, []).append(entry_id)
+        return hot
+
+    @staticmethod
+    def _below(node: _Node, skip: _Node | None = None) -> list[_Node]:
+        """
+        Nodes under `node`, not itself, leaving out the `skip` branch.
+        """
+        found: list[_Node] = []
+        stack = [child for child in node.children.values() if child is not skip]
+        while stack:
+            node = stack.pop()
+            found.append(node)
+            stack += node.children.values()
+        return found
+
+    def _add(self, entry: dict, seq: int | None = None) -> None:
+        entry_id = entry["id"]
+        if seq is None:
+            seq = self._next_seq
+            self._next_seq += 1
+        self._seqs[entry_id] = seq
+        self._ids[seq] = entry_id
+
+        host = host_of(peek_fields(entry, ("url",))[0])
+        if not host:
+            return
+        self._hosts[entry_id] = host
+        labels, site = _split(host)
+        node = self._root
+        for label in labels:
+            node = node.children.setdefault(label, _Node())
+        if not node.seqs or node.seqs[-1] < seq:
+            node.seqs.append(seq)
+        else:
+            bisect.insort(node.seqs, seq)
+        self._sites.setdefault(site, {})[entry_id] = None
+
+    def _remove(self, entry_id: str) -> int | None:
+        seq = self._seqs.pop(entry_id, None)
+        if seq is not None:
+            del self._ids[seq]
+        host = self._hosts.pop(entry_id, None)
+        if host is None:
+            return seq
+
+        labels, site = _split(host)
+        ids = self._sites[site]
+        del ids[entry_id]
+        if not ids:
+            del self._sites[site]
+
+        path = [self._root]
+        for label in labels:
+            path.append(path[-1].children[label])
+        seqs = path[-1].seqs
+        del seqs[bisect.bisect_left(seqs, seq)]
+        # Prune the branch back to the last node still in use
+        for d in range(len(labels), 0, -1):
+            node = path[d]
+            if node.seqs or node.children:
+                break
+            del path[d - 1].children[labels[d - 1]]
+        return seq
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+from collections.abc import MutableSequence
+from typing import Iterable
+
+from core import journal
+
+
+class EntryStore(MutableSequence):
+    """
+    Owner of vault["entries"].
+    Entries are kept in an insertion-ordered by-id dict plus a
+    category -> ids index, so get / update / delete are O(1) and bulk
+    operations O(k). Mutating methods return the change records
+    (core.journal) to hand to Session.mark_dirty.
+
+    Still a sequence for everything that reads entries by position
+    (models, save); the positional list is rebuilt lazily after
+    adds and deletes.
+
+    A paged SQLite vault (core.sqlite_vault.PagedEntries) is indexed
+    only when something needs every id (ids()); until then reads,
+    lookups and edits go to the pager, which finds entries by their
+    id MAC without decrypting the others.
+
+    `version` goes up on every mutation, so views built from the store
+    (ui_qt EntriesModel) can tell when they are stale.
+    """
+
+    def __init__(self, entries: Iterable[dict] = (), pager=None):
+        self.pager = pager
+        self._by_id: dict[str, dict] | None = None
+        self._by_category: dict[str, dict[str, None]] = {}
+        self._order: list[dict] | None = None
+        self._positions: dict[str, int] | None = None
+        self.version = 0
+
+        if pager is None:
+            self._reset(entries)
+
+    @staticmethod
+    def wrap(entries) -> "EntryStore":
+        """
+        Store for whatever a vault holds in "entries".
+        """
+        if isinstance(entries, EntryStore):
+            return entries
+        if hasattr(entries, "in_category") and hasattr(entries, "sources"):
+            return EntryStore(pager=entries)
+        return EntryStore(entries)
+
+    @property
+    def is_indexed(self) -> bool:
+        return self._by_id is not None
+
+    # =========================
+    # Lookups
+    # =========================
+
+    def get(self, entry_id: str) -> dict | None:
+        if self._by_id is None:
+            return self.pager.get(entry_id)
+        return self._by_id.get(entry_id)
+
+    def ids(self) -> list[str]:
+        return list(self._index())
+
+    def index_of(self, entry_id: str) -> int | None:
+        """
+        Position of an entry; the position map is rebuilt lazily after
+        adds and deletes, like the positional list.
+        """
+        if self._by_id is None:
+            return self.pager.position(entry_id)
+        order = self._list()
+        if self._positions is None:
+            self._positions = {dict.get(e, "id"): i for i, e in enumerate(order)}
+        return self._positions.get(entry_id)
+
+    def missing(self, entry_ids: Iterable[str]) -> set[str]:
+        """
+        Those of `entry_ids` that aren't in the store.
+        """
+        if self._by_id is None:
+            return self.pager.missing(entry_ids)
+        return {i for i in entry_ids if i not in self._by_id}
+
+    def in_category(self, category_id: str) -> list[dict]:
+        if self._by_id is None:
+            return self.pager.in_category(category_id)
+        by_id = self._by_id
+        return [by_id[i] for i in self._by_category.get(category_id, ())]
+
+    def has_category(self, category_id: str) -> bool:
+        if self._by_id is None:
+            return bool(self.pager.in_category(category_id))
+        return bool(self._by_category.get(category_id))
+
+    # =========================
+    # Mutations
+    # =========================
+
+    def add(self, entry: dict) -> list[dict]:
+        """
+        Insert `entry`, or replace the entry with its id in place.
+        """
+        return self.add_many([entry])
+
+    def add_many(self, entries: Iterable[dict]) -> list[dict]:
+        if self._by_id is None:
+            return self._add_paged(entries)
+        by_id = self._by_id
+        changes = []
+        for entry in entries:
+            old = by_id.get(entry["id"])
+            if old is not None:
+                self._unlink_category(old)
+            by_id[entry["id"]] = entry
+            self._link_category(entry)
+            changes.append(journal.put_entry(entry))
+        self._order = None
+        self.version += 1
+        return changes
+
+    def update(self, entry_id: str, fields: dict) -> list[dict]:
+        """
+        Change fields of an entry. Raises KeyError for unknown ids.
+        """
+        if self._by_id is None:
+            entry = self.pager.get(entry_id)
+            if entry is None:
+                raise KeyError(entry_id)
+            entry.update(fields)
+            self.version += 1
+            return [journal.put_entry(entry)]
+
+        entry = self._by_id[entry_id]
+        old_category_id = dict.get(entry, "category_id", "all")
+        if fields.get("category_id", old_category_id) != old_category_id:
+            self._unlink_category(entry)
+            entry.update(fields)
+            self._link_category(entry)
+        else:
+            entry.update(fields)
+        self.version += 1
+        return [journal.put_entry(entry)]
+
+    def delete(self, entry_ids: Iterable[str]) -> list[dict]:
+        """
+        Remove entries by id; unknown ids are skipped.
+        """
+        if self._by_id is None:
+            return self._delete_paged(entry_ids)
+        by_id = self._by_id
+        changes = []
+        for entry_id in entry_ids:
+            entry = by_id.pop(entry_id, None)
+            if entry is None:
+                continue
+            self._unlink_category(entry)
+            changes.append(journal.delete_entry(entry_id))
+        if changes:
+            self._order = None
+            self.version += 1
+        return changes
+
+    def delete_all(self) -> list[dict]:
+        self._reset(())
+        self.pager = None
+        return [journal.clear_entries()]
+
+    # =========================
+    # Sequence protocol
+    # =========================
+
+    def _list(self):
+        if self._by_id is None:
+            return self.pager
+        if self._order is None:
+            self._order = list(self._by_id.values())
+            self._positions = None
+        return self._order
+
+    def __len__(self) -> int:
+        if self._by_id is None:
+            return len(self.pager)
+        return len(self._by_id)
+
+    def __getitem__(self, i):
+        return self._list()[i]
+
+    def __iter__(self):
+        return iter(self._list())
+
+    def __contains__(self, value) -> bool:
+        if not isinstance(value, dict):
+            return False
+        found = self.get(dict.get(value, "id"))
+        return found is value or (found is not None and found == value)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"EntryStore({len(self)} entries)"
+
+    # Positional edits rebuild the store: O(n), kept for old callers
+
+    def __setitem__(self, i, value):
+        entries = list(self._list())
+        entries[i] = value
+        self._reset(entries)
+
+    def __delitem__(self, i):
+        entries = list(self._list())
+        del entries[i]
+        self._reset(entries)
+
+    def insert(self, i, value):
+        entries = list(self._list())
+        entries.insert(i, value)
+        self._reset(entries)
+
+    def append(self, value):
+        self.add(value)
+
+    def index(self, value, start=0, stop=None):
+        i = self.index_of(dict.get(value, "id")) if isinstance(value, dict) else None
+        if i is None or value not in self:
+            raise ValueError("Entry not in store")
+        if i < start or (stop is not None and i >= stop):
+            raise ValueError("Entry not in range")
+        return i
+
+    def remove(self, value):
+        if value not in self:
+            raise ValueError("Entry not in store")
+        self.delete([dict.get(value, "id")])
+
+    def clear(self):
+        self.delete_all()
+
+    # =========================
+    # Helpers
+    # =========================
+
+    def _index(self) -> dict[str, dict]:
+        if self._by_id is None:
+            # First lookup in a paged vault: page in the list fields
+            self._reset(self.pager)
+        return self._by_id
+
+    def _add_paged(self, entries: Iterable[dict]) -> list[dict]:
+        pager = self.pager
+        changes = []
+        for entry in entries:
+            i = pager.position(entry["id"])
+            if i is None:
+                pager.append(entry)
+            else:
+                pager[i] = entry
+            changes.append(journal.put_entry(entry))
+        self.version += 1
+        return changes
+
+    def _delete_paged(self, entry_ids: Iterable[str]) -> list[dict]:
+        pager = self.pager
+        found = {}
+        for entry_id in entry_ids:
+            i = pager.position(entry_id)
+            if i is not None:
+                found[entry_id] = i
+        # From the back, so the other positions stay put
+        for i in sorted(found.values(), reverse=True):
+            del pager[i]
+        if found:
+            self.version += 1
+        return [journal.delete_entry(entry_id) for entry_id in found]
+
+    def _reset(self, entries: Iterable[dict]) -> None:
+        self._by_id = {}
+        self._by_category = {}
+        self._order = None
+        self.version += 1
+        for entry in entries:
+            old = self._by_id.get(entry["id"])
+            if old is not None:
+                self._unlink_category(old)
+            self._by_id[entry["id"]] = entry
+            self._link_category(entry)
+
+    def _link_category(self, entry: dict) -> None:
+        cid = dict.get(entry, "category_id", "all")
+        self._by_category.setdefault(cid, {})[entry["id"]] = None
+
+    def _unlink_category(self, entry: dict) -> None:
+        cid = dict.get(entry, "category_id", "all")
+        ids = self._by_category.get(cid)
+        if ids is not None:
+            ids.pop(entry["id"], None)
+            if not ids:
+                del self._by_category[cid]
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from typing import Iterable
+
+from core import journal
+
+# =====================
+# Usage counters
+# =====================
+#
+# Every use of an entry (copying its login or password, opening its
+# site, editing it) adds to a per-entry score that halves every
+# HALF_LIFE. The vault keeps vault["meta"]["usage"][id] = [score, stamp]:
+# the score as of `stamp`; meta is encrypted with the rest of the vault.
+#
+# Decay scales every score by the same factor, so the order of two
+# entries never changes with time alone. Entries are ranked by
+#
+#     log2(score) + stamp / HALF_LIFE
+#
+# which stays fixed until the entry is used again: the ranking is a
+# sorted list where one use moves one entry.
+
+HALF_LIFE = 30 * 86400
+
+EVENT_WEIGHTS = {
+    "copy_password": 1.0,
+    "copy_login": 1.0,
+    "open_site": 1.0,
+    "edit": 0.5,
+}
+
+
+class Frecency:
+    """
+    Usage counters of a vault and the ranking built from them.
+    Thread-safe: the search thread orders results while the UI
+    records uses.
+    """
+
+    def __init__(self, vault: dict, half_life: float = HALF_LIFE):
+        self.half_life = half_life
+        self.usage: dict[str, list] = vault.setdefault("meta", {}).setdefault("usage", {})
+        self.version = 0
+        self._lock = threading.Lock()
+        self._keys: dict[str, float] = {}
+        self._ranked: list[tuple[float, str]] = []   # (-key, id), hottest first
+
+        for entry_id, (score, stamp) in self.usage.items():
+            self._keys[entry_id] = self._key(score, stamp)
+        self._ranked = sorted((-k, i) for i, k in self._keys.items())
+
+    # =========================
+    # Recording
+    # =========================
+
+    def record(self, entry_id: str, event: str, now: float | None = None) -> list[dict]:
+        """
+        Count a use of an entry; returns the change record to save.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            score = self.score(entry_id, now) + EVENT_WEIGHTS[event]
+            value = [round(score, 6), round(now)]
+            self.usage[entry_id] = value
+            self._rank(entry_id, self._key(*value))
+            self.version += 1
+        return [journal.put_usage({entry_id: value})]
+
+    def forget(self, entry_ids: Iterable[str]) -> list[dict]:
+        """
+        Drop the counters of deleted entries.
+        """
+        with self._lock:
+            gone = [i for i in entry_ids if i in self.usage]
+            for entry_id in gone:
+                del self.usage[entry_id]
+                self._rank(entry_id, None)
+            if gone:
+                self.version += 1
+        if not gone:
+            return []
+        return [journal.put_usage(dict.fromkeys(gone))]
+
+    # =========================
+    # Ranking
+    # =========================
+
+    def score(self, entry_id: str, now: float | None = None) -> float:
+        value = self.usage.get(entry_id)
+        if value is None:
+            return 0.0
+        score, stamp = value
+        now = time.time() if now is None else now
+        return score * 0.5 ** (max(now - stamp, 0) / self.half_life)
+
+    def key(self, entry_id: str) -> float:
+        """
+        Time-independent rank of an entry, -inf if never used.
+        """
+        return self._keys.get(entry_id, -math.inf)
+
+    def hottest(self, limit: int | None = None) -> list[str]:
+        with self._lock:
+            ranked = self._ranked[:limit] if limit is not None else list(self._ranked)
+        return [entry_id for _, entry_id in ranked]
+
+    def ordered(self, rows, position=None) -> list[dict]:
+        """
+        `rows` with used entries first, most used first; the others
+        keep their order. Only used entries are sorted.
+        With `position` (EntryStore.index_of for the store itself) the
+        unused ones are sliced out instead of visited.
+        """
+        if position is None:
+            with self._lock:
+                keys = dict(self._keys)
+            if not keys:
+                return list(rows)
+            hot, cold = [], []
+            for entry in rows:
+                (hot if dict.get(entry, "id") in keys else cold).append(entry)
+            hot.sort(key=lambda e: keys[e["id"]], reverse=True)
+            return hot + cold
+
+        hot, positions = [], []
+        for entry_id in self.hottest():
+            i = position(entry_id)
+            if i is not None:
+                hot.append(rows[i])
+                positions.append(i)
+        positions.sort()
+        start = 0
+        for i in positions:
+            hot += rows[start:i]
+            start = i + 1
+        hot += rows[start:]
+        return hot
+
+    # =========================
+    # Helpers
+    # =========================
+
+    def _key(self, score: float, stamp: float) -> float:
+        if score <= 0:
+            return -math.inf
+        return math.log2(score) + stamp / self.half_life
+
+    def _rank(self, entry_id: str, key: float | None) -> None:
+        old = self._keys.pop(entry_id, None)
+        if old is not None:
+            i = bisect.bisect_left(self._ranked, (-old, entry_id))
+            del self._ranked[i]
+        if key is not None:
+            self._keys[entry_id] = key
+            bisect.insort(self._ranked, (-key, entry_id))
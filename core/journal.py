@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import os
+import struct
+from typing import Iterable, Iterator
+
+from core import storage
+
+# =====================
+# Journal file format
+# =====================
+#
+# <vault>.journal sits next to the vault snapshot and holds a sequence of
+# frames: 4-byte big-endian length + encrypted change record.
+# Records are replayed on load and dropped when the snapshot is rewritten.
+#
+# Every snapshot carries a random "generation" in its header, and the
+# first record of a journal names the generation it was started on. A
+# journal that names another one was left behind by a crash between a
+# snapshot's rename and the journal's removal: the snapshot already
+# holds its changes, so it is dropped instead of replayed over them.
+
+JOURNAL_SUFFIX = ".journal"
+FRAME = struct.Struct(">I")
+
+# Compaction thresholds
+JOURNAL_MAX_BYTES = 4 * 1024 * 1024
+JOURNAL_MAX_RATIO = 0.5
+
+
+# =====================
+# Change records
+# =====================
+
+# Records that change entries (and so the vault's content revision)
+ENTRY_OPS = ("put_entry", "delete_entry", "clear_entries")
+
+def new_generation() -> str:
+    return os.urandom(8).hex()
+
+
+def generation(value: str) -> dict:
+    """
+    First record of a journal: the snapshot generation it follows.
+    """
+    return {"op": "generation", "generation": value}
+
+
+def put_entry(entry: dict) -> dict:
+    return {"op": "put_entry", "entry": dict(entry)}
+
+
+def delete_entry(entry_id: str) -> dict:
+    return {"op": "delete_entry", "id": entry_id}
+
+
+def clear_entries() -> dict:
+    return {"op": "clear_entries"}
+
+
+def put_category(category: dict) -> dict:
+    return {"op": "put_category", "category": dict(category)}
+
+
+def delete_category(category_id: str) -> dict:
+    return {"op": "delete_category", "id": category_id}
+
+
+def put_usage(usage: dict) -> dict:
+    """
+    Usage counters (core.frecency) by entry id; None drops one.
+    """
+    return {"op": "put_usage", "usage": dict(usage)}
+
+
+def apply_usage(meta: dict, usage: dict) -> None:
+    counters = meta.setdefault("usage", {})
+    for entry_id, value in usage.items():
+        if value is None:
+            counters.pop(entry_id, None)
+        else:
+            counters[entry_id] = value
+
+
+def apply_changes(vault: dict, changes: Iterable[dict]) -> None:
+    """
+    Replay change records on a loaded vault.
+    Every record is idempotent, so replaying twice is harmless.
+    """
+    entries = vault["entries"]
+    categories = vault["categories"]
+
+    entry_pos = {e["id"]: i for i, e in enumerate(entries)}
+    cat_pos = {c["id"]: i for i, c in enumerate(categories)}
+
+    for change in changes:
+        op = change.get("op")
+
+        if op == "put_entry":
+            entry = change["entry"]
+            i = entry_pos.get(entry["id"])
+            if i is None:
+                entry_pos[entry["id"]] = len(entries)
+                entries.append(entry)
+            else:
+                entries[i] = entry
+
+        elif op == "delete_entry":
+            i = entry_pos.pop(change["id"], None)
+            if i is not None:
+                entries[i] = None
+
+        elif op == "clear_entries":
+            entries[:] = [None] * len(entries)
+            entry_pos.clear()
+
+        elif op == "put_category":
+            cat = change["category"]
+            i = cat_pos.get(cat["id"])
+            if i is None:
+                cat_pos[cat["id"]] = len(categories)
+                categories.append(cat)
+            else:
+                categories[i] = cat
+
+        elif op == "delete_category":
+            i = cat_pos.pop(change["id"], None)
+            if i is not None:
+                categories[i] = None
+
+        elif op == "put_usage":
+            apply_usage(vault.setdefault("meta", {}), change["usage"])
+
+        else:
+            raise ValueError(f"Unknown journal record: {op!r}")
+
+    # Deletions leave holes so positions stay valid during replay
+    entries[:] = [e for e in entries if e is not None]
+    categories[:] = [c for c in categories if c is not None]
+
+
+def changed_entries(changes: Iterable[dict]) -> set[str] | None:
+    """
+    Ids of the entries that change records put or delete; None if
+    they clear all entries.
+    """
+    ids = set()
+    for change in changes:
+        op = change.get("op")
+        if op == "put_entry":
+            ids.add(change["entry"]["id"])
+        elif op == "delete_entry":
+            ids.add(change["id"])
+        elif op == "clear_entries":
+            return None
+    return ids
+
+
+def replay_entries(entries: Iterable[dict], changes: Iterable[dict]) -> Iterator[dict]:
+    """
+    Streaming apply_changes for entries: yields the entries a loaded and
+    replayed vault would hold, in the same order, without collecting
+    the snapshot. Only the journal's own entries are kept in memory.
+    Category records are ignored; replay them with apply_changes.
+    """
+    cleared = False
+    ops: dict[str, list[tuple[int, dict | None]]] = {}
+
+    for seq, change in enumerate(changes):
+        op = change.get("op")
+        if op == "clear_entries":
+            cleared = True
+            ops.clear()
+        elif op == "put_entry":
+            ops.setdefault(change["entry"]["id"], []).append((seq, change["entry"]))
+        elif op == "delete_entry":
+            ops.setdefault(change["id"], []).append((seq, None))
+
+    appended: list[tuple[int, dict]] = []
+
+    if not cleared:
+        for entry in entries:
+            history = ops.pop(entry["id"], None)
+            if history is None:
+                yield entry
+                continue
+            current, moved = _replay_one(history, present=True)
+            if moved is not None:
+                appended.append(moved)
+            elif current is not None:
+                yield current
+
+    for history in ops.values():
+        _, moved = _replay_one(history, present=False)
+        if moved is not None:
+            appended.append(moved)
+
+    appended.sort(key=lambda item: item[0])
+    for _, entry in appended:
+        yield entry
+
+
+def _replay_one(history, present: bool):
+    """
+    Outcome of one id's puts/deletes, as apply_changes would see them.
+    Returns (entry kept in place, (seq, entry) appended at the end);
+    at most one is set.
+    """
+    position = "snapshot" if present else None
+    value = None
+    for seq, entry in history:
+        if entry is None:
+            position = None
+            value = None
+        else:
+            if position is None:
+                position = seq
+            value = entry
+
+    if position is None:
+        return None, None
+    if position == "snapshot":
+        return value, None
+    return None, (position, value)
+
+
+def merge_changes(pending: dict, changes: Iterable[dict]) -> None:
+    """
+    Coalesce change records into `pending` (key -> record, in order).
+    A later record for the same entry or category replaces the earlier
+    one; clear_entries drops every entry record queued before it.
+    """
+    for change in changes:
+        op = change.get("op")
+
+        if op == "clear_entries":
+            for k in [k for k in pending if k[0] == "entry"]:
+                del pending[k]
+            key = ("clear",)
+        elif op == "put_entry":
+            key = ("entry", change["entry"]["id"])
+        elif op == "delete_entry":
+            key = ("entry", change["id"])
+        elif op == "put_category":
+            key = ("category", change["category"]["id"])
+        elif op == "delete_category":
+            key = ("category", change["id"])
+        elif op == "put_usage":
+            # One record for all counters, the latest value of each
+            key = ("usage",)
+            queued = pending.get(key)
+            if queued is not None:
+                change = put_usage({**queued["usage"], **change["usage"]})
+        else:
+            raise ValueError(f"Unknown journal record: {op!r}")
+
+        pending.pop(key, None)
+        pending[key] = change
+
+
+# =====================
+# File I/O
+# =====================
+
+def journal_path(path: str) -> str:
+    return path + JOURNAL_SUFFIX
+
+
+def append_record(path: str, record: bytes) -> tuple[int, storage.WriteStats]:
+    """
+    Append one encrypted record to the journal.
+    Returns journal size after the write and write timings.
+    """
+    return append_records(path, [record])
+
+
+def append_records(path: str, records: list[bytes]) -> tuple[int, storage.WriteStats]:
+    """
+    append_record for several records, written in one append.
+    """
+    data = b"".join(FRAME.pack(len(record)) + record for record in records)
+    return storage.append(journal_path(path), data)
+
+
+def read_first_record(path: str) -> bytes | None:
+    """
+    First complete record of the journal, None if it has none.
+    """
+    try:
+        with open(journal_path(path), "rb") as f:
+            head = f.read(FRAME.size)
+            if len(head) < FRAME.size:
+                return None
+            (size,) = FRAME.unpack(head)
+            record = f.read(size)
+    except FileNotFoundError:
+        return None
+    return record if len(record) == size else None
+
+
+def read_records(path: str, repair: bool = False) -> list[bytes]:
+    """
+    Read all complete records from the journal.
+    A torn frame at the tail is left out: another process may still
+    be appending it. With `repair` (the caller holds the writer lock,
+    so it is a crash's leftover) it is cut off, so later appends do
+    not land behind garbage.
+    """
+    try:
+        with open(journal_path(path), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+
+    records = []
+    pos = 0
+    while pos + FRAME.size <= len(data):
+        (size,) = FRAME.unpack_from(data, pos)
+        start = pos + FRAME.size
+        if start + size > len(data):
+            break
+        records.append(data[start:start + size])
+        pos = start + size
+
+    if repair and pos != len(data):
+        with open(journal_path(path), "r+b") as f:
+            f.truncate(pos)
+
+    return records
+
+
+def discard(path: str) -> None:
+    """
+    Remove journal after its records were folded into the snapshot.
+    """
+    storage.remove(journal_path(path))
+
+
+def should_compact(journal_size: int, snapshot_size: int) -> bool:
+    if journal_size >= JOURNAL_MAX_BYTES:
+        return True
+    return journal_size >= snapshot_size * JOURNAL_MAX_RATIO
+
+
+def snapshot_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def journal_size(path: str) -> int:
+    return snapshot_size(journal_path(path))
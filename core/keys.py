@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import base64
+import os
+from dataclasses import dataclass, field, replace
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from core.crypto import (
+    CIPHER_FERNET,
+    DEFAULT_CIPHER,
+    DEFAULT_UNLOCK_MS,
+    KDF_LEGACY,
+    KdfParams,
+    PayloadCipher,
+    calibrate_kdf,
+    derive_key,
+)
+
+# =====================
+# Envelope keys
+# =====================
+#
+# The vault body is encrypted with a random data key. The header holds
+# a slot table; every slot is the data key wrapped with a key derived
+# from one password:
+#
+#   {"slots": [{"id": "...", "kdf": {...scrypt...}, "key": "<wrapped>"}]}
+#
+# Changing a password only replaces its slot.
+
+
+@dataclass(slots=True)
+class VaultKey:
+    """
+    Key the vault body is encrypted with, plus how it is stored in
+    the header. Kept by the session so saves never re-run the KDF.
+    The key is left out of repr(), so logs and tracebacks don't show it.
+    """
+    key: bytes = field(repr=False)
+    slots: list[dict] | None = None    # envelope vaults
+    kdf: KdfParams | None = None       # pre-envelope: key derived directly
+    cipher: str = CIPHER_FERNET        # payload cipher used with the key
+
+    @property
+    def is_envelope(self) -> bool:
+        return self.slots is not None
+
+    def header(self) -> dict:
+        if self.slots is not None:
+            header = {"slots": self.slots}
+        elif self.kdf is not None:
+            header = {"kdf": self.kdf.to_header()}
+        else:
+            header = {"kdf": KDF_LEGACY}
+        header["cipher"] = self.cipher
+        return header
+
+    def payload_cipher(self) -> PayloadCipher:
+        return PayloadCipher(self.cipher, self.key)
+
+
+def new_vault_key(
+    master_password: str,
+    target_ms: int = DEFAULT_UNLOCK_MS,
+) -> VaultKey:
+    """
+    Random data key with one slot for `master_password`.
+    """
+    data_key = Fernet.generate_key()
+    return VaultKey(
+        data_key,
+        [make_slot(data_key, master_password, target_ms)],
+        cipher=DEFAULT_CIPHER,
+    )
+
+
+def make_slot(
+    data_key: bytes,
+    password: str,
+    target_ms: int = DEFAULT_UNLOCK_MS,
+) -> dict:
+    params = calibrate_kdf(target_ms)
+    wrapped = Fernet(derive_key(password, params)).encrypt(data_key)
+    return {
+        "id": os.urandom(4).hex(),
+        "kdf": params.to_header(),
+        "key": base64.b64encode(wrapped).decode("ascii"),
+    }
+
+
+def open_slot(slot: dict, password: str) -> bytes | None:
+    """
+    Data key from `slot`, or None if `password` does not fit.
+    """
+    params = KdfParams.from_header(slot["kdf"])
+    try:
+        return Fernet(derive_key(password, params)).decrypt(
+            base64.b64decode(slot["key"])
+        )
+    except InvalidToken:
+        return None
+
+
+def unlock_key(header: dict, password: str) -> VaultKey:
+    """
+    Key for a vault with the given plaintext header.
+    Raises ValueError if no slot opens with `password`.
+    """
+    slots = header.get("slots")
+    cipher = header.get("cipher", CIPHER_FERNET)
+
+    if slots is None:
+        kdf = header.get("kdf", KDF_LEGACY)
+        if kdf == KDF_LEGACY:
+            return VaultKey(derive_key(password), cipher=cipher)
+        params = KdfParams.from_header(kdf)
+        return VaultKey(derive_key(password, params), kdf=params, cipher=cipher)
+
+    for slot in slots:
+        data_key = open_slot(slot, password)
+        if data_key is not None:
+            return VaultKey(data_key, list(slots), cipher=cipher)
+
+    raise ValueError("Invalid master password or corrupted vault")
+
+
+def find_slot(key: VaultKey, password: str) -> int:
+    """
+    Index of the slot `password` opens. Raises ValueError if none.
+    """
+    for i, slot in enumerate(key.slots or []):
+        if open_slot(slot, password) == key.key:
+            return i
+    raise ValueError("Invalid master password")
+
+
+def with_slots(key: VaultKey, slots: list[dict]) -> VaultKey:
+    return replace(key, slots=slots)
+
+
+def with_cipher(key: VaultKey, cipher: str) -> VaultKey:
+    return replace(key, cipher=cipher)
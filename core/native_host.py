@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+import sys
+import threading
+from typing import BinaryIO
+
+from core.domains import DomainIndex
+from core.frecency import Frecency
+from core.records import INDEX_FIELDS
+from core.search import peek_fields
+from core.session import Session
+from core.vault import open_vault
+
+# =====================
+# Native messaging
+# =====================
+#
+# Browser extensions talk to a native host over its stdin / stdout:
+# every message is a 32-bit length in native byte order followed by
+# that many bytes of UTF-8 JSON. The browser starts the host once per
+# connection and may send requests without waiting for answers, so
+# every request carries an "id" that its response repeats:
+#
+#   -> {"id": 1, "action": "unlock", "password": "..."}
+#   -> {"id": 2, "action": "lookup", "url": "https://example.com/login"}
+#   <- {"id": 1, "ok": true}
+#   <- {"id": 2, "ok": true, "entries": [{"id": ..., "login": ...}]}
+#   <- {"id": 3, "ok": false, "error": "locked"}
+#
+# The vault is unlocked once per connection and stays in memory with
+# its domain index built; secrets are decrypted on first access only.
+
+_LENGTH = struct.Struct("=I")
+
+# Browsers refuse messages from the host above 1 MB
+MAX_RESPONSE = 1024 * 1024
+MAX_REQUEST = 64 * 1024 * 1024
+
+# Fields "secret" hands out, and the use each one counts (core.frecency)
+SECRET_FIELDS = {"password": "copy_password", "login": "copy_login", "note": None}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 1000
+
+# How often the auto-lock timer is checked while no request comes in
+INACTIVITY_CHECK = 30.0
+
+
+class ProtocolError(ValueError):
+    """
+    Input that is not a framed JSON message; ends the connection.
+    """
+
+
+def encode_message(message: dict) -> bytes:
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _LENGTH.pack(len(data)) + data
+
+
+def read_message(stream: BinaryIO) -> dict | None:
+    """
+    Next message from `stream`, None at end of input.
+    """
+    head = stream.read(_LENGTH.size)
+    if not head:
+        return None
+    if len(head) < _LENGTH.size:
+        raise ProtocolError("Truncated message length")
+    (length,) = _LENGTH.unpack(head)
+    if length > MAX_REQUEST:
+        raise ProtocolError("Message too large")
+    data = stream.read(length)
+    if len(data) < length:
+        raise ProtocolError("Truncated message")
+    try:
+        message = json.loads(data.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"Invalid message: {e}") from None
+    if not isinstance(message, dict):
+        raise ProtocolError("Message is not an object")
+    return message
+
+
+def write_message(stream: BinaryIO, message: dict) -> None:
+    data = encode_message(message)
+    if len(data) - _LENGTH.size > MAX_RESPONSE:
+        data = encode_message({
+            "id": message.get("id"), "ok": False, "error": "too_large",
+        })
+    stream.write(data)
+    stream.flush()
+
+
+class RequestError(Exception):
+    """
+    Request that gets an error response; `code` is the "error" field.
+    """
+
+    def __init__(self, code: str, message: str = ""):
+        super().__init__(message or code)
+        self.code = code
+
+
+class NativeHost:
+    """
+    Answers native messaging requests against one vault, `vault_path`
+    (the app's default vault if None), unlocked by an "unlock" request
+    and kept in a core.session.Session, which auto-locks it after
+    session.auto_lock_minutes without requests.
+    """
+
+    def __init__(self, vault_path: str | None = None, session: Session | None = None):
+        self.vault_path = vault_path or os.path.join("data", "default.zippass")
+        self.session = session or Session()
+        self.domains: DomainIndex | None = None
+        self.frecency: Frecency | None = None
+        # Requests and the auto-lock timer take turns on the session
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._actions = {
+            "status": self._status,
+            "unlock": self._unlock,
+            "lock": self._lock_vault,
+            "lookup": self._lookup,
+            "logins": self._logins,
+            "secret": self._secret,
+        }
+
+    # =========================
+    # Serving
+    # =========================
+
+    def serve(self, stdin: BinaryIO | None = None, stdout: BinaryIO | None = None) -> None:
+        """
+        Answer requests until the browser closes stdin, then lock.
+        """
+        stdin = stdin or sys.stdin.buffer
+        stdout = stdout or sys.stdout.buffer
+        timer = threading.Thread(target=self._watch_inactivity, daemon=True)
+        timer.start()
+        try:
+            while True:
+                try:
+                    request = read_message(stdin)
+                except ProtocolError as e:
+                    write_message(stdout, {"id": None, "ok": False, "error": "bad_message", "message": str(e)})
+                    break
+                if request is None:
+                    break
+                write_message(stdout, self.handle(request))
+        finally:
+            self._stop.set()
+            with self._lock:
+                self._close()
+
+    def handle(self, request: dict) -> dict:
+        response = {"id": request.get("id")}
+        action = self._actions.get(request.get("action"))
+        try:
+            if action is None:
+                raise RequestError("unknown_action")
+            with self._lock:
+                self.session.check_inactivity()
+                result = action(request)
+                self.session.notify_activity()
+        except RequestError as e:
+            response.update(ok=False, error=e.code)
+            if str(e) != e.code:
+                response["message"] = str(e)
+            return response
+        except Exception as e:
+            # A broken entry must not end the connection
+            response.update(ok=False, error="internal", message=str(e))
+            return response
+        response["ok"] = True
+        response.update(result)
+        return response
+
+    def _watch_inactivity(self) -> None:
+        while not self._stop.wait(INACTIVITY_CHECK):
+            with self._lock:
+                self.session.check_inactivity()
+
+    # =========================
+    # Actions
+    # =========================
+
+    def _status(self, request: dict) -> dict:
+        return {"unlocked": self.session.is_unlocked, "read_only": self.session.read_only}
+
+    def _unlock(self, request: dict) -> dict:
+        password = request.get("password")
+        if not isinstance(password, str):
+            raise RequestError("bad_request", "password is required")
+        # The extension picks no files: only the host's own vault opens
+        if "path" in request:
+            raise RequestError("bad_request", "path is not accepted")
+        path = self.vault_path
+        # An open session lets go of the writer lock first
+        if not self._close():
+            raise RequestError("save_failed", self.session.saver.state().error or "")
+        try:
+            vault, key, write_lock = open_vault(password, path)
+        except FileNotFoundError:
+            raise RequestError("not_found", "vault file not found") from None
+        except Exception:
+            raise RequestError("unlock_failed") from None
+
+        self.session.unlock(vault, key, path, write_lock)
+        self.session.on_lock = self._locked
+        self.frecency = Frecency(vault)
+        self.domains = DomainIndex(vault["entries"])
+        self.domains.prepare()
+        return {"entries": len(vault["entries"]), "read_only": self.session.read_only}
+
+    def _lock_vault(self, request: dict) -> dict:
+        if not self._close():
+            raise RequestError("save_failed", self.session.saver.state().error or "")
+        return {}
+
+    def _lookup(self, request: dict) -> dict:
+        self._require_unlocked()
+        url = request.get("url")
+        if not isinstance(url, str):
+            raise RequestError("bad_request", "url is required")
+        limit = self._limit(request)
+        entries = self.domains.match(url, limit, self.frecency)
+        return {"entries": [self._summary(e) for e in entries]}
+
+    def _logins(self, request: dict) -> dict:
+        self._require_unlocked()
+        store = self.session.vault["entries"]
+        offset = request.get("offset", 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise RequestError("bad_request", "offset must be a non-negative integer")
+        limit = self._limit(request)
+        return {
+            "total": len(store),
+            "entries": [self._summary(e) for e in store[offset:offset + limit]],
+        }
+
+    def _secret(self, request: dict) -> dict:
+        self._require_unlocked()
+        field = request.get("field", "password")
+        if field not in SECRET_FIELDS:
+            raise RequestError("bad_request", f"field must be one of {', '.join(SECRET_FIELDS)}")
+        entry = self.session.vault["entries"].get(request.get("entry"))
+        if entry is None:
+            raise RequestError("not_found", "no such entry")
+
+        value = entry.get(field) or ""
+        event = SECRET_FIELDS[field]
+        # Uses are only counted while no other process writes the vault
+        if event is not None and not self.session.read_only:
+            self.session.mark_dirty(self.frecency.record(entry["id"], event))
+        return {"value": value}
+
+    # =========================
+    # Helpers
+    # =========================
+
+    def _require_unlocked(self) -> None:
+        if not self.session.is_unlocked:
+            raise RequestError("locked")
+
+    @staticmethod
+    def _limit(request: dict) -> int:
+        limit = request.get("limit", DEFAULT_LIMIT)
+        if not isinstance(limit, int) or not 0 < limit <= MAX_LIMIT:
+            raise RequestError("bad_request", f"limit must be between 1 and {MAX_LIMIT}")
+        return limit
+
+    @staticmethod
+    def _summary(entry: dict) -> dict:
+        # List-view fields only: a LazyEntry is not decrypted
+        return dict(zip(INDEX_FIELDS, peek_fields(entry, INDEX_FIELDS)))
+
+    def _locked(self, reason: str) -> None:
+        self.domains = None
+        self.frecency = None
+
+    def _close(self) -> bool:
+        return self.session.lock(reason="closed")
@@ -0,0 +1,166 @@
+# =====================
+# Public suffixes
+# =====================
+#
+# Compact subset of the Public Suffix List (https://publicsuffix.org,
+# MPL-2.0), in its own rule syntax: one suffix per line, "*." for
+# wildcards, "!" for exceptions. Every top-level domain is a public
+# suffix without being listed (the list's default "*" rule), so only
+# suffixes of two or more labels are here: country second-level
+# domains and hosting platforms whose subdomains belong to different
+# people. Internationalized suffixes are in their ASCII (punycode)
+# form, like hostnames after core.domains.host_of.
+#
+# Parsed on the first lookup (core.domains).
+
+RULES = """
+// ===== ICANN =====
+
+// ar
+com.ar edu.ar gob.ar gov.ar int.ar mil.ar net.ar org.ar tur.ar
+
+// at
+ac.at co.at gv.at or.at
+
+// au
+asn.au com.au edu.au gov.au id.au net.au org.au
+act.au nsw.au nt.au qld.au sa.au tas.au vic.au wa.au
+
+// be, bd, bn, bo
+ac.be
+*.bd
+com.bn edu.bn gov.bn net.bn org.bn
+com.bo edu.bo gob.bo int.bo mil.bo net.bo org.bo
+
+// br
+adm.br adv.br agr.br arq.br art.br blog.br com.br coop.br eco.br edu.br eng.br
+esp.br etc.br eti.br far.br fm.br fot.br gov.br ind.br inf.br jor.br jus.br
+leg.br lel.br mat.br med.br mil.br mp.br mus.br net.br nom.br not.br ntr.br
+odo.br org.br ppg.br pro.br psc.br qsl.br rec.br slg.br srv.br tmp.br trd.br
+tur.br tv.br vet.br wiki.br
+
+// by, ca, ch, ck
+com.by gov.by mil.by of.by
+ab.ca bc.ca mb.ca nb.ca nf.ca nl.ca ns.ca nt.ca nu.ca on.ca pe.ca qc.ca sk.ca yk.ca gc.ca
+*.ck
+!www.ck
+
+// cn
+ac.cn com.cn edu.cn gov.cn mil.cn net.cn org.cn
+ah.cn bj.cn cq.cn fj.cn gd.cn gs.cn gx.cn gz.cn ha.cn hb.cn he.cn hi.cn hk.cn
+hl.cn hn.cn jl.cn js.cn jx.cn ln.cn mo.cn nm.cn nx.cn qh.cn sc.cn sd.cn sh.cn
+sn.cn sx.cn tj.cn tw.cn xj.cn xz.cn yn.cn zj.cn
+
+// co, cr, cy, de, do, ec, eg, es
+com.co edu.co gov.co mil.co net.co nom.co org.co
+ac.cr co.cr ed.cr fi.cr go.cr or.cr sa.cr
+ac.cy biz.cy com.cy gov.cy net.cy org.cy
+com.de
+com.do edu.do gob.do gov.do net.do org.do
+com.ec edu.ec fin.ec gob.ec gov.ec med.ec net.ec org.ec
+com.eg edu.eg eun.eg gov.eg mil.eg net.eg org.eg sci.eg
+com.es edu.es gob.es nom.es org.es
+
+// fj, fk, gh, gr, gt, hk, hu
+*.fj
+*.fk
+com.gh edu.gh gov.gh mil.gh org.gh
+com.gr edu.gr gov.gr net.gr org.gr
+com.gt edu.gt gob.gt ind.gt mil.gt net.gt org.gt
+com.hk edu.hk gov.hk idv.hk net.hk org.hk
+co.hu info.hu org.hu priv.hu sport.hu tm.hu
+
+// id, il, in, ir, it
+ac.id biz.id co.id go.id mil.id my.id net.id or.id sch.id web.id
+ac.il co.il gov.il idf.il k12.il muni.il net.il org.il
+ac.in co.in edu.in firm.in gen.in gov.in ind.in mil.in net.in nic.in org.in res.in
+ac.ir co.ir gov.ir id.ir net.ir org.ir sch.ir
+gov.it edu.it
+
+// jp
+ac.jp ad.jp co.jp ed.jp go.jp gr.jp lg.jp ne.jp or.jp
+*.kawasaki.jp *.kitakyushu.jp *.kobe.jp *.nagoya.jp *.sapporo.jp *.sendai.jp *.yokohama.jp
+!city.kawasaki.jp !city.kitakyushu.jp !city.kobe.jp !city.nagoya.jp
+!city.sapporo.jp !city.sendai.jp !city.yokohama.jp
+
+// ke, kh, kr, kz
+ac.ke co.ke go.ke info.ke me.ke mobi.ke ne.ke or.ke sc.ke
+*.kh
+ac.kr co.kr es.kr go.kr hs.kr kg.kr mil.kr ms.kr ne.kr or.kr pe.kr re.kr sc.kr
+com.kz edu.kz gov.kz mil.kz net.kz org.kz
+
+// lk, lv, ly, ma, mm, mx, my
+ac.lk com.lk edu.lk gov.lk net.lk org.lk
+asn.lv com.lv conf.lv edu.lv gov.lv id.lv mil.lv net.lv org.lv
+com.ly edu.ly gov.ly id.ly med.ly net.ly org.ly plc.ly sch.ly
+ac.ma co.ma gov.ma net.ma org.ma press.ma
+*.mm
+com.mx edu.mx gob.mx net.mx org.mx
+com.my edu.my gov.my mil.my name.my net.my org.my
+
+// ng, ni, np, nz
+com.ng edu.ng gov.ng mil.ng name.ng net.ng org.ng sch.ng
+com.ni edu.ni gob.ni net.ni org.ni
+*.np
+ac.nz co.nz cri.nz geek.nz gen.nz govt.nz health.nz iwi.nz kiwi.nz maori.nz
+mil.nz net.nz org.nz parliament.nz school.nz
+
+// pa, pe, ph, pk, pl, pt, py
+ac.pa com.pa edu.pa gob.pa net.pa org.pa
+com.pe edu.pe gob.pe mil.pe net.pe nom.pe org.pe
+com.ph edu.ph gov.ph mil.ph net.ph ngo.ph org.ph
+com.pk edu.pk gob.pk gov.pk net.pk org.pk
+com.pl edu.pl gov.pl info.pl net.pl org.pl waw.pl
+com.pt edu.pt gov.pt int.pt net.pt nome.pt org.pt publ.pt
+com.py edu.py gov.py mil.py net.py org.py
+
+// ro, rs, ru, sa, sg, th, tr, tw
+com.ro info.ro nom.ro org.ro rec.ro store.ro tm.ro www.ro
+ac.rs co.rs edu.rs gov.rs in.rs org.rs
+ac.ru edu.ru gov.ru int.ru mil.ru test.ru
+com.sa edu.sa gov.sa med.sa net.sa org.sa pub.sa sch.sa
+com.sg edu.sg gov.sg net.sg org.sg
+ac.th co.th go.th in.th mi.th net.th or.th
+av.tr bbs.tr bel.tr biz.tr com.tr dr.tr edu.tr gen.tr gov.tr info.tr k12.tr
+kep.tr mil.tr name.tr net.tr org.tr pol.tr tel.tr tv.tr web.tr
+club.tw com.tw ebiz.tw edu.tw game.tw gov.tw idv.tw mil.tw net.tw org.tw
+
+// ua, ug, uk, us, uy, uz, ve, vn, za
+com.ua edu.ua gov.ua in.ua kiev.ua kyiv.ua net.ua org.ua
+ac.ug co.ug go.ug or.ug sc.ug
+ac.uk co.uk gov.uk ltd.uk me.uk net.uk nhs.uk org.uk plc.uk police.uk sch.uk
+dni.us fed.us isa.us kids.us nsn.us
+com.uy edu.uy gub.uy mil.uy net.uy org.uy
+co.uz com.uz net.uz org.uz
+co.ve com.ve edu.ve gob.ve info.ve mil.ve net.ve org.ve web.ve
+ac.vn biz.vn com.vn edu.vn gov.vn info.vn int.vn name.vn net.vn org.vn pro.vn
+ac.za co.za edu.za gov.za law.za mil.za net.za nom.za org.za school.za web.za
+
+// ===== Private =====
+
+cloudfront.net
+*.compute.amazonaws.com
+*.compute-1.amazonaws.com
+s3.amazonaws.com
+elasticbeanstalk.com
+azurewebsites.net azurestaticapps.net blob.core.windows.net cloudapp.net
+trafficmanager.net
+appspot.com firebaseapp.com web.app withgoogle.com
+blogspot.com
+github.io githubusercontent.com
+gitlab.io
+herokuapp.com
+netlify.app
+vercel.app now.sh
+pages.dev workers.dev
+fly.dev onrender.com
+glitch.me
+readthedocs.io
+repl.co
+myshopify.com
+wixsite.com
+wordpress.com
+tumblr.com
+ngrok.io ngrok.app
+duckdns.org dyndns.org no-ip.org
+"""
@@ -0,0 +1,527 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable
+
+from core.search import SearchIndex, fuzzy_keys, normalize
+
+if TYPE_CHECKING:
+    from core.frecency import Frecency
+
+# =====================
+# Query language
+# =====================
+#
+#   login:alice domain:github.com category:Work updated:<90d weak:yes /regex/
+#
+# Terms are ANDed with each other and with the remaining words, which
+# are one substring like before. Values with spaces go in quotes
+# (category:"Дом и быт"). An unknown field or a bad value leaves the
+# token as plain text, so URLs and stray colons still search as typed.
+#
+# A query compiles to a plan of predicates. Those backed by an index
+# (category, domain, service / login keys, timestamps, trigrams) are
+# looked up and intersected, cheapest first; the rest (regex, weak
+# passwords, and lookups left once few candidates remain) test the
+# candidates one by one. Plans run on a QueryRunner thread, which
+# drops a query as soon as a newer one comes in; a regex is tested
+# field by field, with a cancellation check before each.
+#
+# "weak:" has to decrypt each candidate's password. The verdicts are
+# kept per (entry id, updated_at) by whoever runs queries repeatedly
+# (QueryRunner, core.agent): an entry is checked again once edited.
+
+KEY_FIELDS = ("service", "login", "domain")
+TEXT_FIELDS = ("url", "note")
+TIME_FIELDS = {"updated": "updated_at", "created": "created_at"}
+
+# Once this few candidates are left, lookups are verified per document
+VERIFY_BELOW = 64
+
+# Cancellation is checked every this many documents tested
+CHECK_EVERY = 512
+
+_UNITS = {"h": 3600, "d": 86400, "w": 7 * 86400, "m": 30 * 86400, "y": 365 * 86400}
+_DAY = 86400
+
+_UNCHECKED = object()
+
+_YES = {"yes", "true", "1", "да"}
+_NO = {"no", "false", "0", "нет"}
+
+_TOKEN = re.compile(
+    r"""
+    /(?P<regex>(?:\\.|[^/\\])+)/(?=\s|$)
+    | (?P<field>[a-z]+):(?:"(?P<quoted>[^"]*)"?|(?P<value>\S*))
+    | "(?P<phrase>[^"]*)"?
+    | (?P<word>\S+)
+    """,
+    re.VERBOSE,
+)
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)([hdwmy])")
+
+
+class Cancelled(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class Term:
+    field: str      # category, domain, login, ..., updated, weak, regex
+    value: object
+
+
+@dataclass(slots=True)
+class Query:
+    text: str = ""                      # free words, normalized
+    terms: list[Term] = field(default_factory=list)
+
+    @property
+    def is_plain(self) -> bool:
+        return not self.terms
+
+
+@dataclass(slots=True)
+class Predicate:
+    name: str
+    cost: int
+    test: Callable[[int], bool]
+    # Index lookup; `exact` if it needs no test afterwards
+    lookup: Callable[[], set[int] | list[int]] | None = None
+    exact: bool = True
+
+
+@dataclass(slots=True)
+class QueryResult:
+    ticket: int
+    rows: list[dict]
+    version: int     # store version the rows were taken at
+    error: str | None = None   # the query failed; rows are empty
+
+
+# =========================
+# Parsing
+# =========================
+
+def parse(text: str, now: float | None = None) -> Query:
+    now = time.time() if now is None else now
+    words = []
+    terms = []
+    for m in _TOKEN.finditer(text):
+        term = None
+        if m["regex"] is not None:
+            term = _regex_term(m["regex"])
+        elif m["field"] is not None:
+            value = m["quoted"] if m["quoted"] is not None else m["value"]
+            term = _field_term(m["field"], value, now)
+        if term is not None:
+            terms.append(term)
+        elif m["phrase"] is not None:
+            words.append(m["phrase"])
+        else:
+            words.append(m.group(0))
+    return Query(normalize(" ".join(w for w in words if w)), terms)
+
+
+def _field_term(name: str, value: str, now: float) -> Term | None:
+    if not value:
+        return None
+    if name in KEY_FIELDS or name in TEXT_FIELDS or name == "category":
+        return Term(name, normalize(value))
+    if name in TIME_FIELDS:
+        span = _time_span(value, now)
+        return Term(name, span) if span is not None else None
+    if name == "weak":
+        value = normalize(value)
+        if value in _YES or value in _NO:
+            return Term(name, value in _YES)
+    return None
+
+
+def _regex_term(pattern: str) -> Term | None:
+    try:
+        return Term("regex", re.compile(pattern, re.IGNORECASE | re.MULTILINE))
+    except re.error:
+        return None
+
+
+def _time_span(value: str, now: float) -> tuple[float, float] | None:
+    """
+    [low, high) timestamps for "<90d" (within 90 days), ">1y" (older
+    than a year), "<2024-05-01" (before), ">2024-05-01" (after) or
+    "2024-05-01" (that day).
+    """
+    op = value[:1] if value[:1] in "<>" else ""
+    value = value[len(op):].lstrip("=")
+
+    m = _DURATION.fullmatch(value)
+    if m:
+        since = now - float(m[1]) * _UNITS[m[2]]
+        if op == ">":
+            return float("-inf"), since
+        return since, float("inf")
+
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").timestamp()
+    except ValueError:
+        return None
+    if op == "<":
+        return float("-inf"), day
+    if op == ">":
+        return day + _DAY, float("inf")
+    return day, day + _DAY
+
+
+# =========================
+# Plans
+# =========================
+
+def compile_query(
+    query: Query,
+    index: SearchIndex,
+    categories: list[dict] = (),
+    is_weak: Callable[[str], bool] | None = None,
+    check: Callable[[], None] = lambda: None,
+    weak_verdicts: dict | None = None,
+) -> list[Predicate]:
+    """
+    Predicates of `query` over the documents of a built `index`.
+    `weak_verdicts` caches is_weak across queries, see above.
+    """
+    plan = []
+    if query.text:
+        text = query.text
+        plan.append(Predicate(
+            "text", 2, lambda d: text in index.text(d), lambda: index.lookup(text),
+        ))
+    for term in query.terms:
+        plan.append(_predicate(term, index, categories, is_weak, check, weak_verdicts))
+    return plan
+
+
+def _predicate(
+    term: Term,
+    index: SearchIndex,
+    categories,
+    is_weak,
+    check,
+    weak_verdicts,
+) -> Predicate:
+    name, value = term.field, term.value
+
+    if name == "category":
+        ids = [
+            c["id"] for c in categories
+            if value in (normalize(str(c.get("name", ""))), normalize(str(c["id"])))
+        ]
+
+        def in_categories():
+            docs = set()
+            for cid in ids:
+                docs |= index.category_docs(cid)
+            return docs
+
+        def test(d):
+            return dict.get(index.entry(d), "category_id", "all") in ids
+
+        return Predicate(name, 0, test, in_categories)
+
+    if name == "domain":
+        def test_key(key):
+            return key == value or key.endswith("." + value)
+
+        def test(d):
+            return test_key(fuzzy_keys(index.entry(d))[1])
+
+        return Predicate(name, 1, test, lambda: index.key_docs(name, test_key))
+
+    if name in KEY_FIELDS:
+        return Predicate(
+            name, 1,
+            lambda d: value in index.field(d, name),
+            lambda: index.key_docs(name, lambda key: value in key),
+        )
+
+    if name in TEXT_FIELDS:
+        return Predicate(
+            name, 2,
+            lambda d: value in index.field(d, name),
+            lambda: index.lookup(value),
+            exact=False,
+        )
+
+    if name in TIME_FIELDS:
+        low, high = value
+        field_name = TIME_FIELDS[name]
+        return Predicate(
+            name, 1,
+            lambda d: low <= index.time(d, field_name) < high,
+            lambda: index.time_docs(field_name, low, high),
+        )
+
+    if name == "regex":
+        def test(d):
+            # Field by field, so a cancel doesn't wait for the whole
+            # document; a pattern can't span two fields
+            for text in index.text(d).split("\n"):
+                check()
+                if value.search(text) is not None:
+                    return True
+            return False
+
+        return Predicate(name, 3, test)
+
+    if name == "weak":
+        verdicts = weak_verdicts if weak_verdicts is not None else {}
+
+        def test(d):
+            if is_weak is None:
+                return False
+            entry = index.entry(d)
+            stamp = index.time(d, "updated_at")
+            # nan (no timestamp) never equals itself
+            key = (dict.get(entry, "id"), stamp if stamp == stamp else None)
+            weak = verdicts.get(key, _UNCHECKED)
+            if weak is _UNCHECKED:
+                password = getattr(entry, "peek", entry.get)("password") or ""
+                weak = verdicts[key] = is_weak(password) if password else None
+            return weak is not None and weak == value
+
+        # Decrypts the record of a LazyEntry: always last
+        return Predicate(name, 4, test)
+
+    raise ValueError(f"Unknown query field: {name}")
+
+
+def run_plan(
+    plan: list[Predicate],
+    index: SearchIndex,
+    check: Callable[[], None] = lambda: None,
+) -> list[int]:
+    """
+    Documents matching every predicate, in no particular order.
+    """
+    candidates: set[int] | None = None
+    tests = []
+    for p in sorted(plan, key=lambda p: p.cost):
+        check()
+        if p.lookup is None or (candidates is not None and len(candidates) <= VERIFY_BELOW):
+            tests.append(p)
+            continue
+        found = p.lookup()
+        candidates = set(found) if candidates is None else candidates.intersection(found)
+        if not p.exact:
+            tests.append(p)
+
+    docs = list(candidates) if candidates is not None else index.live_docs()
+    for p in tests:
+        kept = []
+        for i, doc in enumerate(docs):
+            if not i % CHECK_EVERY:
+                check()
+            if p.test(doc):
+                kept.append(doc)
+        docs = kept
+    return docs
+
+
+def execute(
+    query: Query,
+    index: SearchIndex,
+    category_id: str = "all",
+    sort_field: str | None = None,
+    descending: bool = False,
+    categories: list[dict] = (),
+    is_weak: Callable[[str], bool] | None = None,
+    check: Callable[[], None] = lambda: None,
+    frecency: Frecency | None = None,
+    weak_verdicts: dict | None = None,
+) -> list[dict]:
+    """
+    Entries matching `query` in `category_id`. Plain text is ranked
+    (SearchIndex.rank) unless a sort field is given; everything else
+    comes in vault order, or most used first with `frecency`.
+    """
+    if query.is_plain and not query.text:
+        # No index needed for a whole category
+        rows = index.search("", category_id, sort_field, descending)
+    else:
+        index.prepare(check)
+        check()
+        if query.is_plain and sort_field is None:
+            return index.rank(query.text, category_id, frecency=frecency, check=check)
+        if query.is_plain:
+            return index.search(query.text, category_id, sort_field, descending, check)
+        plan = compile_query(query, index, categories, is_weak, check, weak_verdicts)
+        docs = run_plan(plan, index, check)
+        rows = index.select(docs, category_id, sort_field, descending, check)
+
+    if frecency is not None and sort_field is None:
+        check()
+        rows = frecency.ordered(rows)
+    return rows
+
+
+# =========================
+# Worker
+# =========================
+
+class QueryRunner:
+    """
+    Runs queries on a worker thread, newest only: submitting one
+    cancels the query in flight. Results go to `on_result` on the
+    worker thread; UIs hand them over to their own thread.
+
+    The worker reads the store and the index, so code changing them on
+    another thread does it inside paused().
+    """
+
+    def __init__(
+        self,
+        index: SearchIndex,
+        categories: list[dict] | None = None,
+        is_weak: Callable[[str], bool] | None = None,
+        on_result: Callable[[QueryResult], None] | None = None,
+        frecency: Frecency | None = None,
+    ):
+        self.index = index
+        self.categories = categories if categories is not None else []
+        self.is_weak = is_weak
+        self.on_result = on_result
+        self.frecency = frecency
+        self._weak_verdicts: dict = {}
+
+        self._cond = threading.Condition()
+        self._busy = threading.Lock()       # held while a query runs
+        self._job: tuple | None = None      # next to run
+        self._current: tuple | None = None  # taken by the worker
+        self._ticket = 0
+        self._generation = 0                # bumped to cancel
+        self._stopped = False
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="zippass-search",
+            daemon=True,
+        )
+        self._thread.start()
+
+    # =========================
+    # API
+    # =========================
+
+    def submit(
+        self,
+        text: str,
+        category_id: str = "all",
+        sort_field: str | None = None,
+        descending: bool = False,
+    ) -> int:
+        """
+        Queue a query; returns the ticket its QueryResult will carry.
+        """
+        query = parse(text)
+        with self._cond:
+            self._ticket += 1
+            self._job = (self._ticket, query, category_id, sort_field, descending)
+            self._generation += 1
+            self._cond.notify_all()
+            return self._ticket
+
+    def warm(self) -> None:
+        """
+        Prepare the index (core.search.SearchIndex.prepare) ahead of
+        the first query, unless one is already queued.
+        """
+        with self._cond:
+            if self._job is None:
+                self._job = (None, None, None, None, False)
+                self._cond.notify_all()
+
+    def cancel(self) -> None:
+        with self._cond:
+            self._job = None
+            self._generation += 1
+
+    @contextmanager
+    def paused(self):
+        """
+        Keep the worker off the store and the index. A query in flight
+        is cancelled and runs again afterwards.
+        """
+        with self._cond:
+            if self._job is None and self._current is not None:
+                self._job = self._current
+            self._generation += 1
+        with self._busy:
+            yield
+        with self._cond:
+            self._cond.notify_all()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._job = None
+            self._generation += 1
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    # =========================
+    # Worker
+    # =========================
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._job is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                job = self._current = self._job
+                self._job = None
+                generation = self._generation
+
+            def check():
+                if self._generation != generation:
+                    raise Cancelled()
+
+            result = None
+            with self._busy:
+                try:
+                    result = self._execute(job, check)
+                except Cancelled:
+                    pass
+                except Exception as e:
+                    # A failing query gets no rows; the worker lives on
+                    result = self._failed(job, e)
+            with self._cond:
+                self._current = None
+
+            if result is not None and self.on_result is not None:
+                self.on_result(result)
+
+    def _execute(self, job: tuple, check) -> QueryResult | None:
+        ticket, query, category_id, sort_field, descending = job
+        if query is None:
+            self.index.prepare(check)   # warm()
+            return None
+        version = self.index.store.version
+        rows = execute(
+            query, self.index, category_id, sort_field, descending,
+            categories=self.categories, is_weak=self.is_weak, check=check,
+            frecency=self.frecency, weak_verdicts=self._weak_verdicts,
+        )
+        check()
+        return QueryResult(ticket, rows, version)
+
+    def _failed(self, job: tuple, error: Exception) -> QueryResult | None:
+        ticket = job[0]
+        if ticket is None:
+            return None   # warm(): the next query prepares again
+        message = str(error) or type(error).__name__
+        return QueryResult(ticket, [], self.index.store.version, error=message)
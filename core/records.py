@@ -0,0 +1,694 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator
+
+from core import codec as codecs
+from core.compression import COMPRESS_NONE, Compression, CompressionStats, Compressor, decompress
+from core.crypto import CIPHER_FERNET, PayloadCipher
+
+# =====================
+# v2 record layout
+# =====================
+#
+# MAGIC | VERSION | u32 header_len | header JSON
+# records area:  one encrypted blob per entry, plus a row chunk
+#                (list-view fields + record offsets) after every
+#                INDEX_CHUNK_ROWS records, then the saved search
+#                index if there is one (core.search)
+# index blob:    meta, categories, row chunk and search offsets
+# footer:        u64 index_offset | u32 index_len
+#
+# Offsets are relative to the start of the records area. Files from
+# before row chunks keep all rows in the index blob ("entries").
+# Blobs use the header's "cipher" (Fernet tokens for older files,
+# raw AEAD nonce | ciphertext | tag otherwise). With a "compression"
+# header field the plaintext is compressed first (core.compression).
+# Plaintext is JSON unless the header names another codec (core.codec).
+
+HEADER_LEN = struct.Struct(">I")
+FOOTER = struct.Struct(">QI")
+
+# Header JSON is space-padded so it can be rewritten in place
+# (password change) without moving the records.
+HEADER_BLOCK = 1024
+HEADER_CAPACITY = 4 * HEADER_BLOCK
+
+# Fields kept in the index (what the list view paints)
+INDEX_FIELDS = ("id", "service", "login", "url", "category_id")
+
+# Rows per index chunk: bounds memory while saving and streaming,
+# and is the unit of work for the crypto thread pool
+INDEX_CHUNK_ROWS = 4096
+
+# Threads for chunk encryption / decryption (1 = no pool)
+WORKERS = min(4, os.cpu_count() or 1)
+
+# AEAD associated data: an index blob can't pass for a record
+AAD_RECORD = b"zippass:record"
+AAD_INDEX = b"zippass:index"
+AAD_ROWS = b"zippass:rows"
+AAD_SEARCH = b"zippass:search"
+
+# Held while a lazy entry reads its record and while a mapping closes.
+# A save holds it from closing the old mapping until the entries are
+# bound to the new file (core.vault.save_vault), so readers on other
+# threads (search, preview) wait instead of meeting a closed mapping.
+SOURCES_LOCK = threading.RLock()
+
+
+# =====================
+# Record file
+# =====================
+
+class RecordFile:
+    """
+    Read-only mmap of a v2 vault.
+    Entry records are decrypted on demand.
+    """
+
+    def __init__(self, path: str, key: bytes, start: int, header: dict | None = None):
+        self.path = path
+        self.key = key
+
+        self._map = None
+        self.reopen()
+
+        try:
+            if header is None:
+                header, self.base = read_header(self._map, start)
+            else:
+                # A header rewrite not copied over the mapped one yet
+                # (core.vault): same capacity, the mapped one may be torn
+                (size,) = HEADER_LEN.unpack_from(self._map, start)
+                self.base = start + HEADER_LEN.size + size
+            self.header = header
+            if len(self._map) < self.base + FOOTER.size:
+                raise ValueError("Truncated vault file")
+            self.cipher = PayloadCipher(self.header.get("cipher", CIPHER_FERNET), key)
+            self.compressed = "compression" in self.header
+            self.codec = codecs.from_header(self.header.get("codec"))
+            self.layout = blob_layout(self.header)
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def closed(self) -> bool:
+        return self._map is None
+
+    def reopen(self) -> None:
+        """
+        Map the file again after close(), e.g. when a save that closed
+        it failed and the file on disk is unchanged.
+        """
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        with SOURCES_LOCK:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def raw(self, offset: int, length: int) -> bytes:
+        if self._map is None:
+            raise ValueError("Vault record file is closed")
+        start = self.base + offset
+        return self._map[start:start + length]
+
+    def decrypt(self, offset: int, length: int, aad: bytes = AAD_RECORD) -> bytes:
+        """
+        Decrypt straight out of the mapping, without copying the blob.
+        """
+        if self._map is None:
+            raise ValueError("Vault record file is closed")
+        start = self.base + offset
+        # Views are released explicitly, or close() fails while a
+        # traceback still references them
+        with memoryview(self._map) as view, view[start:start + length] as blob:
+            return self.cipher.decrypt(blob, aad)
+
+    def read_record(self, offset: int, length: int) -> dict:
+        try:
+            data = self.decrypt(offset, length)
+            if self.compressed:
+                data = decompress(data)
+            return self.codec.decode_record(data)
+        except ValueError:
+            raise ValueError("Corrupted vault record")
+
+    def read_index(self) -> dict:
+        offset, length = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+        try:
+            data = self.decrypt(offset, length, AAD_INDEX)
+            if self.compressed:
+                data = decompress(data)
+        except ValueError:
+            raise ValueError("Invalid master password or corrupted vault")
+        return self.codec.decode(data)
+
+    def read_rows(self, offset: int, length: int) -> list[list]:
+        try:
+            data = self.decrypt(offset, length, AAD_ROWS)
+            if self.compressed:
+                data = decompress(data)
+        except ValueError:
+            raise ValueError("Corrupted vault index")
+        return self.codec.decode(data)
+
+    def read_search(self, offset: int, length: int) -> bytes | None:
+        """
+        Saved search index; None if it can't be read, it is only a cache.
+        """
+        try:
+            data = self.decrypt(offset, length, AAD_SEARCH)
+            return decompress(data) if self.compressed else data
+        except ValueError:
+            return None
+
+    def iter_rows(self, index: dict, workers: int | None = None) -> Iterator[list]:
+        """
+        Index rows, chunks decrypted in parallel but yielded in order.
+        """
+        for rows in self.iter_chunks(index, self.read_chunk, workers):
+            yield from rows
+
+    def iter_chunks(
+        self,
+        index: dict,
+        fn: Callable[[tuple], Any],
+        workers: int | None = None,
+    ) -> Iterator[Any]:
+        """
+        fn(chunk) for every row chunk of `index`, on the thread pool.
+        Files without row chunks are split into chunks of the in-index rows.
+        """
+        if "chunks" in index:
+            chunks = (("ref", offset, length) for offset, length, _ in index["chunks"])
+        else:
+            chunks = (("rows", rows) for rows in _batches(index["entries"]))
+        return map_ordered(fn, chunks, workers)
+
+    def read_chunk(self, chunk: tuple) -> list[list]:
+        if chunk[0] == "rows":
+            return chunk[1]
+        return self.read_rows(chunk[1], chunk[2])
+
+
+# =====================
+# Lazy entry
+# =====================
+
+class LazyEntry(dict):
+    """
+    Entry dict that only holds list-view fields until
+    something asks for the rest (password, note, ...).
+    """
+
+    __slots__ = ("_source",)
+
+    def __init__(self, fields: dict, source: tuple[RecordFile, int, int] | None):
+        super().__init__(fields)
+        self._source = source
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._source is None
+
+    def load(self) -> None:
+        if self._source is None:
+            return
+        with SOURCES_LOCK:
+            if self._source is None:
+                return   # loaded by another thread meanwhile
+            record, offset, length = self._source
+            full = record.read_record(offset, length)
+            if full.get("id") != dict.get(self, "id"):
+                raise ValueError("Corrupted vault record")
+            # Fields edited before the load win over the stored record.
+            # _source is cleared last so other threads never see half an entry.
+            for k, v in full.items():
+                dict.setdefault(self, k, v)
+            self._source = None
+
+    def peek(self, key, default=None):
+        """
+        Field value without keeping the decrypted record (search
+        indexing reads notes this way, not passwords into memory).
+        """
+        if self._source is None or dict.__contains__(self, key):
+            return dict.get(self, key, default)
+        with SOURCES_LOCK:
+            source = self._source
+            if source is None:
+                return dict.get(self, key, default)
+            record, offset, length = source
+            return record.read_record(offset, length).get(key, default)
+
+    def peek_many(self, keys, default=None) -> list:
+        """
+        Several fields like peek(), with at most one record read.
+        """
+        if self._source is None or all(dict.__contains__(self, k) for k in keys):
+            return [dict.get(self, k, default) for k in keys]
+        with SOURCES_LOCK:
+            source = self._source
+            if source is None:
+                return [dict.get(self, k, default) for k in keys]
+            record, offset, length = source
+            full = record.read_record(offset, length)
+        return [
+            dict.get(self, k) if dict.__contains__(self, k) else full.get(k, default)
+            for k in keys
+        ]
+
+    def raw_record(self, key: bytes, layout: tuple) -> bytes | None:
+        """
+        Stored ciphertext, if it can be reused as-is with `key` in a
+        file with the given blob_layout().
+        """
+        with SOURCES_LOCK:
+            if self._source is None:
+                return None
+            record, offset, length = self._source
+            if record.key != key or record.layout != layout or record.closed:
+                return None
+            return record.raw(offset, length)
+
+    def rebind(self, record: RecordFile, offset: int, length: int) -> None:
+        if self._source is not None:
+            self._source = (record, offset, length)
+
+    # ---- read access loads on demand ----
+
+    def __getitem__(self, key):
+        if self._source is not None and not dict.__contains__(self, key):
+            self.load()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if self._source is not None and not dict.__contains__(self, key):
+            self.load()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        if self._source is not None and not dict.__contains__(self, key):
+            self.load()
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self.load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.load()
+        return dict.__len__(self)
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        if other is self:
+            return True
+        # Different ids can't be equal: skip decrypting just to compare
+        if isinstance(other, dict) and dict.get(self, "id") != dict.get(other, "id"):
+            return False
+        self.load()
+        if isinstance(other, LazyEntry):
+            other.load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        self.load()
+        return dict.__repr__(self)
+
+    def keys(self):
+        self.load()
+        return dict.keys(self)
+
+    def values(self):
+        self.load()
+        return dict.values(self)
+
+    def items(self):
+        self.load()
+        return dict.items(self)
+
+    def copy(self):
+        self.load()
+        return dict(self)
+
+    def pop(self, *args):
+        self.load()
+        return dict.pop(self, *args)
+
+    def setdefault(self, key, default=None):
+        self.load()
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self.load()
+        dict.update(self, *args, **kwargs)
+
+
+# =====================
+# Read / write
+# =====================
+
+def build(
+    vault: dict,
+    key: bytes,
+    header: dict,
+    workers: int | None = None,
+    search: bytes | None = None,
+) -> tuple[Iterator[bytes], list[tuple[dict, int, int]], CompressionStats | None]:
+    """
+    Serialize vault into v2 chunks (everything after MAGIC + VERSION).
+    `search` is an encoded search index (core.search) to save with it.
+    Chunks are produced lazily while the file is written, so only a few
+    row chunks of ciphertext are held at a time. Batches of records are
+    encrypted on `workers` threads (default WORKERS). Unloaded lazy
+    entries are copied as ciphertext, never decrypted.
+    Returns the chunk iterator plus (entry, offset, length) for every
+    lazy entry and compression statistics (None without compression),
+    both filled in as the iterator is consumed.
+    """
+    cipher = PayloadCipher(header.get("cipher", CIPHER_FERNET), key)
+    codec = codecs.from_header(header.get("codec"))
+    layout = blob_layout(header)
+
+    settings = None
+    stats = None
+    if "compression" in header:
+        settings = Compression.from_header(header["compression"])
+        stats = CompressionStats(settings.name, settings.level)
+
+    placed = []
+
+    def encrypt_batch(batch: list) -> tuple[list[bytes], CompressionStats | None]:
+        # Own compressor per batch: workers must not share statistics
+        compressor = Compressor(settings) if settings else None
+        tokens = []
+        for entry in batch:
+            token = None
+            if isinstance(entry, LazyEntry):
+                token = entry.raw_record(key, layout)
+            if token is None:
+                data = codec.encode_record(dict(entry))
+                if compressor:
+                    data = compressor.compress(data)
+                token = cipher.encrypt(data, AAD_RECORD)
+            tokens.append(token)
+        return tokens, compressor.stats if compressor else None
+
+    def pack(data: bytes) -> bytes:
+        if not settings:
+            return data
+        compressor = Compressor(settings)
+        packed = compressor.compress(data)
+        stats.add(compressor.stats)
+        return packed
+
+    def chunks() -> Iterator[bytes]:
+        yield encode_header(header)
+
+        row_chunks = []
+        offset = 0
+
+        entries = vault["entries"]
+
+        for batch, (tokens, batch_stats) in zip(
+            _batches(entries),
+            map_ordered(encrypt_batch, _batches(entries), workers),
+        ):
+            if batch_stats:
+                stats.add(batch_stats)
+
+            rows = []
+            for entry, token in zip(batch, tokens):
+                yield token
+                if isinstance(entry, LazyEntry):
+                    placed.append((entry, offset, len(token)))
+                rows.append(
+                    [dict.get(entry, f, "") for f in INDEX_FIELDS]
+                    + [offset, len(token)]
+                )
+                offset += len(token)
+
+            # Row chunks sit right after the records they describe
+            token = cipher.encrypt(pack(codec.encode(rows)), AAD_ROWS)
+            row_chunks.append([offset, len(token), len(rows)])
+            offset += len(token)
+            yield token
+
+        index = {
+            "meta": vault.get("meta", {}),
+            "categories": vault["categories"],
+            "fields": list(INDEX_FIELDS),
+            "chunks": row_chunks,
+        }
+
+        if search is not None:
+            # Stored: mostly document numbers, which compress slowly
+            # and not much
+            data = Compression(COMPRESS_NONE).compress(search) if settings else search
+            token = cipher.encrypt(data, AAD_SEARCH)
+            index["search"] = [offset, len(token)]
+            offset += len(token)
+            yield token
+        index_token = cipher.encrypt(pack(codec.encode(index)), AAD_INDEX)
+
+        yield index_token
+        yield FOOTER.pack(offset, len(index_token))
+
+    return chunks(), placed, stats
+
+
+def set_workers(count: int) -> None:
+    global WORKERS
+    WORKERS = max(1, count)
+
+
+def _batches(items: list) -> Iterator[list]:
+    for i in range(0, len(items), INDEX_CHUNK_ROWS):
+        yield items[i:i + INDEX_CHUNK_ROWS]
+
+
+def map_ordered(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    workers: int | None = None,
+) -> Iterator[Any]:
+    """
+    map() on a thread pool, results in order. At most two items per
+    worker are in flight, so memory stays bounded on long inputs.
+    The cryptography primitives release the GIL while they work.
+    """
+    if workers is None:
+        workers = WORKERS
+
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="zippass-crypto") as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def blob_layout(header: dict) -> tuple:
+    """
+    Everything in the header that decides how a record blob decodes.
+    """
+    return (
+        header.get("cipher", CIPHER_FERNET),
+        "compression" in header,
+        json.dumps(header.get("codec"), sort_keys=True),
+    )
+
+
+def encode_header(header: dict, capacity: int | None = None) -> bytes:
+    """
+    u32 capacity + header JSON padded with spaces to `capacity`.
+    Raises ValueError if the header does not fit.
+    """
+    data = json.dumps(header).encode("utf-8")
+
+    if capacity is None:
+        blocks = -(-len(data) // HEADER_BLOCK)
+        capacity = max(HEADER_CAPACITY, blocks * HEADER_BLOCK)
+
+    if len(data) > capacity:
+        raise ValueError("Vault header does not fit")
+
+    return HEADER_LEN.pack(capacity) + data + b" " * (capacity - len(data))
+
+
+def read_header(data: bytes | mmap.mmap, start: int) -> tuple[dict, int]:
+    """
+    Parse plaintext header at `start`.
+    Returns header and offset of the records area.
+    """
+    (size,) = HEADER_LEN.unpack_from(data, start)
+    begin = start + HEADER_LEN.size
+    header = json.loads(bytes(data[begin:begin + size]).decode("utf-8"))
+    return header, begin + size
+
+
+def open_records(
+    path: str,
+    key: bytes,
+    start: int,
+    header: dict | None = None,
+) -> tuple[dict, dict]:
+    """
+    Map a v2 vault and decrypt its index.
+    Entries come back as LazyEntry objects bound to the mapping; the
+    saved search index, if any, as decrypted bytes in "search".
+    Returns the vault and the header of the mapped file, or `header`,
+    which replaces it (see RecordFile).
+    """
+    record, index = _open_index(path, key, start, header)
+    try:
+        entries = list(_iter_lazy(record, index))
+        search = record.read_search(*index["search"]) if "search" in index else None
+    except Exception:
+        record.close()
+        raise
+
+    vault = {
+        "meta": index.get("meta", {}),
+        "categories": index["categories"],
+        "entries": entries,
+    }
+    if search is not None:
+        vault["search"] = search
+    return vault, record.header
+
+
+def stream_records(
+    path: str,
+    key: bytes,
+    start: int,
+    header: dict | None = None,
+) -> tuple[dict, dict, Iterator[dict]]:
+    """
+    Like open_records, but entries are decrypted in full and yielded
+    one row chunk at a time instead of being collected.
+    Returns the vault without "entries", the header and the entry
+    iterator, which closes the mapping when exhausted or discarded.
+    """
+    record, index = _open_index(path, key, start, header)
+
+    fields = index.get("fields", INDEX_FIELDS)
+
+    def load_chunk(chunk: tuple) -> list[dict]:
+        # Runs on the pool: the row chunk and every record in it
+        entries = []
+        for row in record.read_chunk(chunk):
+            *values, offset, length = row
+            entry = LazyEntry(dict(zip(fields, values)), (record, offset, length))
+            entry.load()
+            entries.append(dict.copy(entry))
+        return entries
+
+    def entries() -> Iterator[dict]:
+        try:
+            for chunk in record.iter_chunks(index, load_chunk):
+                yield from chunk
+        finally:
+            record.close()
+
+    vault = {
+        "meta": index.get("meta", {}),
+        "categories": index["categories"],
+    }
+    return vault, record.header, entries()
+
+
+def _open_index(
+    path: str,
+    key: bytes,
+    start: int,
+    header: dict | None,
+) -> tuple[RecordFile, dict]:
+    record = RecordFile(path, key, start, header)
+    try:
+        return record, record.read_index()
+    except Exception:
+        record.close()
+        raise
+
+
+def _iter_lazy(record: RecordFile, index: dict) -> Iterator[LazyEntry]:
+    fields = index.get("fields", INDEX_FIELDS)
+    for row in record.iter_rows(index):
+        *values, offset, length = row
+        yield LazyEntry(dict(zip(fields, values)), (record, offset, length))
+
+
+def rebind(placed: Iterable[tuple[Any, int, int]], record: RecordFile) -> None:
+    for entry, offset, length in placed:
+        if isinstance(entry, LazyEntry):
+            entry.rebind(record, offset, length)
+
+
+def peek_fields(entry: dict, fields: tuple[str, ...]) -> list:
+    """
+    Field values, read from a LazyEntry without loading it.
+    """
+    peek_many = getattr(entry, "peek_many", None)
+    if peek_many is not None:
+        return peek_many(fields)
+    return [entry.get(f) for f in fields]
+
+
+def snapshot_entry(entry: dict) -> dict:
+    if isinstance(entry, LazyEntry) and not entry.is_loaded:
+        return entry
+    return dict(entry)
+
+
+def sources(vault: dict) -> list[RecordFile]:
+    """
+    Record files still referenced by unloaded entries of `vault`.
+    """
+    entries = vault.get("entries", [])
+    pager = getattr(entries, "pager", entries)   # core.entry_store.EntryStore
+    if hasattr(pager, "sources"):
+        # Paged SQLite entries: don't page everything in to find out
+        return pager.sources()
+
+    found = {}
+    for entry in entries:
+        if isinstance(entry, LazyEntry) and entry._source is not None:
+            record = entry._source[0]
+            found[id(record)] = record
+    return list(found.values())
+
+
+def release(vault: dict) -> None:
+    """
+    Close the mmap behind a loaded vault, e.g. before overwriting the file.
+    Entries that were never loaded become unusable.
+    """
+    for record in sources(vault):
+        record.close()
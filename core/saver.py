@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from core import journal, storage
+from core.search import SearchIndex
+from core.vault import (
+    journal_changes,
+    needs_compaction,
+    save_search_index,
+    save_vault,
+    snapshot_vault,
+)
+
+if TYPE_CHECKING:
+    from core.session import Session
+
+# Dirty notifications within SAVE_DELAY of each other are written together,
+# but nothing waits longer than SAVE_MAX_DELAY.
+SAVE_DELAY = 1.0
+SAVE_MAX_DELAY = 5.0
+
+
+@dataclass(slots=True)
+class SaveState:
+    pending: bool
+    saving: bool
+    last_saved: float | None
+    last_stats: storage.WriteStats | None
+    error: str | None
+
+
+class VaultSaver:
+    """
+    Write-behind saver.
+    Collects change records from the session, coalesces them and writes
+    them to the journal on a worker thread. When the journal needs
+    compaction, the next notification captures a snapshot of the vault
+    (on the notifying thread, so it is consistent with the edits) and
+    the worker serializes and writes it.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        delay: float = SAVE_DELAY,
+        max_delay: float = SAVE_MAX_DELAY,
+    ):
+        self.session = session
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._changes: dict = {}
+        self._snapshot: dict | None = None
+        self._first_dirty: float | None = None
+        self._last_dirty: float | None = None
+        self._compact_due = False
+        self._saving = False
+        self._stopped = False
+        # Another process holds the writer lock: no write can succeed
+        self._busy = False
+
+        self._last_saved: float | None = None
+        self._last_stats: storage.WriteStats | None = None
+        self._error: str | None = None
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="zippass-saver",
+            daemon=True,
+        )
+        self._thread.start()
+
+    # =========================
+    # API
+    # =========================
+
+    def mark_dirty(self, changes: list[dict]) -> None:
+        """
+        Queue change records. The vault must already contain them.
+        Never touches the disk.
+        """
+        with self._cond:
+            if self._busy:
+                return
+            if self._compact_due:
+                # Snapshot already includes these changes
+                self._snapshot = snapshot_vault(self.session.vault)
+                self._changes.clear()
+                self._compact_due = False
+            else:
+                journal.merge_changes(self._changes, changes)
+
+            now = time.monotonic()
+            if self._first_dirty is None:
+                self._first_dirty = now
+            self._last_dirty = now
+            self._cond.notify_all()
+
+    def flush(self) -> bool:
+        """
+        Write everything queued on the calling thread.
+        Returns False if the write failed.
+        """
+        with self._cond:
+            while self._saving:
+                self._cond.wait()
+            batch = self._take()
+
+        if batch is None:
+            return self._error is None
+        return self._write(batch)
+
+    def stop(self) -> bool:
+        """
+        Final flush (compacting if the journal asked for it) and
+        worker shutdown. Call before the session drops the vault.
+        A search index built this session is saved last.
+        Returns False if the flush failed; unless the vault is busy
+        (storage.VaultBusy) the worker keeps running and retrying, so
+        the session can stay unlocked instead of losing the changes.
+        """
+        with self._cond:
+            if self._compact_due:
+                self._snapshot = snapshot_vault(self.session.vault)
+                self._changes.clear()
+                self._compact_due = False
+
+        ok = self.flush()
+        with self._cond:
+            if not ok and not self._busy:
+                return False
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+        if ok:
+            self.save_index()
+        return ok
+
+    def save_index(self) -> threading.Thread | None:
+        """
+        Save a search index built this session (save_search_index) on a
+        thread of its own, so locking or closing doesn't wait for it
+        to be encoded. Call on the thread that edits the vault: the
+        index is snapshotted here. Returns the thread, None if there
+        is nothing to save.
+        """
+        session = self.session
+        index = session.vault.get("search")
+        if self._busy or not isinstance(index, SearchIndex) or not index.needs_save:
+            return None
+        snapshot = index.snapshot()
+        if snapshot is None:
+            return None
+
+        vault = {"meta": dict(session.vault.get("meta", {})), "search": snapshot}
+        # Not a daemon: an app exiting right after still finishes the file
+        thread = threading.Thread(
+            target=_save_index,
+            args=(vault, session.key, session.vault_path),
+            name="zippass-index",
+        )
+        thread.start()
+        return thread
+
+    def state(self) -> SaveState:
+        with self._cond:
+            return SaveState(
+                pending=self._has_pending(),
+                saving=self._saving,
+                last_saved=self._last_saved,
+                last_stats=self._last_stats,
+                error=self._error,
+            )
+
+    # =========================
+    # Worker
+    # =========================
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    wait = self._wait_time()
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(wait)
+
+                if self._stopped:
+                    return
+
+                batch = self._take()
+
+            if batch is not None:
+                self._write(batch)
+
+    def _has_pending(self) -> bool:
+        return bool(self._changes) or self._snapshot is not None
+
+    def _wait_time(self) -> float | None:
+        """
+        Seconds until the queued batch is due, None if nothing is queued.
+        """
+        if self._saving or self._busy or not self._has_pending():
+            return None
+        due = min(
+            self._last_dirty + self.delay,
+            self._first_dirty + self.max_delay,
+        )
+        return due - time.monotonic()
+
+    def _take(self):
+        if not self._has_pending():
+            return None
+
+        batch = (self._snapshot, list(self._changes.values()))
+        self._snapshot = None
+        self._changes = {}
+        self._first_dirty = None
+        self._last_dirty = None
+        self._saving = True
+        return batch
+
+    def _write(self, batch) -> bool:
+        snapshot, changes = batch
+        session = self.session
+        stats = None
+        error = None
+        busy = False
+        compact = False
+
+        try:
+            if snapshot is not None:
+                stats = save_vault(snapshot, session.key, session.vault_path)
+                # The session's copy of meta tags the next saved index
+                session.vault.setdefault("meta", {})["revision"] = snapshot["meta"]["revision"]
+            if changes:
+                stats = journal_changes(changes, session.key, session.vault_path)
+                compact = needs_compaction(session.vault_path)
+        except storage.VaultBusy as e:
+            error = str(e)
+            busy = True
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        with self._cond:
+            self._saving = False
+
+            if error is None:
+                self._last_saved = time.time()
+                self._last_stats = stats
+                self._error = None
+                self._compact_due = self._compact_due or compact
+            elif busy:
+                # Read-only session (core.session): retrying can't help,
+                # drop everything instead of failing every second
+                self._error = error
+                self._busy = True
+                self._snapshot = None
+                self._changes = {}
+                self._first_dirty = None
+                self._last_dirty = None
+            else:
+                self._error = error
+                self._requeue(snapshot, changes)
+
+            self._cond.notify_all()
+
+        return error is None
+
+    def _requeue(self, snapshot, changes) -> None:
+        """
+        Put a failed batch back in front of anything queued since.
+        """
+        if snapshot is not None and self._snapshot is None:
+            self._snapshot = snapshot
+
+        # A newer snapshot already covers the failed records
+        if self._snapshot is None or self._snapshot is snapshot:
+            merged: dict = {}
+            journal.merge_changes(merged, changes)
+            journal.merge_changes(merged, self._changes.values())
+            self._changes = merged
+
+        now = time.monotonic()
+        self._first_dirty = now
+        self._last_dirty = now
+
+
+def _save_index(vault: dict, key, path: str) -> None:
+    try:
+        save_search_index(vault, key, path)
+    except Exception:
+        pass   # only a cache: built again on the next unlock
@@ -0,0 +1,1151 @@
+from __future__ import annotations
+
+import bisect
+import heapq
+import json
+import math
+import struct
+import sys
+import unicodedata
+from array import array
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Iterable
+
+from core.domains import domain_of
+from core.records import peek_fields
+
+if TYPE_CHECKING:
+    from core.frecency import Frecency
+
+# =====================
+# Entry search index
+# =====================
+#
+# Substring search and sorting over the whole vault, for views that
+# only show a page of it (ui_qt EntriesModel, ui.main).
+#
+# Every entry gets a document number and one normalized text: its
+# SEARCH_FIELDS joined by "\n". Trigram postings map each three-letter
+# slice of those texts to document numbers. A query is looked up by
+# intersecting the postings of its rarest trigrams, then verified with
+# a plain substring test. Single characters and pairs get postings too,
+# so a query of up to three letters (the first keystrokes) is answered
+# by one posting instead of scanning every text. Edited entries get a new document number;
+# the old one is left as a tombstone until compaction. Every entry also
+# keeps the sequence number it was first indexed with, which is its
+# position in vault order (EntryStore keeps insertion order).
+
+SEARCH_FIELDS = ("service", "login", "url", "note")
+
+# Timestamps kept sorted for range lookups (core.query updated:<90d)
+TIME_FIELDS = ("updated_at", "created_at")
+
+# Candidates below this are verified directly, without more postings
+_INTERSECT_LIMIT = 64
+
+# A posting is intersected only if it is at most this many times
+# longer than the candidates left; otherwise verifying them is cheaper
+_INTERSECT_RATIO = 2
+
+# Queries whose rarest trigram is in more than this share of the
+# documents scan the texts instead: cheaper than building the set
+_SCAN_SHARE = 0.25
+
+# Postings are rebuilt once tombstones outnumber live documents
+_COMPACT_RATIO = 1.0
+
+# Long loops (build, restore, queries) call their check function
+# every this many items; it may raise to cancel (core.query)
+_CHECK_EVERY = 512
+
+# Texts a full scan goes through between checks
+_SCAN_CHUNK = 8192
+
+
+def _no_check() -> None:
+    pass
+
+
+def normalize(text: str) -> str:
+    if text.isascii():
+        return text.lower()
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def entry_text(entry: dict) -> str:
+    """
+    Normalized SEARCH_FIELDS of an entry (or of any dict of them).
+    Unloaded entries have their note read without being loaded.
+    """
+    return _text(peek_fields(entry, SEARCH_FIELDS))
+
+
+def _text(values) -> str:
+    return "\n".join(
+        normalize(str(v or "")).replace("\n", " ") for v in values
+    )
+
+
+def _time(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def matches(text: str, query: str) -> bool:
+    """
+    `query` must already be normalized.
+    """
+    return query in text
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _grams(text: str) -> set[str]:
+    """
+    Posting keys of a text: its trigrams, pairs and characters.
+    """
+    grams = trigrams(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    grams.update(text)
+    return grams
+
+
+# =====================
+# Fuzzy ranking
+# =====================
+#
+# Typos and abbreviations ("gthb" for github) are matched against three
+# keys per entry: service, domain of the url and login. A key scores by
+# the best of: substring (earlier is better), subsequence (tighter is
+# better, word starts count extra) and edit distance within
+# len(query) // 4 typos. Keys are weighted, and only the best
+# RANK_LIMIT entries are kept, in a heap.
+#
+# Vaults repeat keys a lot (one domain, many logins), so the index maps
+# every distinct key to its documents and scores each key once per
+# query. A key missing more query characters than typos allowed (by a
+# 64-bit character mask) is skipped without scoring.
+
+FUZZY_WEIGHTS = (10, 9, 6)   # service, domain, login
+RANK_LIMIT = 100
+
+# Keys scored for typos per query, fewest missing characters first.
+# Edit distance is the costly part of ranking; without a cap a query
+# with few matches measured every key of the vault.
+_TYPO_KEYS = 128
+
+_BOUNDARY = " .-_@/:"
+
+
+def fuzzy_keys(entry: dict) -> tuple[str, str, str]:
+    try:
+        domain = domain_of(str(entry.get("url") or ""))
+    except ValueError:
+        domain = ""   # malformed url
+    return (
+        normalize(str(entry.get("service") or "")),
+        domain,
+        normalize(str(entry.get("login") or "")),
+    )
+
+
+def char_mask(text: str) -> int:
+    mask = 0
+    for ch in text:
+        if "a" <= ch <= "z":
+            mask |= 1 << (ord(ch) - 97)
+        elif "0" <= ch <= "9":
+            mask |= 1 << (ord(ch) - 22)
+        elif ch not in _BOUNDARY:
+            mask |= 1 << (36 + ord(ch) % 27)
+    return mask
+
+
+def max_typos(query: str) -> int:
+    return len(query) // 4
+
+
+def fuzzy_score(query: str, key: str, typos: int) -> int:
+    """
+    0 for no match; `query` must already be normalized.
+    """
+    return match_score(query, key) or typo_score(query, key, typos)
+
+
+def match_score(query: str, key: str) -> int:
+    """
+    Substring or subsequence score, 0 if `query` is neither.
+    """
+    i = key.find(query)
+    if i >= 0:
+        score = 300 - min(i, 50)
+        if i == 0 or key[i - 1] in _BOUNDARY:
+            score += 100
+        if len(key) == len(query):
+            score += 100
+        return score
+
+    positions = []
+    start = 0
+    for ch in query:
+        j = key.find(ch, start)
+        if j < 0:
+            return 0
+        positions.append(j)
+        start = j + 1
+    span = positions[-1] - positions[0] + 1 - len(query)
+    starts = sum(1 for j in positions if j == 0 or key[j - 1] in _BOUNDARY)
+    return max(1, 150 - 5 * span - min(positions[0], 20) + 10 * starts)
+
+
+def typo_score(query: str, key: str, typos: int) -> int:
+    """
+    Score for `query` within `typos` edits of the key, one of its
+    words or its prefix. The first letter has to be right.
+    """
+    if not typos or not query:
+        return 0
+    best = typos + 1
+    for target in _typo_targets(key, len(query)):
+        if target[0] == query[0] and abs(len(target) - len(query)) <= typos:
+            best = min(best, edit_distance(query, target, typos))
+    if best <= typos:
+        return 60 - 20 * best
+    return 0
+
+
+@lru_cache(maxsize=65536)
+def _typo_targets(key: str, length: int) -> tuple[str, ...]:
+    targets = {key, key[:length]}
+    word = ""
+    for ch in key:
+        if ch in _BOUNDARY:
+            if word:
+                targets.add(word)
+            word = ""
+        else:
+            word += ch
+    if word:
+        targets.add(word)
+    targets.discard("")
+    return tuple(targets)
+
+
+@lru_cache(maxsize=65536)
+def _word_starts(key: str) -> frozenset[str]:
+    """
+    First letters of the _typo_targets of `key`.
+    """
+    return frozenset(
+        ch for j, ch in enumerate(key)
+        if j == 0 or (key[j - 1] in _BOUNDARY and ch not in _BOUNDARY)
+    )
+
+
+@lru_cache(maxsize=1024)
+def _char_bits(text: str) -> dict[str, int]:
+    """
+    Character -> bit mask of its positions in `text`.
+    """
+    bits: dict[str, int] = {}
+    for i, ch in enumerate(text):
+        bits[ch] = bits.get(ch, 0) | 1 << i
+    return bits
+
+
+# Keys share prefixes and words ("service-1" for service-10..19), so a
+# query meets the same targets over and over
+@lru_cache(maxsize=65536)
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Levenshtein distance counting a swap of neighbours as one edit,
+    or limit + 1 once it is over `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a:
+        return min(len(b), limit + 1)
+    # Bit-parallel, one column of the DP table per character of `b`
+    # held as vertical deltas in two ints (Hyyro 2003, with swaps)
+    peq = _char_bits(a)
+    mask = (1 << len(a)) - 1
+    high = 1 << (len(a) - 1)
+    vp, vn, d0, pm_before, distance = mask, 0, 0, 0, len(a)
+    for ch in b:
+        pm = peq.get(ch, 0)
+        d0 = ((~d0 & pm) << 1 & pm_before) | (((pm & vp) + vp) ^ vp) | pm | vn
+        hp = vn | (~(d0 | vp) & mask)
+        hn = d0 & vp
+        if hp & high:
+            distance += 1
+        elif hn & high:
+            distance -= 1
+        hp = (hp << 1 | 1) & mask
+        hn = hn << 1 & mask
+        vp = hn | (~(d0 | hp) & mask)
+        vn = hp & d0
+        pm_before = pm
+    return min(distance, limit + 1)
+
+
+# =====================
+# Saved index
+# =====================
+#
+# A built index is saved with the vault, or after it in <vault>.search
+# (core.vault.save_search_index), and encrypted like the rest of it
+# (core.records, core.sqlite_vault), so unlocking restores it
+# instead of reading and tokenizing every entry again. The copy is
+# tagged with the vault's content revision, meta["revision"], bumped by
+# every save that writes entries; a copy with another tag is ignored.
+# Entries changed by journal records after the snapshot are re-indexed
+# on restore. Anything that doesn't add up is rebuilt on the search
+# thread, like before.
+#
+#   u32 header_len | header JSON | seqs | times per TIME_FIELDS |
+#   posting lengths | posting documents
+#
+# The header holds the strings (ids, texts, fuzzy keys, trigrams);
+# arrays are little-endian and their lengths follow from it.
+
+SAVED_FORMAT = 2
+
+_SAVED_HEADER = struct.Struct("<I")
+
+
+@dataclass(slots=True)
+class SavedIndex:
+    """
+    Decrypted saved index of a loaded vault, for SearchIndex.for_vault.
+    """
+    data: bytes
+    revision: int                       # meta["revision"] it must carry
+    changed: set[str] = field(default_factory=set)   # ids re-indexed on restore
+
+
+@dataclass(slots=True)
+class IndexSnapshot:
+    """
+    SearchIndex state at one point (SearchIndex.snapshot). Postings
+    are shared with the index: they only grow, and documents added
+    later are cut off when encoding.
+    """
+    ids: list
+    texts: list
+    fuzzy: list
+    seqs: array
+    times: list[array]
+    postings: dict[str, array]
+    next_seq: int
+    ordered: bool
+    dead: int
+
+    def encode(self, revision: int) -> bytes:
+        count = len(self.texts)
+        grams = []
+        lengths = array("I")
+        docs = array("i")
+        for gram, posting in self.postings.items():
+            if posting and posting[-1] >= count:
+                posting = posting[:bisect.bisect_left(posting, count)]
+            if posting:
+                grams.append(gram)
+                lengths.append(len(posting))
+                docs.extend(posting)
+
+        header = json.dumps({
+            "format": SAVED_FORMAT,
+            "revision": revision,
+            "ids": self.ids,
+            "texts": self.texts,
+            "fuzzy": self.fuzzy,
+            "grams": grams,
+            "next_seq": self.next_seq,
+            "ordered": self.ordered,
+            "dead": self.dead,
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        parts = [_SAVED_HEADER.pack(len(header)), header]
+        for values in (self.seqs, *self.times, lengths, docs):
+            if sys.byteorder != "little":
+                values = array(values.typecode, values)
+                values.byteswap()
+            parts.append(values.tobytes())
+        return b"".join(parts)
+
+
+def _decode(data: bytes) -> dict:
+    view = memoryview(data)
+    (size,) = _SAVED_HEADER.unpack_from(view)
+    start = _SAVED_HEADER.size + size
+    state = json.loads(bytes(view[_SAVED_HEADER.size:start]).decode("utf-8"))
+
+    def take(typecode: str, count: int) -> array:
+        nonlocal start
+        values = array(typecode)
+        stop = start + count * values.itemsize
+        if stop > len(data):
+            raise ValueError("Truncated saved index")
+        values.frombytes(view[start:stop])
+        if sys.byteorder != "little":
+            values.byteswap()
+        start = stop
+        return values
+
+    count = len(state["ids"])
+    state["seqs"] = take("q", count)
+    state["times"] = [take("d", count) for _ in TIME_FIELDS]
+    lengths = take("I", len(state["grams"]))
+    docs = take("i", sum(lengths))
+    if start != len(data):
+        raise ValueError("Corrupted saved index")
+
+    postings = {}
+    offset = 0
+    for gram, length in zip(state.pop("grams"), lengths):
+        postings[gram] = docs[offset:offset + length]
+        offset += length
+    state["postings"] = postings
+    state["fuzzy"] = [tuple(keys) if keys is not None else None for keys in state["fuzzy"]]
+    return state
+
+
+# Document whose entry is only looked up in the store when a query
+# returns it (restored from a saved index)
+_UNBOUND = object()
+
+
+class SearchIndex:
+    """
+    Trigram index over the entries of an EntryStore, built on the
+    first search and kept up to date through changed(). Entries
+    changed without changed() being called are caught by the store's
+    version and trigger a rebuild.
+    """
+
+    def __init__(self, store, saved: SavedIndex | None = None):
+        self.store = store
+        self._version = None
+
+        self._docs: dict[str, int] = {}          # entry id -> document
+        self._texts: list[str | None] = []       # None: tombstone
+        self._ids: list[str | None] = []
+        self._entries: list = []                 # dict, None or _UNBOUND
+        self._unbound = False
+        self._seqs = array("q")                  # document -> vault order
+        self._next_seq = 0
+        self._ordered = True                     # seqs increase with docs
+        self._postings: dict[str, array] = {}
+        self._fuzzy: list[tuple[str, str, str] | None] = []
+        # Per fuzzy key field: key -> documents, and key -> char mask
+        self._by_key: list[dict[str, set[int]]] = [{}, {}, {}]
+        self._key_masks: dict[str, int] = {}
+        # Per TIME_FIELDS: document -> timestamp (nan if missing), and
+        # (timestamp, document) pairs, sorted on first lookup
+        self._times = [array("d") for _ in TIME_FIELDS]
+        self._by_time: list[list[tuple[float, int]]] = [[] for _ in TIME_FIELDS]
+        self._time_sorted = [True for _ in TIME_FIELDS]
+        self._dead = 0
+        self._resets = 0
+
+        # Saved copy to restore instead of building (see "Saved index"),
+        # usable while the store is unchanged since the vault was loaded
+        self._saved = saved
+        self._saved_version = store.version
+        self._persisted = False
+
+    @classmethod
+    def for_vault(cls, vault: dict) -> SearchIndex:
+        """
+        Index of vault["entries"], restored from the copy loaded with
+        the vault if it has one. Saves of the vault save this index.
+        """
+        saved = vault.get("search")
+        index = cls(vault["entries"], saved if isinstance(saved, SavedIndex) else None)
+        vault["search"] = index
+        return index
+
+    @property
+    def is_built(self) -> bool:
+        return self._version == self.store.version
+
+    @property
+    def needs_save(self) -> bool:
+        """
+        Built, but not from a copy the vault already holds.
+        """
+        return self.is_built and not self._persisted
+
+    # =========================
+    # Maintenance
+    # =========================
+
+    def build(self, check: Callable[[], None] | None = None) -> None:
+        """
+        `check` is called every few hundred entries and may raise to
+        abandon the build (core.query cancellation); the index is then
+        left unbuilt.
+        """
+        self._version = None
+        self._saved = None
+        self._persisted = False
+        self._reset()
+        version = self.store.version
+        for i, entry in enumerate(self.store):
+            if check is not None and not i % _CHECK_EVERY:
+                check()
+            self._add(entry)
+        self._version = version
+
+    def changed(self, ids: Iterable[str]) -> None:
+        """
+        Re-index entries that were added, edited or removed by the
+        latest store mutation. Call once per mutation.
+        """
+        if self._version is None:
+            return   # not built yet: nothing to keep up to date
+        if self.store.version not in (self._version, self._version + 1):
+            self._version = None   # missed a change: rebuild on next search
+            return
+        for entry_id in ids:
+            seq = self._remove(entry_id)
+            entry = self.store.get(entry_id)
+            if entry is not None:
+                self._add(entry, seq=seq)
+        self._version = self.store.version
+
+    def prepare(self, check: Callable[[], None] | None = None) -> None:
+        """
+        Build the index if it is out of date (restoring the saved copy
+        if there is a valid one), or compact it once tombstones pile
+        up. Queries call this first, so the work lands on whichever
+        thread runs them (core.query.QueryRunner).
+        """
+        if not self.is_built:
+            saved, self._saved = self._saved, None
+            try:
+                restored = (saved is not None
+                            and self.store.version == self._saved_version
+                            and self.restore(saved, check))
+            except BaseException:
+                self._saved = saved   # cancelled: restore next time
+                raise
+            if not restored:
+                self.build(check)
+        elif self._dead > _COMPACT_RATIO * max(len(self._docs), 1):
+            self._compact()
+
+    # =========================
+    # Saving
+    # =========================
+
+    def snapshot(self) -> IndexSnapshot | None:
+        """
+        Current state for saving, None unless built. Cheap: call it on
+        the thread that calls changed(), encode it on any other.
+        """
+        if not self.is_built:
+            return None
+        resets = self._resets
+        snapshot = IndexSnapshot(
+            ids=list(self._ids),
+            texts=list(self._texts),
+            fuzzy=list(self._fuzzy),
+            seqs=array("q", self._seqs),
+            times=[array("d", t) for t in self._times],
+            postings=dict(self._postings),
+            next_seq=self._next_seq,
+            ordered=self._ordered,
+            dead=self._dead,
+        )
+        # Compaction on the search thread started meanwhile
+        if not self.is_built or self._resets != resets:
+            return None
+        self._persisted = True
+        return snapshot
+
+    def restore(self, saved: SavedIndex, check: Callable[[], None] | None = None) -> bool:
+        """
+        Load a saved index, then re-index the entries changed since it
+        was saved. False (and left unbuilt) if it is unreadable or
+        doesn't match the store. `check` as in build().
+        """
+        check = check or _no_check
+        self._version = None
+        try:
+            state = _decode(saved.data)
+        except (ValueError, KeyError, TypeError, struct.error):
+            return False
+        if state["format"] != SAVED_FORMAT or state["revision"] != saved.revision:
+            return False
+
+        # Entries are bound when a query returns them: a paged SQLite
+        # vault is checked against its id MACs without decrypting rows
+        store = self.store
+        changed = saved.changed
+        ids = state["ids"]
+        check()
+        if store.missing(i for i in ids if i is not None) - changed:
+            return False
+        check()
+
+        self._reset()
+        self._texts = state["texts"]
+        self._ids = ids
+        self._entries = [_UNBOUND if i is not None else None for i in ids]
+        self._unbound = True
+        self._seqs = state["seqs"]
+        self._next_seq = state["next_seq"]
+        self._ordered = state["ordered"]
+        self._postings = state["postings"]
+        self._fuzzy = state["fuzzy"]
+        self._dead = state["dead"]
+        self._times = state["times"]
+        for doc, text in enumerate(self._texts):
+            if not doc % _CHECK_EVERY:
+                check()
+            if text is not None:
+                self._docs[ids[doc]] = doc
+                self._link(doc, self._fuzzy[doc])
+        for i, stamps in enumerate(self._times):
+            check()
+            for doc, stamp in enumerate(stamps):
+                self._link_time(i, doc, stamp)
+
+        for entry_id in changed:
+            seq = self._remove(entry_id)
+            entry = store.get(entry_id)
+            if entry is not None:
+                self._add(entry, seq=seq)
+        if len(self._docs) != len(store):
+            self._reset()
+            return False
+        if changed:
+            # Replayed records can add and move entries: vault order
+            # is taken from the store again
+            seqs = self._seqs
+            for entry_id, doc in self._docs.items():
+                seqs[doc] = store.index_of(entry_id)
+            live = [seqs[doc] for doc in sorted(self._docs.values())]
+            self._ordered = all(a < b for a, b in zip(live, live[1:]))
+            self._next_seq = len(store)
+
+        self._version = store.version
+        self._persisted = True
+        return True
+
+    # =========================
+    # Queries
+    # =========================
+
+    def search(
+        self,
+        query: str = "",
+        category_id: str = "all",
+        sort_field: str | None = None,
+        descending: bool = False,
+        check: Callable[[], None] | None = None,
+    ) -> list[dict]:
+        """
+        Entries of `category_id` containing `query` in any search field
+        (case-insensitive), in vault order or sorted by `sort_field`.
+        `check` as in build().
+        """
+        query = normalize(query.strip())
+        if not query:
+            result = list(self._category(category_id))
+            return self._sorted(result, sort_field, descending)
+        self.prepare(check)
+        docs = self._lookup(query, check)
+        return self.select(docs, category_id, sort_field, descending, check)
+
+    def select(
+        self,
+        docs: Iterable[int],
+        category_id: str = "all",
+        sort_field: str | None = None,
+        descending: bool = False,
+        check: Callable[[], None] | None = None,
+    ) -> list[dict]:
+        """
+        Entries of documents that are in `category_id`, in the order
+        of search().
+        """
+        check = check or _no_check
+        docs = list(docs)
+        if self._ordered:
+            docs.sort()
+        else:
+            docs.sort(key=self._seqs.__getitem__)
+        if self._unbound:
+            result = list(map(self._entry, docs))
+        else:
+            result = list(map(self._entries.__getitem__, docs))
+        check()
+        # Same order as without a query
+        if category_id != "all":
+            rows = self.store.in_category(category_id)
+            position = {e["id"]: i for i, e in enumerate(rows)}.get
+            result = [e for e in result if position(e["id"]) is not None]
+            result.sort(key=lambda e: position(e["id"]))
+        return self._sorted(result, sort_field, descending)
+
+    def _sorted(self, result: list[dict], sort_field: str | None, descending: bool) -> list[dict]:
+        if sort_field is not None:
+            col = SEARCH_FIELDS.index(sort_field)
+            key = self.sort_key
+            result.sort(key=lambda e: key(e, col), reverse=descending)
+        return result
+
+    def fuzzy(
+        self,
+        query: str,
+        category_id: str = "all",
+        limit: int = RANK_LIMIT,
+        frecency: Frecency | None = None,
+        check: Callable[[], None] | None = None,
+    ) -> list[dict]:
+        """
+        Best `limit` fuzzy matches of `query`, best first; equal
+        matches go by use (core.frecency), then vault order.
+        """
+        check = check or _no_check
+        query = normalize(query.strip())
+        if not query:
+            return []
+        self.prepare(check)
+        return self._best(query, None, category_id, limit, frecency, check)
+
+    def _best(
+        self,
+        query: str,
+        hits: list[int] | None,
+        category_id: str,
+        limit: int,
+        frecency: Frecency | None,
+        check: Callable[[], None],
+    ) -> list[dict]:
+        """
+        fuzzy() for a normalized query; `hits` are its substring
+        matches (_lookup) if the caller has them.
+        """
+        typos = max_typos(query)
+        qmask = char_mask(query)
+        key_masks = self._key_masks
+        ids = self._ids
+        seqs = self._seqs
+
+        # Every key is scored once; its documents share the score.
+        # Substring keys come first: they belong to the substring hits,
+        # so with fewer hits than keys only the keys of hits are seen.
+        found: list[set[str]] = [set(), set(), set()]
+        if hits is not None and 3 * len(hits) < sum(map(len, self._by_key)):
+            fuzzy_keys_of = self._fuzzy
+            for i, doc in enumerate(hits):
+                if not i % _CHECK_EVERY:
+                    check()
+                for keys, key in zip(found, fuzzy_keys_of[doc]):
+                    if key and query in key:
+                        keys.add(key)
+        else:
+            for keys, by_key in zip(found, self._by_key):
+                check()
+                keys.update(key for key in by_key if query in key)
+        scored = [
+            (weight * match_score(query, key), by_key[key])
+            for weight, by_key, keys in zip(FUZZY_WEIGHTS, self._by_key, found)
+            for key in keys
+        ]
+        best = self._collect(scored, category_id, limit, frecency)
+
+        # A subsequence that is no substring has a gap, so it scores
+        # at most 145 + 10 per word start: the other keys of a field
+        # are only scored if they could still make the top. Typos are
+        # only looked for if matches don't fill it, in at most
+        # _TYPO_KEYS keys that have a word starting like the query.
+        floor = min(best.values()) if len(best) >= limit else 0
+        bound = 145 + 10 * len(query)
+        missed = []
+        count = len(scored)
+        for weight, by_key, keys in zip(FUZZY_WEIGHTS, self._by_key, found):
+            if weight * bound < floor:
+                continue
+            check()
+            # Keys missing more query characters than typos allowed
+            # are dropped in one pass; only the rest are looked at
+            close = [
+                (key, missing) for key, missing in zip(by_key, [
+                    (qmask & ~mask).bit_count()
+                    for mask in map(key_masks.__getitem__, by_key)
+                ])
+                if missing <= typos
+            ]
+            for i, (key, missing) in enumerate(close):
+                if not i % _CHECK_EVERY:
+                    check()
+                if key in keys:
+                    continue
+                score = weight * match_score(query, key) if not missing else 0
+                if score:
+                    scored.append((score, by_key[key]))
+                elif typos and query[0] in _word_starts(key):
+                    missed.append((missing, len(missed), weight, key, by_key[key]))
+        if len(scored) > count:
+            best = self._collect(scored, category_id, limit, frecency)
+
+        if typos and len(best) < limit:
+            missed = heapq.nsmallest(_TYPO_KEYS, missed)
+            for i, (_, _, weight, key, docs) in enumerate(missed):
+                if not i % _CHECK_EVERY:
+                    check()
+                score = weight * typo_score(query, key, typos)
+                if score:
+                    scored.append((score, docs))
+            best = self._collect(scored, category_id, limit, frecency)
+
+        # Ties go to the entry used more, then earlier in the vault
+        if frecency is None:
+            def rank_key(item):
+                return item[1], -seqs[item[0]]
+        else:
+            def rank_key(item):
+                doc = item[0]
+                return item[1], frecency.key(ids[doc]), -seqs[doc]
+        top = heapq.nlargest(limit, best.items(), key=rank_key)
+        return [self._entry(doc) for doc, _ in top]
+
+    def _collect(
+        self,
+        scored: list,
+        category_id: str,
+        limit: int,
+        frecency: Frecency | None,
+    ) -> dict[int, int]:
+        """
+        Best score of the top `limit` documents, keys best first. Of
+        the documents tied at the last score, only those that win the
+        tie (see fuzzy()) are kept.
+        """
+        best: dict[int, int] = {}
+        scored.sort(key=lambda item: item[0], reverse=True)
+        i = 0
+        while i < len(scored) and len(best) < limit:
+            score = scored[i][0]
+            tied = set()
+            while i < len(scored) and scored[i][0] == score:
+                tied |= scored[i][1]
+                i += 1
+            tied.difference_update(best)
+            if category_id != "all":
+                tied = {
+                    doc for doc in tied
+                    if dict.get(self._entry(doc), "category_id", "all") == category_id
+                }
+            if len(best) + len(tied) > limit:
+                tied = self._first(tied, limit - len(best), frecency)
+            best.update(dict.fromkeys(tied, score))
+        return best
+
+    def _first(self, docs: set[int], count: int, frecency: Frecency | None) -> list[int]:
+        """
+        The `count` documents of `docs` used most, then earliest in the
+        vault. Used entries are found from whichever is smaller, `docs`
+        or the usage counters; the rest go by sequence number.
+        """
+        seqs = self._seqs
+        used: list[int] = []
+        if frecency is not None:
+            ids = self._ids
+            if len(frecency.usage) < len(docs):
+                found = self._docs
+                used = [d for d in map(found.get, list(frecency.usage)) if d in docs]
+            else:
+                used = list(docs)
+            used = [d for d in used if frecency.key(ids[d]) != -math.inf]
+            used = heapq.nsmallest(
+                count, used, key=lambda d: (-frecency.key(ids[d]), seqs[d]),
+            )
+            if used:
+                docs = docs.difference(used)
+        if self._ordered:
+            rest = heapq.nsmallest(count - len(used), docs)
+        else:
+            rest = heapq.nsmallest(count - len(used), docs, key=seqs.__getitem__)
+        return used + rest
+
+    def rank(
+        self,
+        query: str,
+        category_id: str = "all",
+        limit: int = RANK_LIMIT,
+        frecency: Frecency | None = None,
+        check: Callable[[], None] | None = None,
+    ) -> list[dict]:
+        """
+        Search results best first: the top fuzzy matches, then the
+        remaining substring matches in vault order, or most used first
+        with `frecency`.
+        """
+        check = check or _no_check
+        text = normalize(query.strip())
+        if not text:
+            return self.search(query, category_id, check=check)
+        self.prepare(check)
+        hits = self._lookup(text, check)
+        top = self._best(text, hits, category_id, limit, frecency, check)
+        seen = {id(e) for e in top}
+        rest = [e for e in self.select(hits, category_id, check=check) if id(e) not in seen]
+        if frecency is not None:
+            rest = frecency.ordered(rest)
+        return top + rest
+
+    def matches(self, entry: dict, query: str) -> bool:
+        return matches(entry_text(entry), normalize(query.strip()))
+
+    def sort_key(self, entry: dict, col: int) -> str:
+        doc = self._docs.get(entry["id"]) if self.is_built else None
+        if doc is None:
+            return normalize(str(entry.get(SEARCH_FIELDS[col]) or ""))
+        return self._texts[doc].split("\n", len(SEARCH_FIELDS) - 1)[col]
+
+    def _lookup(self, query: str, check: Callable[[], None] | None = None) -> list[int]:
+        check = check or _no_check
+        texts = self._texts
+        if len(query) <= 3:
+            # A query no longer than a gram is one: its posting is
+            # the answer, nothing to verify
+            posting = self._postings.get(query, ())
+            if not self._dead:
+                return list(posting)
+            check()
+            return [d for d in posting if texts[d] is not None]
+
+        grams = trigrams(query)
+
+        lists = []
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+
+        # In most entries anyway
+        if len(lists[0]) > _SCAN_SHARE * len(texts):
+            found = []
+            for start in range(0, len(texts), _SCAN_CHUNK):
+                check()
+                found += [
+                    d for d, t in enumerate(texts[start:start + _SCAN_CHUNK], start)
+                    if t is not None and query in t
+                ]
+            return found
+
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            if (len(candidates) <= _INTERSECT_LIMIT
+                    or len(posting) > _INTERSECT_RATIO * len(candidates)):
+                break
+            candidates.intersection_update(posting)
+
+        return [
+            d for d in candidates
+            if texts[d] is not None and query in texts[d]
+        ]
+
+    def _category(self, category_id: str):
+        if category_id == "all":
+            return self.store
+        return self.store.in_category(category_id)
+
+    # =========================
+    # Query support (core.query)
+    # =========================
+    # Document numbers stay valid until the next changed(); the index
+    # must be built.
+
+    def lookup(self, query: str) -> list[int]:
+        """
+        Documents containing `query` (normalized) in any search field.
+        """
+        return self._lookup(query)
+
+    def live_docs(self) -> list[int]:
+        return [d for d, t in enumerate(self._texts) if t is not None]
+
+    def entry(self, doc: int) -> dict:
+        return self._entry(doc)
+
+    def text(self, doc: int) -> str:
+        return self._texts[doc]
+
+    def field(self, doc: int, name: str) -> str:
+        """
+        Normalized value of one of SEARCH_FIELDS.
+        """
+        col = SEARCH_FIELDS.index(name)
+        return self._texts[doc].split("\n", len(SEARCH_FIELDS) - 1)[col]
+
+    def time(self, doc: int, name: str) -> float:
+        return self._times[TIME_FIELDS.index(name)][doc]
+
+    def key_docs(self, name: str, test: Callable[[str], bool]) -> set[int]:
+        """
+        Documents whose fuzzy key `name` (service, domain or login)
+        passes `test`; each distinct key is tested once.
+        """
+        by_key = self._by_key[("service", "domain", "login").index(name)]
+        docs: set[int] = set()
+        for key, key_docs in by_key.items():
+            if test(key):
+                docs |= key_docs
+        return docs
+
+    def time_docs(self, name: str, low: float, high: float) -> set[int]:
+        """
+        Documents with low <= `name` < high.
+        """
+        i = TIME_FIELDS.index(name)
+        pairs = self._by_time[i]
+        if not self._time_sorted[i]:
+            pairs.sort()
+            self._time_sorted[i] = True
+        start = bisect.bisect_left(pairs, (low, -1))
+        stop = bisect.bisect_left(pairs, (high, -1))
+        texts = self._texts
+        return {doc for _, doc in pairs[start:stop] if texts[doc] is not None}
+
+    def category_docs(self, category_id: str) -> set[int]:
+        docs = self._docs
+        return {
+            docs[e["id"]] for e in self.store.in_category(category_id)
+            if e["id"] in docs
+        }
+
+    # =========================
+    # Helpers
+    # =========================
+
+    def _entry(self, doc: int) -> dict | None:
+        entry = self._entries[doc]
+        if entry is _UNBOUND:
+            entry = self._entries[doc] = self.store.get(self._ids[doc])
+        return entry
+
+    def _add(self, entry: dict, seq: int | None = None) -> None:
+        # One record read for a LazyEntry
+        values = peek_fields(entry, SEARCH_FIELDS + TIME_FIELDS)
+        text = _text(values[:len(SEARCH_FIELDS)])
+        times = tuple(map(_time, values[len(SEARCH_FIELDS):]))
+        self._append(entry["id"], entry, text, seq, times, fuzzy_keys(entry))
+
+    def _append(
+        self,
+        entry_id: str,
+        entry,
+        text: str,
+        seq: int | None,
+        times: tuple[float, ...],
+        keys: tuple[str, str, str],
+    ) -> None:
+        doc = len(self._texts)
+        if seq is None:
+            seq = self._next_seq
+            self._next_seq += 1
+        elif self._seqs and seq < self._seqs[-1]:
+            self._ordered = False
+        self._docs[entry_id] = doc
+        self._texts.append(text)
+        self._ids.append(entry_id)
+        self._entries.append(entry)
+        self._seqs.append(seq)
+        self._fuzzy.append(keys)
+        self._link(doc, keys)
+        for i, stamp in enumerate(times):
+            self._times[i].append(stamp)
+            self._link_time(i, doc, stamp)
+        postings = self._postings
+        for gram in _grams(text):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array("i")
+            posting.append(doc)
+
+    def _link(self, doc: int, keys: tuple[str, str, str]) -> None:
+        for by_key, key in zip(self._by_key, keys):
+            if not key:
+                continue
+            docs = by_key.get(key)
+            if docs is None:
+                docs = by_key[key] = set()
+                if key not in self._key_masks:
+                    self._key_masks[key] = char_mask(key)
+            docs.add(doc)
+
+    def _link_time(self, i: int, doc: int, stamp: float) -> None:
+        if stamp == stamp:   # not nan
+            pairs = self._by_time[i]
+            if pairs and stamp < pairs[-1][0]:
+                self._time_sorted[i] = False
+            pairs.append((stamp, doc))
+
+    def _reset(self) -> None:
+        self._docs = {}
+        self._texts = []
+        self._ids = []
+        self._entries = []
+        self._unbound = False
+        self._seqs = array("q")
+        self._next_seq = 0
+        self._ordered = True
+        self._postings = {}
+        self._fuzzy = []
+        self._by_key = [{}, {}, {}]
+        self._key_masks = {}
+        self._times = [array("d") for _ in TIME_FIELDS]
+        self._by_time = [[] for _ in TIME_FIELDS]
+        self._time_sorted = [True for _ in TIME_FIELDS]
+        self._dead = 0
+        self._resets += 1
+
+    def _remove(self, entry_id: str) -> int | None:
+        """
+        Tombstone an entry's document; returns its sequence number.
+        """
+        doc = self._docs.pop(entry_id, None)
+        if doc is None:
+            return None
+        self._texts[doc] = None
+        self._ids[doc] = None
+        self._entries[doc] = None
+        for by_key, key in zip(self._by_key, self._fuzzy[doc]):
+            docs = by_key.get(key)
+            if docs is not None:
+                docs.discard(doc)
+                if not docs:
+                    del by_key[key]
+        self._fuzzy[doc] = None
+        self._dead += 1
+        return self._seqs[doc]
+
+    def _compact(self) -> None:
+        # Unbuilt meanwhile, so snapshot() doesn't catch it half done
+        version, self._version = self._version, None
+        times = list(zip(*self._times))
+        live = sorted(
+            (seq, doc)
+            for doc, (seq, text) in enumerate(zip(self._seqs, self._texts))
+            if text is not None
+        )
+        ids, entries, texts, fuzzy = self._ids, self._entries, self._texts, self._fuzzy
+        unbound, next_seq = self._unbound, self._next_seq
+        self._reset()
+        for seq, doc in live:
+            self._append(ids[doc], entries[doc], texts[doc], seq, times[doc], fuzzy[doc])
+        self._unbound, self._next_seq = unbound, next_seq
+        self._version = version
@@ -3,6 +3,11 @@ from __future__ import annotations
 import time
 from typing import Callable, Optional
 
+from core import records, storage
+from core.entry_store import EntryStore
+from core.saver import VaultSaver
+from core.vault import VaultKey
+
 
 class Session:
     """
@@ -12,9 +17,15 @@ class Session:
 
     def __init__(self):
         self.vault: dict | None = None
-        self.master_password: str | None = None
+        # Derived key: saves never need the master password again
+        self.key: VaultKey | None = None
         self.vault_path: str | None = None
         self.is_unlocked: bool = False
+        # Writer lock of the vault file (core.storage)
+        self.write_lock: storage.WriteLock | None = None
+
+        # ===== Write-behind saving =====
+        self.saver: VaultSaver | None = None
 
         # ===== Auto-lock =====
         self.auto_lock_minutes: int = 5
@@ -27,30 +38,92 @@ class Session:
     # Unlock / Lock
     # =========================
 
-    def unlock(self, vault: dict, master_password: str, vault_path: str):
+    def unlock(
+        self,
+        vault: dict,
+        key: VaultKey,
+        vault_path: str,
+        write_lock: storage.WriteLock | None = None,
+    ):
         """
         Activates session after successful master password entry.
+        `vault`, `key` and `write_lock` come from core.vault.open_vault,
+        which takes the writer lock before loading; a vault created with
+        create_vault_key has none yet and takes it here.
+        If another process writes the vault, the session is read-only:
+        its saves fail with core.storage.VaultBusy.
         """
+        vault["entries"] = EntryStore.wrap(vault["entries"])
         self.vault = vault
-        self.master_password = master_password
+        self.key = key
         self.vault_path = vault_path
+        self.write_lock = write_lock or storage.lock_vault(vault_path)
         self.is_unlocked = True
         self._last_activity = time.time()
+        self.saver = VaultSaver(self)
 
-    def lock(self, reason: str = "manual"):
+    def lock(self, reason: str = "manual") -> bool:
         """
         Locks session and clears sensitive data.
+        Returns False, and stays unlocked, if pending changes could not
+        be saved (saver.state().error says why); a read-only session
+        locks anyway, its changes could never be saved.
         """
         if not self.is_unlocked:
-            return
+            return True
+
+        # Pending changes go to disk before the keys are dropped
+        if self.saver:
+            if not self.saver.stop() and not self.read_only:
+                return False
+            self.saver = None
+
+        # Drop the mmap behind lazily loaded entries
+        records.release(self.vault)
+
+        # Flush writes the batched fsync policy postponed
+        storage.sync_pending()
+
+        if self.write_lock:
+            self.write_lock.release()
+            self.write_lock = None
 
         self.vault = None
-        self.master_password = None
+        self.key = None
         self.vault_path = None
         self.is_unlocked = False
 
         if self.on_lock:
             self.on_lock(reason)
+        return True
+
+    # =========================
+    # Saving
+    # =========================
+
+    @property
+    def read_only(self) -> bool:
+        """
+        Unlocked while another process writes the vault.
+        """
+        return self.write_lock is not None and not self.write_lock.held
+
+    def mark_dirty(self, changes: list[dict]):
+        """
+        Call after every vault mutation with its change records.
+        Saving happens in the background.
+        """
+        if self.saver:
+            self.saver.mark_dirty(changes)
+
+    def flush(self) -> bool:
+        """
+        Write pending changes now (e.g. on app exit).
+        Returns False if the write failed.
+        """
+        if self.saver:
+            return self.saver.flush()
+        return True
 
     # =========================
     # Activity tracking
@@ -0,0 +1,906 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections.abc import MutableSequence
+from typing import Any, Callable, Iterable, Iterator
+
+from core import codec as codecs
+from core import journal, storage
+from core.compression import COMPRESS_NONE, Compression, decompress
+from core.crypto import CIPHER_FERNET, PayloadCipher
+from core.domains import domain_of
+from core.records import INDEX_FIELDS, LazyEntry, blob_layout
+
+# =====================
+# SQLite vault backend
+# =====================
+#
+# For vaults too big to rewrite as one file. One encrypted row per
+# entry, so an edit is a row write:
+#
+#   meta(key, value)           "header": plaintext header JSON (key slots,
+#                              cipher, codec, ...), "meta": encrypted,
+#                              "search": encrypted saved search index
+#   categories(id_mac, seq, data)
+#   entries(rowid, id_mac, seq, domain_mac, category_mac, list, data)
+#
+# `list` holds the list-view fields (INDEX_FIELDS), `data` the full
+# record. *_mac columns are keyed HMACs, so rows can be looked up by id,
+# domain or category without storing any of them in plaintext.
+# Rows are bound to their id_mac through the AEAD associated data.
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+APPLICATION_ID = 0x5A505353    # "ZPSS", PRAGMA application_id
+FORMAT = "1"
+
+MAC_SIZE = 16
+
+# Rows decrypted per page when the UI scrolls
+PAGE_SIZE = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id_mac BLOB PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    rowid INTEGER PRIMARY KEY,
+    id_mac BLOB NOT NULL UNIQUE,
+    seq INTEGER NOT NULL,
+    domain_mac BLOB,
+    category_mac BLOB,
+    list BLOB NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_seq ON entries(seq);
+CREATE INDEX IF NOT EXISTS entries_domain ON entries(domain_mac);
+CREATE INDEX IF NOT EXISTS entries_category ON entries(category_mac);
+"""
+
+_SYNCHRONOUS = {
+    storage.FSYNC_ALWAYS: "FULL",
+    storage.FSYNC_BATCHED: "NORMAL",
+    storage.FSYNC_NEVER: "OFF",
+}
+
+
+def is_sqlite_vault(path: str) -> bool:
+    """
+    Cheap check by file signature, without opening a connection.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(72)
+    except OSError:
+        return False
+    return (
+        len(head) == 72
+        and head.startswith(SQLITE_MAGIC)
+        and struct.unpack_from(">I", head, 68)[0] == APPLICATION_ID
+    )
+
+
+# =====================
+# Row crypto
+# =====================
+
+class RowCipher:
+    """
+    Encrypts rows and computes lookup MACs with the vault data key.
+    """
+
+    def __init__(self, key: bytes, header: dict):
+        self.key = key
+        self.layout = blob_layout(header)
+        self.cipher = PayloadCipher(header.get("cipher", CIPHER_FERNET), key)
+        self.codec = codecs.from_header(header.get("codec"))
+        self.compression = None
+        if "compression" in header:
+            self.compression = Compression.from_header(header["compression"])
+        self._mac_key = hmac.new(key, b"zippass:sqlite:mac", hashlib.sha256).digest()
+
+    def mac(self, kind: bytes, value: str) -> bytes:
+        # One-shot digest: restoring a search index MACs every id
+        data = kind + b"\x00" + value.encode("utf-8")
+        return hmac.digest(self._mac_key, data, "sha256")[:MAC_SIZE]
+
+    def seal(self, data: bytes, aad: bytes, compress: bool = True) -> bytes:
+        if self.compression:
+            data = (self.compression if compress else Compression(COMPRESS_NONE)).compress(data)
+        return self.cipher.encrypt(data, aad)
+
+    def open(self, blob: bytes, aad: bytes) -> bytes:
+        data = self.cipher.decrypt(blob, aad)
+        if self.compression:
+            data = decompress(data)
+        return data
+
+    # ---- entries ----
+
+    def entry_row(self, entry: dict) -> tuple[bytes, bytes | None, bytes, bytes, bytes]:
+        """
+        (id_mac, domain_mac, category_mac, list, data) for `entry`.
+        """
+        id_mac = self.mac(b"id", entry["id"])
+        domain = domain_of(dict.get(entry, "url"))
+        fields = [dict.get(entry, f, "") for f in INDEX_FIELDS]
+        return (
+            id_mac,
+            self.mac(b"domain", domain) if domain else None,
+            self.mac(b"category", str(dict.get(entry, "category_id", ""))),
+            self.seal(self.codec.encode(fields), b"zippass:sqlite:list:" + id_mac),
+            self.seal(
+                self.codec.encode_record(dict(entry)),
+                b"zippass:sqlite:record:" + id_mac,
+            ),
+        )
+
+    def open_list(self, id_mac: bytes, blob: bytes) -> dict:
+        try:
+            values = self.codec.decode(self.open(blob, b"zippass:sqlite:list:" + id_mac))
+        except ValueError:
+            raise ValueError("Corrupted vault row")
+        return dict(zip(INDEX_FIELDS, values))
+
+    def open_record(self, id_mac: bytes, blob: bytes) -> dict:
+        try:
+            return self.codec.decode_record(
+                self.open(blob, b"zippass:sqlite:record:" + id_mac)
+            )
+        except ValueError:
+            raise ValueError("Corrupted vault row")
+
+    # ---- categories / meta ----
+
+    def seal_value(self, value: Any, aad: bytes) -> bytes:
+        return self.seal(self.codec.encode(value), aad)
+
+    def open_value(self, blob: bytes, aad: bytes) -> Any:
+        try:
+            return self.codec.decode(self.open(blob, aad))
+        except ValueError:
+            raise ValueError("Invalid master password or corrupted vault")
+
+
+# =====================
+# Connections
+# =====================
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={_SYNCHRONOUS[storage.FSYNC_POLICY]}")
+    return conn
+
+
+def read_header(path: str) -> dict:
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise ValueError("Invalid vault format")
+    return json.loads(row[0])
+
+
+def write_header(path: str, header: dict) -> storage.WriteStats:
+    """
+    Replace the plaintext header (key slots). One transaction.
+    """
+    stats = WriteStatsTimer(path)
+    conn = connect(path)
+    try:
+        with _transaction(conn):
+            conn.execute(
+                "UPDATE meta SET value = ? WHERE key = 'header'",
+                (json.dumps(header),),
+            )
+            stats.wrote()
+    finally:
+        conn.close()
+    return stats.finish(len(json.dumps(header)))
+
+
+class RowSource:
+    """
+    Reader connection behind the entries of a loaded SQLite vault.
+    Plays the RecordFile role for LazyEntry: read_record(rowid, _).
+    """
+
+    def __init__(self, path: str, rows: RowCipher):
+        self.path = path
+        self.rows = rows
+        self.key = rows.key
+        self.layout = ("sqlite", path)
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.reopen()
+
+    @property
+    def closed(self) -> bool:
+        return self._conn is None
+
+    def reopen(self) -> None:
+        if self._conn is None:
+            self._conn = connect(self.path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def query(self, sql: str, params: Iterable = ()) -> list[tuple]:
+        with self._lock:
+            if self._conn is None:
+                raise ValueError("Vault database is closed")
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def read_record(self, rowid: int, _length: int = 0) -> dict:
+        found = self.query("SELECT id_mac, data FROM entries WHERE rowid = ?", (rowid,))
+        if not found:
+            raise ValueError("Vault row no longer exists")
+        id_mac, data = found[0]
+        return self.rows.open_record(id_mac, data)
+
+    def raw(self, offset: int, length: int) -> bytes:
+        raise ValueError("SQLite rows can't be copied into a vault file")
+
+    def load_rows(self, rowids: list[int]) -> dict[int, LazyEntry]:
+        """
+        List-view fields of `rowids` in one query.
+        """
+        found = {}
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for rowid, id_mac, blob in self.query(
+                f"SELECT rowid, id_mac, list FROM entries WHERE rowid IN ({marks})",
+                chunk,
+            ):
+                fields = self.rows.open_list(id_mac, blob)
+                found[rowid] = LazyEntry(fields, (self, rowid, 0))
+        return found
+
+
+# =====================
+# Paged entries
+# =====================
+
+class PagedEntries(MutableSequence):
+    """
+    vault["entries"] of a SQLite vault. Holds row ids in order and
+    decrypts list-view fields a page at a time on first access;
+    full records load on demand like any LazyEntry. Lookups by id go
+    through the id_mac index and only decrypt the page they land on.
+    Mutations only change this list; the session's change records
+    write them to the database.
+    """
+
+    def __init__(self, source: RowSource, rowids: list[int]):
+        self.source = source
+        self._items: list[int | dict] = list(rowids)
+        # Row id (rows not paged in yet) or entry id -> position,
+        # rebuilt lazily after inserts and deletes
+        self._positions: dict[int | str, int] | None = None
+
+    # ---- paging ----
+
+    def _page(self, i: int) -> None:
+        start = i - i % PAGE_SIZE
+        items = self._items
+        wanted = [
+            (j, items[j]) for j in range(start, min(start + PAGE_SIZE, len(items)))
+            if type(items[j]) is int
+        ]
+        if not wanted:
+            return
+        loaded = self.source.load_rows([rowid for _, rowid in wanted])
+        for j, rowid in wanted:
+            entry = loaded.get(rowid)
+            if entry is None:
+                raise ValueError("Vault row no longer exists")
+            items[j] = entry
+
+    def _entry(self, i: int) -> dict:
+        item = self._items[i]
+        if type(item) is int:
+            self._page(i if i >= 0 else len(self._items) + i)
+            item = self._items[i]
+        return item
+
+    # ---- MutableSequence ----
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._entry(j) for j in range(*i.indices(len(self._items)))]
+        return self._entry(i)
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            self._items[i] = list(value)
+            self._positions = None
+        else:
+            self._items[i] = value
+            if self._positions is not None:
+                self._positions[dict.get(value, "id")] = i % len(self._items)
+
+    def __delitem__(self, i):
+        del self._items[i]
+        self._positions = None
+
+    def insert(self, i, value):
+        if self._positions is not None:
+            if i >= len(self._items):
+                self._positions[dict.get(value, "id")] = len(self._items)
+            else:
+                self._positions = None
+        self._items.insert(i, value)
+
+    def __iter__(self):
+        for i in range(len(self._items)):
+            yield self._entry(i)
+
+    def index(self, value, start=0, stop=None):
+        # The UI passes back objects it got from here: try identity
+        # before comparing (which would decrypt every page)
+        stop = len(self._items) if stop is None else stop
+        for i in range(start, stop):
+            if self._items[i] is value:
+                return i
+        return super().index(value, start, stop)
+
+    def clear(self):
+        self._items.clear()
+        self._positions = None
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    # ---- queries ----
+
+    def position(self, entry_id: str) -> int | None:
+        """
+        Position of an entry, None if it isn't here.
+        """
+        positions = self._position_map()
+        i = positions.get(entry_id)
+        if i is not None and dict.get(self._items[i], "id") == entry_id:
+            return i
+        found = self.source.query(
+            "SELECT rowid FROM entries WHERE id_mac = ?",
+            (self.source.rows.mac(b"id", entry_id),),
+        )
+        i = positions.get(found[0][0]) if found else None
+        if i is None or not self._holds(i, entry_id):
+            return None
+        return i
+
+    def get(self, entry_id: str) -> dict | None:
+        i = self.position(entry_id)
+        if i is None:
+            return None
+        item = self._items[i]
+        if type(item) is int:
+            # Only this row: lookups are scattered, pages are for scrolling
+            item = self.source.load_rows([item]).get(item)
+            if item is None:
+                raise ValueError("Vault row no longer exists")
+            self._items[i] = item
+        return item
+
+    def missing(self, entry_ids: Iterable[str]) -> set[str]:
+        """
+        Those of `entry_ids` that aren't here. Only compares id MACs;
+        no row is decrypted.
+        """
+        positions = self._position_map()
+        items = self._items
+        missing = set()
+        wanted: dict[bytes, str] = {}
+        mac = self.source.rows.mac
+        for entry_id in entry_ids:
+            i = positions.get(entry_id)
+            if i is None or dict.get(items[i], "id") != entry_id:
+                wanted[mac(b"id", entry_id)] = entry_id
+        if not wanted:
+            return missing
+        for rowid, id_mac in self.source.query("SELECT rowid, id_mac FROM entries"):
+            entry_id = wanted.pop(id_mac, None)
+            if entry_id is None:
+                continue
+            i = positions.get(rowid)
+            if i is None or not self._holds(i, entry_id):
+                missing.add(entry_id)
+        missing.update(wanted.values())
+        return missing
+
+    def _holds(self, i: int, entry_id: str) -> bool:
+        """
+        Whether position `i`, listed under the row of `entry_id`, still
+        holds that entry: it may have been paged in or replaced since.
+        """
+        item = self._items[i]
+        return type(item) is int or dict.get(item, "id") == entry_id
+
+    def _position_map(self) -> dict[int | str, int]:
+        if self._positions is None:
+            self._positions = {
+                item if type(item) is int else dict.get(item, "id"): i
+                for i, item in enumerate(self._items)
+            }
+        return self._positions
+
+    def in_category(self, category_id: str) -> list[dict]:
+        """
+        Entries of one category through the category_mac index;
+        only their pages are decrypted.
+        """
+        mac = self.source.rows.mac(b"category", str(category_id))
+        wanted = {r for (r,) in self.source.query(
+            "SELECT rowid FROM entries WHERE category_mac = ?", (mac,)
+        )}
+        # Rows not paged in yet are matched by the index; everything
+        # else (possibly edited since) by its category_id field
+        return [
+            self._entry(i) for i, item in enumerate(self._items)
+            if (item in wanted if type(item) is int
+                else dict.get(item, "category_id") == category_id)
+        ]
+
+    def sources(self) -> list[RowSource]:
+        return [self.source]
+
+
+# =====================
+# Load / save
+# =====================
+
+def load(path: str, key: bytes) -> dict:
+    """
+    Open a SQLite vault. Entries come back as PagedEntries.
+    """
+    header = read_header(path)
+    rows = RowCipher(key, header)
+    source = RowSource(path, rows)
+    try:
+        meta = _read_meta(source, rows)
+        categories = _read_categories(source, rows)
+        rowids = [r for (r,) in source.query("SELECT rowid FROM entries ORDER BY seq")]
+        search = _read_search(source, rows)
+    except Exception:
+        source.close()
+        raise
+
+    vault = {
+        "meta": meta,
+        "categories": categories,
+        "entries": PagedEntries(source, rowids),
+    }
+    if search is not None:
+        vault["search"] = search
+    return vault
+
+
+def stream(path: str, key: bytes, batch: int = PAGE_SIZE) -> tuple[dict, Iterator[dict]]:
+    """
+    Meta and categories plus an iterator of full entries, read in
+    batches of rows.
+    """
+    header = read_header(path)
+    rows = RowCipher(key, header)
+    source = RowSource(path, rows)
+    try:
+        vault = {
+            "meta": _read_meta(source, rows),
+            "categories": _read_categories(source, rows),
+        }
+    except Exception:
+        source.close()
+        raise
+
+    def entries() -> Iterator[dict]:
+        try:
+            last = None
+            while True:
+                found = source.query(
+                    "SELECT seq, id_mac, data FROM entries "
+                    "WHERE ? IS NULL OR seq > ? ORDER BY seq LIMIT ?",
+                    (last, last, batch),
+                )
+                if not found:
+                    return
+                for seq, id_mac, data in found:
+                    yield rows.open_record(id_mac, data)
+                last = found[-1][0]
+        finally:
+            source.close()
+
+    return vault, entries()
+
+
+def find_by_domain(vault: dict, domain: str) -> list[dict]:
+    """
+    Entries whose URL has host `domain`, through the domain_mac index.
+    """
+    entries = vault["entries"]
+    pager = getattr(entries, "pager", entries)
+    if pager is None:
+        host = domain_of(domain)
+        return [e for e in entries if domain_of(e.get("url", "")) == host]
+
+    source = pager.source
+    mac = source.rows.mac(b"domain", domain_of(domain))
+    found = {r for (r,) in source.query(
+        "SELECT rowid FROM entries WHERE domain_mac = ?", (mac,)
+    )}
+    loaded = list(source.load_rows(sorted(found)).values())
+    if pager is not entries:
+        # Hand out the store's own objects, so edits go through it
+        return [e for e in (entries.get(row["id"]) for row in loaded) if e is not None]
+    return loaded
+
+
+def apply_changes(path: str, key: bytes, changes: list[dict]) -> storage.WriteStats:
+    """
+    Write change records (core.journal) as row updates, in one
+    transaction. This is what replaces journal appends for SQLite.
+    """
+    rows = RowCipher(key, read_header(path))
+    stats = WriteStatsTimer(path)
+    written = 0
+
+    conn = connect(path)
+    try:
+        with _transaction(conn):
+            for change in changes:
+                written += _apply(conn, rows, change)
+            if any(change.get("op") in journal.ENTRY_OPS for change in changes):
+                # A saved search index no longer matches
+                written += _update_meta(conn, rows, _bump_revision)
+            stats.wrote()
+    finally:
+        conn.close()
+
+    return stats.finish(written)
+
+
+def save_search(path: str, key: bytes, encode: Callable[[int], bytes]) -> storage.WriteStats:
+    """
+    Store a search index (core.search) on its own: `encode` gets the
+    content revision to tag it with.
+    """
+    rows = RowCipher(key, read_header(path))
+    stats = WriteStatsTimer(path)
+
+    conn = connect(path)
+    try:
+        with _transaction(conn):
+            found = conn.execute("SELECT value FROM meta WHERE key = 'meta'").fetchone()
+            meta = rows.open_value(found[0], b"zippass:sqlite:meta") if found else {}
+            blob = rows.seal(
+                encode(meta.get("revision", 0)), b"zippass:sqlite:search", compress=False,
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('search', ?)", (blob,))
+            stats.wrote()
+    finally:
+        conn.close()
+
+    return stats.finish(len(blob))
+
+
+def save(
+    vault: dict,
+    key: bytes,
+    header: dict,
+    path: str,
+    search: bytes | None = None,
+) -> storage.WriteStats:
+    """
+    Write the whole vault. An existing SQLite vault is synced in place
+    (one transaction): rows of unloaded entries are only renumbered.
+    Anything else is written to a new database that replaces `path`.
+    `search` is an encoded search index to store with it.
+    """
+    if os.path.exists(path) and is_sqlite_vault(path):
+        return _sync(vault, key, header, path, search)
+
+    stats = WriteStatsTimer(path)
+    tmp_path = f"{path}.{os.getpid()}.sqlite.tmp"
+    for leftover in (tmp_path, tmp_path + "-wal", tmp_path + "-shm"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+    try:
+        conn = connect(tmp_path)
+        try:
+            conn.execute(f"PRAGMA application_id={APPLICATION_ID}")
+            conn.executescript(_SCHEMA)
+            with _transaction(conn):
+                written = _write_all(conn, vault, RowCipher(key, header), header, search)
+            # Single file before the rename: no -wal next to it
+            conn.execute("PRAGMA journal_mode=DELETE")
+            stats.wrote()
+        finally:
+            conn.close()
+
+        if storage.FSYNC_POLICY != storage.FSYNC_NEVER:
+            fd = os.open(tmp_path, os.O_RDWR)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        remove_sidecars(path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    result = stats.finish(written)
+    result.snapshot = True
+    return result
+
+
+def remove_sidecars(path: str) -> None:
+    """
+    Drop -wal / -shm files a replaced database may have left behind;
+    SQLite would apply them to whatever is at `path` next.
+    """
+    for suffix in ("-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+# =====================
+# Helpers
+# =====================
+
+class WriteStatsTimer:
+    def __init__(self, path: str):
+        self.path = path
+        self._start = time.perf_counter()
+        self._wrote = self._start
+
+    def wrote(self) -> None:
+        self._wrote = time.perf_counter()
+
+    def finish(self, written: int) -> storage.WriteStats:
+        # The commit is where SQLite syncs
+        end = time.perf_counter()
+        return storage.WriteStats(
+            self.path,
+            bytes_written=written,
+            write_ms=(self._wrote - self._start) * 1000,
+            fsync_ms=(end - self._wrote) * 1000,
+            snapshot=False,
+        )
+
+
+class _transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+def _read_meta(source: RowSource, rows: RowCipher) -> dict:
+    found = source.query("SELECT value FROM meta WHERE key = 'meta'")
+    if not found:
+        return {}
+    return rows.open_value(found[0][0], b"zippass:sqlite:meta")
+
+
+def _read_search(source: RowSource, rows: RowCipher) -> bytes | None:
+    found = source.query("SELECT value FROM meta WHERE key = 'search'")
+    if not found:
+        return None
+    try:
+        return rows.open(found[0][0], b"zippass:sqlite:search")
+    except ValueError:
+        return None   # only a cache: rebuilt
+
+
+def _read_categories(source: RowSource, rows: RowCipher) -> list[dict]:
+    return [
+        rows.open_value(data, b"zippass:sqlite:category:" + id_mac)
+        for id_mac, data in source.query(
+            "SELECT id_mac, data FROM categories ORDER BY seq"
+        )
+    ]
+
+
+def _put_entry(conn, rows: RowCipher, entry: dict, seq: int | None = None) -> int:
+    id_mac, domain_mac, category_mac, list_blob, data_blob = rows.entry_row(entry)
+    if seq is None:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM entries").fetchone()[0]
+    conn.execute(
+        "INSERT INTO entries (id_mac, seq, domain_mac, category_mac, list, data) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(id_mac) DO UPDATE SET domain_mac = excluded.domain_mac, "
+        "category_mac = excluded.category_mac, list = excluded.list, "
+        "data = excluded.data",
+        (id_mac, seq, domain_mac, category_mac, list_blob, data_blob),
+    )
+    return len(list_blob) + len(data_blob)
+
+
+def _put_category(conn, rows: RowCipher, category: dict, seq: int | None = None) -> int:
+    id_mac = rows.mac(b"id", category["id"])
+    data = rows.seal_value(category, b"zippass:sqlite:category:" + id_mac)
+    if seq is None:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM categories").fetchone()[0]
+    conn.execute(
+        "INSERT INTO categories (id_mac, seq, data) VALUES (?, ?, ?) "
+        "ON CONFLICT(id_mac) DO UPDATE SET data = excluded.data",
+        (id_mac, seq, data),
+    )
+    return len(data)
+
+
+def _apply(conn, rows: RowCipher, change: dict) -> int:
+    op = change.get("op")
+
+    if op == "put_entry":
+        return _put_entry(conn, rows, change["entry"])
+    if op == "delete_entry":
+        conn.execute("DELETE FROM entries WHERE id_mac = ?", (rows.mac(b"id", change["id"]),))
+        return 0
+    if op == "clear_entries":
+        conn.execute("DELETE FROM entries")
+        return 0
+    if op == "put_category":
+        return _put_category(conn, rows, change["category"])
+    if op == "delete_category":
+        conn.execute(
+            "DELETE FROM categories WHERE id_mac = ?", (rows.mac(b"id", change["id"]),)
+        )
+        return 0
+    if op == "put_usage":
+        return _update_meta(conn, rows, lambda meta: journal.apply_usage(meta, change["usage"]))
+
+    raise ValueError(f"Unknown journal record: {op!r}")
+
+
+def _update_meta(conn, rows: RowCipher, update: Callable[[dict], None]) -> int:
+    found = conn.execute("SELECT value FROM meta WHERE key = 'meta'").fetchone()
+    meta = rows.open_value(found[0], b"zippass:sqlite:meta") if found else {}
+    update(meta)
+    blob = rows.seal_value(meta, b"zippass:sqlite:meta")
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('meta', ?)", (blob,))
+    return len(blob)
+
+
+def _bump_revision(meta: dict) -> None:
+    meta["revision"] = meta.get("revision", 0) + 1
+
+
+def _write_meta(
+    conn,
+    rows: RowCipher,
+    vault: dict,
+    header: dict,
+    search: bytes | None = None,
+) -> int:
+    meta = rows.seal_value(vault.get("meta", {}), b"zippass:sqlite:meta")
+    conn.executemany(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        [("header", json.dumps(header)), ("format", FORMAT), ("meta", meta)],
+    )
+    written = len(meta)
+    if search is not None:
+        blob = rows.seal(search, b"zippass:sqlite:search", compress=False)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('search', ?)", (blob,))
+        written += len(blob)
+    else:
+        conn.execute("DELETE FROM meta WHERE key = 'search'")
+    conn.execute("DELETE FROM categories")
+    for seq, category in enumerate(vault["categories"]):
+        written += _put_category(conn, rows, category, seq)
+    return written
+
+
+def _write_all(
+    conn,
+    vault: dict,
+    rows: RowCipher,
+    header: dict,
+    search: bytes | None = None,
+) -> int:
+    written = _write_meta(conn, rows, vault, header, search)
+    for seq, entry in enumerate(vault["entries"]):
+        written += _put_entry(conn, rows, entry, seq)
+    return written
+
+
+def _sync(
+    vault: dict,
+    key: bytes,
+    header: dict,
+    path: str,
+    search: bytes | None = None,
+) -> storage.WriteStats:
+    rows = RowCipher(key, header)
+    entries = vault["entries"]
+    pager = getattr(entries, "pager", entries)   # core.entry_store.EntryStore
+    stats = WriteStatsTimer(path)
+
+    conn = connect(path)
+    try:
+        with _transaction(conn):
+            written = _write_meta(conn, rows, vault, header, search)
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (rowid INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM keep")
+
+            # Renumber out of the way first: seq is rewritten below
+            conn.execute("UPDATE entries SET seq = -1 - seq")
+
+            # Rows can stay as they are if this database, key and row
+            # format are the ones they were written with
+            reuse = (
+                isinstance(pager, PagedEntries)
+                and os.path.samefile(pager.source.path, path)
+                and pager.source.key == key
+                and pager.source.rows.layout == rows.layout
+            )
+            if reuse and not getattr(entries, "is_indexed", False):
+                items = pager._items
+            else:
+                items = list(entries)
+
+            for seq, item in enumerate(items):
+                rowid = None
+                if type(item) is int:
+                    rowid = item
+                elif (
+                    reuse
+                    and isinstance(item, LazyEntry)
+                    and not item.is_loaded
+                    and item._source[0] is pager.source
+                ):
+                    rowid = item._source[1]
+
+                if rowid is not None:
+                    conn.execute("UPDATE entries SET seq = ? WHERE rowid = ?", (seq, rowid))
+                else:
+                    written += _put_entry(conn, rows, item, seq)
+                    rowid = conn.execute(
+                        "SELECT rowid FROM entries WHERE id_mac = ?",
+                        (rows.mac(b"id", item["id"]),),
+                    ).fetchone()[0]
+                    conn.execute("UPDATE entries SET seq = ? WHERE rowid = ?", (seq, rowid))
+                conn.execute("INSERT OR IGNORE INTO keep (rowid) VALUES (?)", (rowid,))
+
+            conn.execute("DELETE FROM entries WHERE rowid NOT IN (SELECT rowid FROM keep)")
+            stats.wrote()
+    finally:
+        conn.close()
+
+    result = stats.finish(written)
+    result.snapshot = True
+    return result
@@ -0,0 +1,417 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from core.compression import CompressionStats
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# =====================
+# fsync policy
+# =====================
+#
+# always  - fsync file data and the directory entry on every write
+# batched - fsync file data before rename (keeps saves atomic), but
+#           journal appends and directory entries at most once per
+#           FSYNC_BATCH_INTERVAL; sync_pending() forces the rest
+# never   - no fsync at all (tests, throwaway vaults)
+
+FSYNC_ALWAYS = "always"
+FSYNC_BATCHED = "batched"
+FSYNC_NEVER = "never"
+
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_BATCHED, FSYNC_NEVER)
+
+FSYNC_POLICY = FSYNC_ALWAYS
+FSYNC_BATCH_INTERVAL = 5.0
+
+_dirty: set[str] = set()           # paths with postponed fsyncs
+_last_sync: dict[str, float] = {}  # path -> time of last journal fsync
+_pending_lock = threading.Lock()
+
+
+def set_fsync_policy(policy: str) -> None:
+    global FSYNC_POLICY
+
+    if policy not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy: {policy!r}")
+
+    FSYNC_POLICY = policy
+    if policy != FSYNC_BATCHED:
+        sync_pending()
+
+
+# =====================
+# Write statistics
+# =====================
+
+@dataclass(slots=True)
+class WriteStats:
+    path: str
+    bytes_written: int = 0
+    write_ms: float = 0.0
+    fsync_ms: float = 0.0
+    rename_ms: float = 0.0
+    snapshot: bool = True      # False for journal appends
+    compression: CompressionStats | None = None
+
+    @property
+    def total_ms(self) -> float:
+        return self.write_ms + self.fsync_ms + self.rename_ms
+
+
+# =====================
+# Writes
+# =====================
+
+def atomic_write(
+    path: str,
+    chunks: Iterable[bytes],
+    *,
+    before_replace: Callable[[], None] | None = None,
+) -> WriteStats:
+    """
+    Write `chunks` to a sibling temp file, fsync it and rename it over
+    `path`. Readers see either the old file or the new one, never a
+    truncated mix.
+
+    `before_replace` runs right before the rename, e.g. to close
+    mappings of the old file (Windows refuses to replace mapped files).
+    """
+    policy = FSYNC_POLICY
+    stats = WriteStats(path)
+    directory = os.path.dirname(os.path.abspath(path))
+
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".",
+        suffix=".tmp",
+        dir=directory,
+    )
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            t0 = time.perf_counter()
+            for chunk in chunks:
+                f.write(chunk)
+                stats.bytes_written += len(chunk)
+            f.flush()
+            t1 = time.perf_counter()
+
+            if policy != FSYNC_NEVER:
+                os.fsync(f.fileno())
+            t2 = time.perf_counter()
+
+        if before_replace:
+            before_replace()
+
+        os.replace(tmp_path, path)
+        t3 = time.perf_counter()
+
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if policy == FSYNC_ALWAYS:
+        _fsync_dir(directory)
+    elif policy == FSYNC_BATCHED:
+        _mark_dirty(directory)
+    t4 = time.perf_counter()
+
+    stats.write_ms = (t1 - t0) * 1000
+    stats.fsync_ms = ((t2 - t1) + (t4 - t3)) * 1000
+    stats.rename_ms = (t3 - t2) * 1000
+    return stats
+
+
+def append(path: str, data: bytes) -> tuple[int, WriteStats]:
+    """
+    Append `data` to `path`.
+    Returns file size after the write and timings.
+    """
+    policy = FSYNC_POLICY
+    stats = WriteStats(path, snapshot=False)
+
+    created = not os.path.exists(path)
+
+    with open(path, "ab") as f:
+        t0 = time.perf_counter()
+        f.write(data)
+        f.flush()
+        size = f.tell()
+        t1 = time.perf_counter()
+
+        if policy == FSYNC_ALWAYS:
+            os.fsync(f.fileno())
+        elif policy == FSYNC_BATCHED and _batch_due(path):
+            os.fsync(f.fileno())
+            _mark_synced(path)
+        elif policy == FSYNC_BATCHED:
+            _mark_dirty(path)
+        t2 = time.perf_counter()
+
+    if created:
+        directory = os.path.dirname(os.path.abspath(path))
+        if policy == FSYNC_ALWAYS:
+            _fsync_dir(directory)
+        elif policy == FSYNC_BATCHED:
+            _mark_dirty(directory)
+    t3 = time.perf_counter()
+
+    stats.bytes_written = len(data)
+    stats.write_ms = (t1 - t0) * 1000
+    stats.fsync_ms = ((t2 - t1) + (t3 - t2)) * 1000
+    return size, stats
+
+
+def write_at(path: str, offset: int, data: bytes) -> WriteStats:
+    """
+    Overwrite bytes in place. Not atomic on its own; callers protect
+    it with a redo record written by atomic_write first.
+    """
+    policy = FSYNC_POLICY
+    stats = WriteStats(path, snapshot=False)
+
+    with open(path, "r+b") as f:
+        t0 = time.perf_counter()
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        t1 = time.perf_counter()
+
+        if policy != FSYNC_NEVER:
+            os.fsync(f.fileno())
+        t2 = time.perf_counter()
+
+    stats.bytes_written = len(data)
+    stats.write_ms = (t1 - t0) * 1000
+    stats.fsync_ms = (t2 - t1) * 1000
+    return stats
+
+
+def remove(path: str) -> None:
+    """
+    Delete `path` if it exists; the directory entry follows the policy.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return
+
+    with _pending_lock:
+        _dirty.discard(path)
+        _last_sync.pop(path, None)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if FSYNC_POLICY == FSYNC_ALWAYS:
+        _fsync_dir(directory)
+    elif FSYNC_POLICY == FSYNC_BATCHED:
+        _mark_dirty(directory)
+
+
+def sync_pending() -> None:
+    """
+    fsync everything the batched policy postponed.
+    Call on lock / exit.
+    """
+    with _pending_lock:
+        paths = list(_dirty)
+        _dirty.clear()
+
+    for path in paths:
+        if os.path.isdir(path):
+            _fsync_dir(path)
+            continue
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# =====================
+# Writer lock
+# =====================
+#
+# One process at a time writes a vault. A session holds an exclusive
+# advisory lock on <vault>.lock from unlock to lock (core.session): a
+# process that loaded the vault while another one writes it holds a
+# stale copy, and saving that copy (a compaction rewrites the snapshot
+# and drops the journal) would lose the other one's changes. Every
+# write goes through writing(); the OS drops the lock with its process.
+
+LOCK_SUFFIX = ".lock"
+
+_locks: dict[str, WriteLock] = {}   # sessions of this process, by real path
+_locks_lock = threading.Lock()
+
+
+class VaultBusy(RuntimeError):
+    """
+    Another process writes the vault.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(f"Vault is open for writing in another process: {path}")
+        self.path = path
+
+
+class WriteLock:
+    """
+    Exclusive advisory lock of one vault, held by this object.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """
+        Take the lock without waiting; False if it is taken, also by
+        another WriteLock of this process.
+        """
+        if self._file is None:
+            f = open(self.path + LOCK_SUFFIX, "a+b")
+            try:
+                _lock_file(f)
+            except OSError:
+                f.close()
+                return False
+            self._file = f
+        return True
+
+    def release(self) -> None:
+        with _locks_lock:
+            if _locks.get(_lock_key(self.path)) is self:
+                del _locks[_lock_key(self.path)]
+        if self._file is not None:
+            try:
+                _unlock_file(self._file)
+            finally:
+                self._file.close()
+                self._file = None
+
+
+def lock_vault(path: str) -> WriteLock:
+    """
+    Writer lock of `path` for a session, taken if it is free. Until
+    release(), writes of this process go through it; if it is not
+    held (another process writes), they raise VaultBusy: the session's
+    copy may be stale.
+    """
+    lock = WriteLock(path)
+    lock.acquire()
+    with _locks_lock:
+        _locks[_lock_key(path)] = lock
+    return lock
+
+
+def holds(path: str) -> bool:
+    """
+    True if a session of this process holds the writer lock of `path`.
+    Only then may a load repair the vault (cut a torn journal tail,
+    finish a header rewrite): for anyone else such leftovers may be
+    a write in progress.
+    """
+    with _locks_lock:
+        lock = _locks.get(_lock_key(path))
+    return lock is not None and lock.held
+
+
+@contextmanager
+def writing(path: str):
+    """
+    Hold the writer lock of `path` for one write: the lock of a
+    session of this process, or one taken for this write only.
+    Raises VaultBusy if another process holds it.
+    """
+    with _locks_lock:
+        session = _locks.get(_lock_key(path))
+    if session is not None:
+        if not session.held:
+            raise VaultBusy(path)
+        yield
+        return
+
+    lock = WriteLock(path)
+    if not lock.acquire():
+        raise VaultBusy(path)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+# =====================
+# Helpers
+# =====================
+
+def _lock_key(path: str) -> str:
+    return os.path.realpath(path)
+
+
+def _lock_file(f) -> None:
+    if os.name == "nt":
+        # Byte 0, even of an empty file: Windows locks ranges, not files
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _unlock_file(f) -> None:
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _fsync_dir(directory: str) -> None:
+    """
+    Persist the rename / create itself.
+    Not supported on Windows, where NTFS journals metadata anyway.
+    """
+    if os.name == "nt":
+        return
+
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _batch_due(path: str) -> bool:
+    with _pending_lock:
+        last = _last_sync.get(path)
+    return last is None or time.monotonic() - last >= FSYNC_BATCH_INTERVAL
+
+
+def _mark_dirty(path: str) -> None:
+    with _pending_lock:
+        _dirty.add(path)
+
+
+def _mark_synced(path: str) -> None:
+    with _pending_lock:
+        _dirty.discard(path)
+        _last_sync[path] = time.monotonic()
@@ -1,94 +1,853 @@
 from __future__ import annotations
 
+import itertools
 import json
 import os
-from typing import Any
+import struct
+from collections.abc import MutableSequence
+from typing import Any, Iterator
 
 from cryptography.fernet import Fernet, InvalidToken
 
+from core import codec as codecs
+from core import compression, journal, keys, records, sqlite_vault, storage
+from core.entry_store import EntryStore
+from core.compression import COMPRESS_NONE, Compression, Compressor
+from core.crypto import CIPHER_FERNET, DEFAULT_CIPHER, DEFAULT_UNLOCK_MS, PayloadCipher
+from core.keys import VaultKey
+from core.search import IndexSnapshot, SavedIndex, SearchIndex
+
 # =====================
 # ZipPass file format
 # =====================
 
 MAGIC = b"ZIPPASS"
-VERSION = b"\x01"
+VERSION_V1 = b"\x01"   # single Fernet token
+VERSION_V2 = b"\x02"   # index + per-entry records (core.records)
+VERSION = VERSION_V2
 HEADER_SIZE = len(MAGIC) + len(VERSION)
 
+# Redo record for in-place header rewrites (password changes)
+REKEY_SUFFIX = ".rekey"
+
+# Search index saved after the snapshot (save_search_index):
+# u64 revision it was saved at + the index encrypted with the data key
+SEARCH_SUFFIX = ".search"
+SEARCH_REVISION = struct.Struct(">Q")
+
+# Storage backends: one .zippass file, or a SQLite database
+# (core.sqlite_vault) for very large vaults. Told apart by signature.
+BACKEND_FILE = "file"
+BACKEND_SQLITE = "sqlite"
+
+# AEAD associated data of journal frames and the saved search index
+AAD_JOURNAL = b"zippass:journal"
+AAD_SEARCH = b"zippass:search-file"
+
 
 # =====================
-# Crypto helpers
+# Keys
 # =====================
 
-def _derive_key(master_password: str) -> bytes:
+def create_vault_key(
+    master_password: str,
+    target_ms: int = DEFAULT_UNLOCK_MS,
+) -> VaultKey:
     """
-    IMPORTANT:
-    You already have this logic in your project (crypto.py).
-    If you use a different key derivation, KEEP IT.
-    This is only a placeholder call site.
+    Random data key wrapped for `master_password` with a freshly
+    calibrated scrypt cost.
     """
-    from core.crypto import derive_key
-    return derive_key(master_password)
+    return keys.new_vault_key(master_password, target_ms)
+
+
+def derive_vault_key(master_password: str, path: str | None = None) -> VaultKey:
+    """
+    Run the KDF recorded in the vault header and unwrap the data key.
+    This is the slow step of unlocking; do it once per session.
+    """
+    if path is None:
+        path = _default_vault_path()
+
+    return keys.unlock_key(read_vault_header(path), master_password)
+
+
+def _resolve_key(secret: str | VaultKey, path: str) -> VaultKey:
+    """
+    Accept either a ready key or a master password.
+    A password costs a full KDF run.
+    """
+    if isinstance(secret, VaultKey):
+        return secret
+    if os.path.exists(path):
+        key = derive_vault_key(secret, path)
+        if key.is_envelope:
+            return key
+    return create_vault_key(secret)
 
 
 # =====================
 # Vault API
 # =====================
 
-def save_vault(vault: dict, master_password: str, path: str | None = None) -> None:
+def save_vault(
+    vault: dict,
+    master_password: str | VaultKey,
+    path: str | None = None,
+    compress: Compression | None = None,
+    codec: codecs.JsonCodec | codecs.CompactCodec | None = None,
+    backend: str | None = None,
+) -> storage.WriteStats:
     """
     Save vault to .zippass file with header.
+    Pass the session's VaultKey to skip key derivation; a plain
+    password re-runs the KDF (and upgrades older vaults to envelope keys).
+    `compress` and `codec` default to core.compression.COMPRESSION and
+    core.codec.CODEC. `backend` defaults to what `path` already is
+    (a file for new paths); passing the other one converts the vault.
+    The file is replaced atomically (temp file + fsync + rename),
+    see core.storage for the fsync policy.
+    Returns write timings and compression statistics.
+    Raises storage.VaultBusy while another process writes the vault.
     """
     if path is None:
         path = _default_vault_path()
+    if compress is None:
+        compress = compression.COMPRESSION
+    if codec is None:
+        codec = codecs.CODEC
+
+    with storage.writing(path):
+        return _save_vault(vault, master_password, path, compress, codec, backend)
+
+
+def _save_vault(
+    vault: dict,
+    master_password: str | VaultKey,
+    path: str,
+    compress: Compression,
+    codec: codecs.JsonCodec | codecs.CompactCodec,
+    backend: str | None,
+) -> storage.WriteStats:
+    vault_key = _resolve_key(master_password, path)
+    key = vault_key.key
+
+    header = vault_key.header()
+    if compress.name != COMPRESS_NONE:
+        header["compression"] = compress.to_header()
+    if codec.name != codecs.CODEC_JSON:
+        header["codec"] = codec.to_header()
+
+    if backend is None:
+        backend = _backend(path)
+    if backend not in (BACKEND_FILE, BACKEND_SQLITE):
+        raise ValueError(f"Unknown vault backend: {backend!r}")
+
+    search = _search_blob(vault)
+    if backend == BACKEND_SQLITE:
+        return _save_sqlite(vault, key, header, path, search)
+
+    # A journal started on another snapshot is not replayed over this one
+    header["generation"] = journal.new_generation()
+
+    # Records of unloaded entries are copied straight from the old mapping,
+    # which has to be closed before the file is replaced. The entries may
+    # be shared with the session (snapshot_vault), so reads on other
+    # threads wait from the close until they point at the new file.
+    old_sources = records.sources(vault)
+    chunks, placed, packed = records.build(vault, key, header, search=search)
+    was_sqlite = _backend(path) == BACKEND_SQLITE
+    swapping = False
+
+    def close_sources():
+        nonlocal swapping
+        if old_sources:
+            records.SOURCES_LOCK.acquire()
+            swapping = True
+        for source in old_sources:
+            source.close()
+        if was_sqlite:
+            sqlite_vault.remove_sidecars(path)
+
+    try:
+        try:
+            stats = storage.atomic_write(
+                path,
+                itertools.chain([MAGIC, VERSION], chunks),
+                before_replace=close_sources,
+            )
+        except BaseException:
+            # Old file is still in place
+            for source in old_sources:
+                source.reopen()
+            raise
+        if old_sources:
+            records.rebind(placed, records.RecordFile(path, key, HEADER_SIZE))
+    finally:
+        if swapping:
+            records.SOURCES_LOCK.release()
+
+    stats.compression = packed
+
+    # Snapshot now contains every journaled change, and its own index
+    journal.discard(path)
+    storage.remove(path + SEARCH_SUFFIX)
+    return stats
+
+
+def append_changes(
+    vault: dict,
+    changes: list[dict],
+    master_password: str | VaultKey,
+    path: str | None = None,
+) -> storage.WriteStats | None:
+    """
+    Persist a mutation as an encrypted journal record instead of
+    rewriting the whole vault. `vault` must already contain the changes.
+    Compacts into a fresh snapshot once the journal grows too large.
+    Returns write timings (stats.snapshot is True after a compaction).
+    """
+    if path is None:
+        path = _default_vault_path()
+
+    if not changes:
+        return None
+
+    # The journal has to use exactly the snapshot's key
+    if not os.path.exists(path):
+        return save_vault(vault, master_password, path)
+    if isinstance(master_password, VaultKey):
+        vault_key = master_password
+    else:
+        vault_key = derive_vault_key(master_password, path)
+
+    stats = journal_changes(changes, vault_key, path)
+
+    if stats and needs_compaction(path):
+        return save_vault(vault, vault_key, path)
+
+    return stats
+
+
+def journal_changes(
+    changes: list[dict],
+    key: VaultKey,
+    path: str,
+) -> storage.WriteStats | None:
+    """
+    Append change records to the journal without compacting.
+    `key` must be the key the snapshot at `path` was written with.
+    Frames use the codec of the snapshot and are compressed if it is.
+    SQLite vaults have no journal: the records become row writes.
+    """
+    if not changes:
+        return None
+
+    with storage.writing(path):
+        return _journal_changes(changes, key, path)
+
+
+def _journal_changes(
+    changes: list[dict],
+    key: VaultKey,
+    path: str,
+) -> storage.WriteStats | None:
+    if _backend(path) == BACKEND_SQLITE:
+        return sqlite_vault.apply_changes(path, key.key, changes)
+
+    header = read_vault_header(path)
+    compressor = None
+    if "compression" in header:
+        # Markers keep frames readable whatever the current setting
+        compressor = Compressor(compression.COMPRESSION)
+
+    frames = [_journal_frame(changes, header, key, compressor)]
+    generation = header.get("generation")
+    if generation is not None and _journal_generation(path, header, key.key) != generation:
+        # No journal yet, or one the snapshot already holds (a crash
+        # before its removal): start a fresh one on this snapshot
+        journal.discard(path)
+        frames.insert(0, _journal_frame([journal.generation(generation)], header, key, compressor))
+
+    _, stats = journal.append_records(path, frames)
+    stats.compression = compressor.stats if compressor else None
+    return stats
+
+
+def save_search_index(
+    vault: dict,
+    key: VaultKey,
+    path: str | None = None,
+) -> storage.WriteStats | None:
+    """
+    Save the vault's search index (core.search) if it was built this
+    session, so the next unlock restores it instead of building it.
+    vault["search"] may also be a snapshot of one (snapshot_vault),
+    e.g. to encode it on another thread. The vault is not rewritten:
+    SQLite vaults store the index in a row, file vaults in
+    <vault>.search, tagged with the snapshot's meta["revision"].
+    Call with no changes pending.
+    Raises storage.VaultBusy while another process writes the vault.
+    """
+    if path is None:
+        path = _default_vault_path()
+
+    snapshot = vault.get("search")
+    if isinstance(snapshot, SearchIndex):
+        if not snapshot.needs_save:
+            return None
+        snapshot = snapshot.snapshot()   # None: compacting on the search thread
+    if not isinstance(snapshot, IndexSnapshot):
+        return None
 
-    key = _derive_key(master_password)
-    fernet = Fernet(key)
+    with storage.writing(path):
+        if _backend(path) == BACKEND_SQLITE:
+            return sqlite_vault.save_search(path, key.key, snapshot.encode)
+        revision = vault.get("meta", {}).get("revision", 0)
+        prefix = SEARCH_REVISION.pack(revision)
+        token = key.payload_cipher().encrypt(snapshot.encode(revision), AAD_SEARCH + prefix)
+        return storage.atomic_write(path + SEARCH_SUFFIX, [prefix, token])
 
-    payload = json.dumps(vault, ensure_ascii=False).encode("utf-8")
-    encrypted = fernet.encrypt(payload)
 
-    with open(path, "wb") as f:
-        f.write(MAGIC)
-        f.write(VERSION)
-        f.write(encrypted)
+def needs_compaction(path: str) -> bool:
+    if _backend(path) == BACKEND_SQLITE:
+        return False
+    return journal.should_compact(
+        journal.journal_size(path),
+        journal.snapshot_size(path),
+    )
 
 
-def load_vault(master_password: str, path: str | None = None) -> dict:
+def snapshot_vault(vault: dict) -> dict:
+    """
+    Copy of the vault that later edits won't touch, for saving on
+    another thread. Unloaded lazy entries are shared, not decrypted.
+    """
+    meta = dict(vault.get("meta", {}))
+    if "usage" in meta:
+        meta["usage"] = dict(meta["usage"])   # core.frecency updates it in place
+    snapshot = {
+        "meta": meta,
+        "categories": [dict(c) for c in vault["categories"]],
+        "entries": [records.snapshot_entry(e) for e in vault["entries"]],
+    }
+    search = vault.get("search")
+    if isinstance(search, SearchIndex):
+        snapshot["search"] = search.snapshot()
+    return snapshot
+
+
+def load_vault(master_password: str | VaultKey, path: str | None = None) -> dict:
     """
     Load vault from .zippass file.
     Validates header BEFORE decrypting.
+    Entries come back in an EntryStore (core.entry_store); those of a
+    SQLite vault are paged in as they are accessed.
+    """
+    if path is None:
+        path = _default_vault_path()
+
+    if _backend(path) == BACKEND_SQLITE:
+        key = _unlock_key(master_password, path)
+        vault = sqlite_vault.load(path, key)
+        _validate_vault(vault)
+        _saved_search(vault, set())
+        vault["entries"] = EntryStore.wrap(vault["entries"])
+        return vault
+
+    version = _read_version(path)
+    pending = _redo_header(path) if version == VERSION_V2 else None
+
+    key = _unlock_key(master_password, path)
+
+    if version == VERSION_V1:
+        vault = _load_v1(path, Fernet(key))
+        header = {}
+    else:
+        # The header of the mapped file: a save may rename another in meanwhile
+        vault, header = records.open_records(path, key, HEADER_SIZE, pending)
+        search = _read_search(path, header, key, vault["meta"].get("revision", 0))
+        if search is not None:
+            vault["search"] = search
+
+    _validate_vault(vault)
+
+    # ---- Replay journal ----
+    changed: set[str] | None = set()
+    for changes in _read_journal(path, header, key):
+        journal.apply_changes(vault, changes)
+        ids = journal.changed_entries(changes)
+        if ids is None or changed is None:
+            changed = None
+        else:
+            changed |= ids
+
+    _saved_search(vault, changed)
+    vault["entries"] = EntryStore.wrap(vault["entries"])
+    return vault
+
+
+def stream_vault(
+    master_password: str | VaultKey,
+    path: str | None = None,
+) -> tuple[dict, Iterator[dict]]:
+    """
+    Read a vault without holding all of it: returns the vault without
+    "entries" (meta, categories) and an iterator of fully decrypted
+    entries, produced one index chunk at a time with the journal
+    applied. For export and other one-pass readers; the UI uses
+    load_vault. v1 files are a single token and are loaded whole.
+    """
+    if path is None:
+        path = _default_vault_path()
+
+    if _backend(path) == BACKEND_SQLITE:
+        return sqlite_vault.stream(path, _unlock_key(master_password, path))
+
+    version = _read_version(path)
+    pending = _redo_header(path) if version == VERSION_V2 else None
+
+    key = _unlock_key(master_password, path)
+
+    if version == VERSION_V1:
+        vault = _load_v1(path, Fernet(key))
+        _validate_vault(vault)
+        entries = iter(vault.pop("entries"))
+        header = {}
+    else:
+        vault, header, entries = records.stream_records(path, key, HEADER_SIZE, pending)
+
+    changes = [c for batch in _read_journal(path, header, key) for c in batch]
+    journal.apply_changes(
+        {"entries": [], "categories": vault["categories"]},
+        [c for c in changes if c.get("op") in ("put_category", "delete_category")],
+    )
+
+    return vault, journal.replay_entries(entries, changes)
+
+
+def unlock_vault(master_password: str, path: str | None = None) -> tuple[dict, VaultKey]:
+    """
+    Derive the key once and load the vault with it.
+    Vaults without an envelope key or still on Fernet are re-saved
+    with an envelope key and the default AEAD cipher if this process
+    holds the writer lock (core.storage); nothing is written otherwise.
+    """
+    if path is None:
+        path = _default_vault_path()
+
+    key = derive_vault_key(master_password, path)
+    vault = load_vault(key, path)
+
+    if not storage.holds(path):
+        return vault, key
+
+    if not key.is_envelope:
+        key = create_vault_key(master_password)
+        save_vault(vault, key, path)
+    elif key.cipher != DEFAULT_CIPHER:
+        key = keys.with_cipher(key, DEFAULT_CIPHER)
+        save_vault(vault, key, path)
+
+    return vault, key
+
+
+def open_vault(
+    master_password: str,
+    path: str | None = None,
+) -> tuple[dict, VaultKey, storage.WriteLock]:
+    """
+    unlock_vault for a session: the writer lock (storage.lock_vault)
+    is taken before anything is read, so no other process writes
+    between the load and the session's first save. Pass the lock on
+    to Session.unlock; if another process holds it, the vault is
+    read-only.
+    """
+    if path is None:
+        path = _default_vault_path()
+
+    lock = storage.lock_vault(path)
+    try:
+        vault, key = unlock_vault(master_password, path)
+    except BaseException:
+        lock.release()
+        raise
+    return vault, key, lock
+
+
+def read_vault_header(path: str) -> dict:
+    """
+    Plaintext header (key slots etc.). v1 files have none.
+    """
+    if _backend(path) == BACKEND_SQLITE:
+        return sqlite_vault.read_header(path)
+
+    version = _read_version(path)
+    if version == VERSION_V1:
+        return {}
+
+    pending = _redo_header(path)
+    if pending is not None:
+        return pending
+
+    with open(path, "rb") as f:
+        data = f.read(HEADER_SIZE + records.HEADER_LEN.size)
+        (size,) = records.HEADER_LEN.unpack_from(data, HEADER_SIZE)
+        return json.loads(f.read(size).decode("utf-8"))
+
+
+# =====================
+# Key slots
+# =====================
+
+def change_master_password(
+    key: VaultKey,
+    old_password: str,
+    new_password: str,
+    path: str | None = None,
+    vault: dict | None = None,
+) -> VaultKey:
+    """
+    Re-wrap the data key for `new_password` in the slot `old_password`
+    opens. Only the header is rewritten; the body stays as it is.
+    Raises ValueError if `old_password` is wrong.
     """
     if path is None:
         path = _default_vault_path()
 
+    slots = list(_slots(key))
+    i = keys.find_slot(key, old_password)
+    slots[i] = keys.make_slot(key.key, new_password)
+
+    new_key = keys.with_slots(key, slots)
+    _store_slots(new_key, path, vault)
+    return new_key
+
+
+def add_unlock_slot(
+    key: VaultKey,
+    password: str,
+    path: str | None = None,
+    vault: dict | None = None,
+) -> VaultKey:
+    """
+    Let another password open the same vault.
+    """
+    if path is None:
+        path = _default_vault_path()
+
+    new_key = keys.with_slots(key, _slots(key) + [keys.make_slot(key.key, password)])
+    _store_slots(new_key, path, vault)
+    return new_key
+
+
+def remove_unlock_slot(
+    key: VaultKey,
+    slot_id: str,
+    path: str | None = None,
+    vault: dict | None = None,
+) -> VaultKey:
+    if path is None:
+        path = _default_vault_path()
+
+    slots = [s for s in _slots(key) if s["id"] != slot_id]
+    if not slots:
+        raise ValueError("Cannot remove the last unlock slot")
+
+    new_key = keys.with_slots(key, slots)
+    _store_slots(new_key, path, vault)
+    return new_key
+
+
+def write_header(path: str, key: VaultKey) -> storage.WriteStats | None:
+    """
+    Rewrite the key slots in place: a few hundred bytes whatever the
+    vault size. The new header is first committed to <vault>.rekey
+    (atomic_write), then copied over the old one; an interrupted copy
+    is redone on the next open.
+    Returns None if the header no longer fits its reserved space.
+    SQLite vaults update their header row in one transaction.
+    """
+    with storage.writing(path):
+        return _write_header(path, key)
+
+
+def _write_header(path: str, key: VaultKey) -> storage.WriteStats | None:
+    if _backend(path) == BACKEND_SQLITE:
+        header = sqlite_vault.read_header(path)
+        header.pop("kdf", None)
+        header.pop("slots", None)
+        header.update(key.header())
+        return sqlite_vault.write_header(path, header)
+
+    if _read_version(path) != VERSION_V2:
+        return None
+
+    _recover_header(path)
+
+    with open(path, "rb") as f:
+        f.seek(HEADER_SIZE)
+        (capacity,) = records.HEADER_LEN.unpack(f.read(records.HEADER_LEN.size))
+        header = json.loads(f.read(capacity).decode("utf-8"))
+
+    header.pop("kdf", None)
+    header.pop("slots", None)
+    header.update(key.header())
+
+    try:
+        region = records.encode_header(header, capacity)
+    except ValueError:
+        return None
+
+    rekey_path = path + REKEY_SUFFIX
+    storage.atomic_write(rekey_path, [region])
+    stats = storage.write_at(path, HEADER_SIZE, region)
+    storage.remove(rekey_path)
+    return stats
+
+
+def _slots(key: VaultKey) -> list[dict]:
+    if not key.is_envelope:
+        raise ValueError("Vault has no key slots; unlock it once to upgrade")
+    return list(key.slots)
+
+
+def _store_slots(key: VaultKey, path: str, vault: dict | None) -> None:
+    if write_header(path, key) is not None:
+        return
+    if vault is None:
+        raise ValueError("Vault header is full")
+    save_vault(vault, key, path)
+
+
+def _redo_header(path: str) -> dict | None:
+    """
+    Header rewrite left behind as a redo record. The writer lock
+    holder finishes it (_recover_header) and gets None; anyone else
+    may be watching it happen, so it gets the header to use instead
+    of the file's, which may be old or torn, and nothing is written.
+    """
+    if storage.holds(path):
+        with storage.writing(path):
+            _recover_header(path)
+        return None
+
+    region = _redo_region(path)
+    if region is None:
+        return None
+    header, _ = records.read_header(region, 0)
+    return header
+
+
+def _recover_header(path: str) -> None:
+    """
+    Finish a header rewrite that was interrupted after its redo
+    record was committed. Hold the writer lock.
+    """
+    region = _redo_region(path)
+    if region is not None:
+        storage.write_at(path, HEADER_SIZE, region)
+    storage.remove(path + REKEY_SUFFIX)
+
+
+def _redo_region(path: str) -> bytes | None:
+    """
+    Header region of the redo record, None without one or with one
+    made for another layout.
+    """
+    try:
+        with open(path + REKEY_SUFFIX, "rb") as f:
+            region = f.read()
+    except FileNotFoundError:
+        return None
+
+    with open(path, "rb") as f:
+        f.seek(HEADER_SIZE)
+        current = f.read(records.HEADER_LEN.size)
+
+    # Only redo onto the layout the record was made for
+    if current != region[:records.HEADER_LEN.size]:
+        return None
+    return region
+
+
+# =====================
+# Helpers
+# =====================
+
+def _backend(path: str) -> str:
+    if os.path.exists(path) and sqlite_vault.is_sqlite_vault(path):
+        return BACKEND_SQLITE
+    return BACKEND_FILE
+
+
+def _unlock_key(secret: str | VaultKey, path: str) -> bytes:
+    if isinstance(secret, VaultKey):
+        return secret.key
+    return derive_vault_key(secret, path).key
+
+
+def _save_sqlite(
+    vault: dict,
+    key: bytes,
+    header: dict,
+    path: str,
+    search: bytes | None = None,
+) -> storage.WriteStats:
+    """
+    Whole-vault save to a SQLite database, e.g. converting a file vault.
+    """
+    # Entries still bound to an old vault file are read before it is
+    # replaced, then the file is let go
+    converting = _backend(path) != BACKEND_SQLITE
+    old_sources = records.sources(vault) if converting else []
+
+    stats = sqlite_vault.save(vault, key, header, path, search)
+
+    for source in old_sources:
+        source.close()
+    journal.discard(path)
+    return stats
+
+
+def _search_blob(vault: dict) -> bytes | None:
+    """
+    Bump the content revision of `vault` and encode its search index
+    (a live SearchIndex, or the snapshot_vault copy of one) tagged
+    with it. None without a built index.
+    """
+    meta = vault.setdefault("meta", {})
+    meta["revision"] = meta.get("revision", 0) + 1
+
+    search = vault.get("search")
+    if isinstance(search, SearchIndex):
+        search = search.snapshot()
+    if isinstance(search, IndexSnapshot):
+        return search.encode(meta["revision"])
+    return None
+
+
+def _read_search(path: str, header: dict, key: bytes, revision: int) -> bytes | None:
+    """
+    Index saved in <vault>.search after the snapshot at `path`, None
+    without one or with one of another revision (the snapshot's own
+    index, if any, is used then). Only a cache: errors are ignored.
+    """
+    try:
+        with open(path + SEARCH_SUFFIX, "rb") as f:
+            prefix = f.read(SEARCH_REVISION.size)
+            if len(prefix) < SEARCH_REVISION.size or SEARCH_REVISION.unpack(prefix)[0] != revision:
+                return None
+            token = f.read()
+        cipher = PayloadCipher(header.get("cipher", CIPHER_FERNET), key)
+        return cipher.decrypt(token, AAD_SEARCH + prefix)
+    except (OSError, ValueError):
+        return None
+
+
+def _saved_search(vault: dict, changed: set[str] | None) -> None:
+    """
+    Wrap the search index saved with a loaded vault for
+    SearchIndex.for_vault. `changed`: entries the journal changed
+    since, None if it cleared them all.
+    """
+    data = vault.pop("search", None)
+    if data is not None and changed is not None:
+        vault["search"] = SavedIndex(data, vault.get("meta", {}).get("revision", 0), changed)
+
+
+def _read_version(path: str) -> bytes:
+    """
+    Validates header BEFORE anything is decrypted.
+    """
     with open(path, "rb") as f:
         header = f.read(HEADER_SIZE)
-        data = f.read()
 
-    # ---- Header validation ----
     if not header.startswith(MAGIC):
         raise ValueError("Not a ZipPass vault file")
 
     version = header[len(MAGIC):]
-    if version != VERSION:
+    if version not in (VERSION_V1, VERSION_V2):
         raise ValueError(f"Unsupported ZipPass vault version: {version!r}")
 
-    key = _derive_key(master_password)
-    fernet = Fernet(key)
+    return version
+
+
+def _read_journal(path: str, header: dict, key: bytes) -> Iterator[list[dict]]:
+    """
+    Decrypted journal frames. They use the cipher, compression and
+    codec of the snapshot they follow. A journal started on another
+    snapshot generation (core.journal) is not replayed; the next
+    append (journal_changes) replaces it. Only the writer lock holder
+    cuts off a torn tail, see journal.read_records.
+    """
+    if storage.holds(path):
+        with storage.writing(path):
+            records = journal.read_records(path, repair=True)
+    else:
+        records = journal.read_records(path)
+
+    generation = header.get("generation")
+    if generation is not None and records:
+        if _decode_journal(records[0], header, key) != [journal.generation(generation)]:
+            return
+        records = records[1:]
+
+    for record in records:
+        yield _decode_journal(record, header, key)
+
+
+def _journal_generation(path: str, header: dict, key: bytes) -> str | None:
+    """
+    Snapshot generation the journal at `path` was started on, None
+    without a journal or one that doesn't name it.
+    """
+    record = journal.read_first_record(path)
+    if record is None:
+        return None
+    changes = _decode_journal(record, header, key)
+    if len(changes) == 1 and changes[0].get("op") == "generation":
+        return changes[0].get("generation")
+    return None
+
+
+def _journal_frame(
+    changes: list[dict],
+    header: dict,
+    key: VaultKey,
+    compressor: Compressor | None,
+) -> bytes:
+    payload = codecs.from_header(header.get("codec")).encode(changes)
+    if compressor is not None:
+        payload = compressor.compress(payload)
+    return key.payload_cipher().encrypt(payload, AAD_JOURNAL)
+
+
+def _decode_journal(record: bytes, header: dict, key: bytes) -> list[dict]:
+    cipher = PayloadCipher(header.get("cipher", CIPHER_FERNET), key)
+    try:
+        payload = cipher.decrypt(record, AAD_JOURNAL)
+        if "compression" in header:
+            payload = compression.decompress(payload)
+        return codecs.from_header(header.get("codec")).decode(payload)
+    except ValueError:
+        raise ValueError("Corrupted vault journal")
+
+
+def _load_v1(path: str, fernet: Fernet) -> dict:
+    """
+    Legacy layout: the whole vault is one Fernet token.
+    """
+    with open(path, "rb") as f:
+        f.seek(HEADER_SIZE)
+        data = f.read()
 
     try:
         decrypted = fernet.decrypt(data)
     except InvalidToken:
         raise ValueError("Invalid master password or corrupted vault")
 
-    vault = json.loads(decrypted.decode("utf-8"))
-    _validate_vault(vault)
-    return vault
-
+    return json.loads(decrypted.decode("utf-8"))
 
-# =====================
-# Helpers
-# =====================
 
 def _default_vault_path() -> str:
     """
@@ -109,7 +868,7 @@ def _validate_vault(vault: Any) -> None:
     if "entries" not in vault or "categories" not in vault:
         raise ValueError("Invalid vault format")
 
-    if not isinstance(vault["entries"], list):
+    if not isinstance(vault["entries"], MutableSequence):
         raise ValueError("Invalid entries format")
 
     if not isinstance(vault["categories"], list):
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import storage  # noqa: E402
+from core.vault import create_vault_key  # noqa: E402
+
+PASSWORD = "correct horse"
+
+
+@pytest.fixture(autouse=True)
+def no_fsync():
+    policy = storage.FSYNC_POLICY
+    storage.set_fsync_policy(storage.FSYNC_NEVER)
+    yield
+    storage.set_fsync_policy(policy)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "vault.zippass")
+
+
+@pytest.fixture(scope="session")
+def key():
+    # Cheap scrypt parameters: the tests are about storage, not the KDF
+    return create_vault_key(PASSWORD, 20)
+
+
+def make_vault(count: int = 5) -> dict:
+    return {
+        "meta": {},
+        "categories": [{"id": "work", "name": "Работа"}],
+        "entries": [
+            {
+                "id": f"e{i}",
+                "service": f"Service {i}",
+                "login": f"user{i}",
+                "password": f"secret-{i}",
+                "url": f"https://www.site{i}.example.com/login",
+                "category_id": "work" if i % 2 else "all",
+                "created_at": 1700000000.0 + i,
+                "updated_at": 1700000000.0 + i,
+            }
+            for i in range(count)
+        ],
+    }
@@ -0,0 +1,126 @@
+import random
+
+import pytest
+
+from conftest import make_vault
+from core import journal
+from core.entry_store import EntryStore
+from core.vault import BACKEND_SQLITE, load_vault, save_vault
+
+
+class ListModel:
+    """
+    What EntryStore has to behave like: a plain list searched by id.
+    """
+
+    def __init__(self, entries):
+        self.entries = [dict(e) for e in entries]
+
+    def find(self, entry_id):
+        for i, entry in enumerate(self.entries):
+            if entry["id"] == entry_id:
+                return i
+        return None
+
+    def add(self, entry):
+        i = self.find(entry["id"])
+        if i is None:
+            self.entries.append(dict(entry))
+        else:
+            self.entries[i] = dict(entry)
+
+    def update(self, entry_id, fields):
+        self.entries[self.find(entry_id)].update(fields)
+
+    def delete(self, entry_ids):
+        gone = [i for i in entry_ids if self.find(i) is not None]
+        self.entries = [e for e in self.entries if e["id"] not in gone]
+        return gone
+
+
+def _check(store: EntryStore, model: ListModel) -> None:
+    assert [dict(e) for e in store] == model.entries
+    assert len(store) == len(model.entries)
+    for i, entry in enumerate(model.entries):
+        assert store.index_of(entry["id"]) == i
+        assert dict(store.get(entry["id"])) == entry
+        assert dict(store[i]) == entry
+    for category in ("all", "work", "home"):
+        # Order within a category is not part of the contract
+        assert sorted(e["id"] for e in store.in_category(category)) == sorted(
+            e["id"] for e in model.entries if e.get("category_id", "all") == category
+        )
+
+
+def _exercise(store: EntryStore, seed: int) -> None:
+    rnd = random.Random(seed)
+    model = ListModel(store)
+    _check(store, model)
+
+    for step in range(200):
+        op = rnd.random()
+        known = [e["id"] for e in model.entries]
+        if op < 0.4 or not known:
+            entry_id = rnd.choice(known) if known and rnd.random() < 0.3 else f"n{step}"
+            entry = {
+                "id": entry_id,
+                "service": f"S{step}",
+                "category_id": rnd.choice(("all", "work", "home")),
+            }
+            changes = store.add(dict(entry))
+            model.add(entry)
+            assert changes == [journal.put_entry(store.get(entry_id))]
+        elif op < 0.7:
+            entry_id = rnd.choice(known)
+            fields = {"login": f"l{step}", "category_id": rnd.choice(("all", "work", "home"))}
+            store.update(entry_id, fields)
+            model.update(entry_id, fields)
+        else:
+            ids = rnd.sample(known, min(len(known), rnd.randint(1, 3))) + ["nope"]
+            changes = store.delete(ids)
+            gone = model.delete(ids)
+            assert changes == [journal.delete_entry(i) for i in gone]
+        assert store.missing(known + ["nope"]) == {
+            i for i in known + ["nope"] if model.find(i) is None
+        }
+        if step % 20 == 0:
+            _check(store, model)
+    _check(store, model)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_against_list(seed):
+    _exercise(EntryStore(make_vault(20)["entries"]), seed)
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_paged_against_list(path, key, seed):
+    save_vault(make_vault(20), key, path, backend=BACKEND_SQLITE)
+    store = EntryStore.wrap(load_vault(key, path)["entries"])
+    assert not store.is_indexed
+
+    _exercise(store, seed)
+
+
+def test_sequence_ops():
+    store = EntryStore(make_vault(3)["entries"])
+    model = make_vault(3)["entries"]
+
+    store.insert(1, {"id": "x"})
+    model.insert(1, {"id": "x"})
+    del store[0]
+    del model[0]
+    store[-1] = {"id": "y", "category_id": "home"}
+    model[-1] = {"id": "y", "category_id": "home"}
+
+    assert list(store) == model
+    assert store.index({"id": "x"}) == 0
+    assert {"id": "x"} in store and {"id": "z"} not in store
+    with pytest.raises(ValueError):
+        store.remove({"id": "z"})
+    with pytest.raises(KeyError):
+        store.update("z", {})
+
+    version = store.version
+    store.clear()
+    assert not store and store.version > version
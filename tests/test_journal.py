@@ -0,0 +1,87 @@
+import os
+from unittest import mock
+
+from conftest import make_vault
+from core import journal, storage
+from core.vault import append_changes, load_vault, save_vault
+
+
+def _ids(vault: dict) -> list[str]:
+    return [entry["id"] for entry in vault["entries"]]
+
+
+def _new_entry(entry_id: str) -> dict:
+    return {"id": entry_id, "service": entry_id.upper(), "password": "x"}
+
+
+def test_replay(path, key):
+    save_vault(make_vault(2), key, path)
+    vault = load_vault(key, path)
+    entry = _new_entry("new")
+    changes = vault["entries"].add(entry)
+    changes += vault["entries"].delete(["e0"])
+
+    append_changes(vault, changes, key, path)
+
+    assert journal.read_records(path)
+    assert _ids(load_vault(key, path)) == ["e1", "new"]
+
+
+def test_torn_tail_left_to_writer(path, key):
+    save_vault(make_vault(2), key, path)
+    vault = load_vault(key, path)
+    append_changes(vault, vault["entries"].add(_new_entry("new")), key, path)
+    complete = os.path.getsize(journal.journal_path(path))
+
+    # A frame whose body never made it to disk
+    with open(journal.journal_path(path), "ab") as f:
+        f.write(journal.FRAME.pack(100) + b"partial")
+    torn = os.path.getsize(journal.journal_path(path))
+
+    # Readers skip it, and don't touch it: it may be a write in progress
+    assert _ids(load_vault(key, path)) == ["e0", "e1", "new"]
+    assert os.path.getsize(journal.journal_path(path)) == torn
+
+    # The lock holder knows it is a crash's leftover and cuts it off
+    lock = storage.lock_vault(path)
+    try:
+        assert _ids(load_vault(key, path)) == ["e0", "e1", "new"]
+        assert os.path.getsize(journal.journal_path(path)) == complete
+
+        vault = load_vault(key, path)
+        append_changes(vault, vault["entries"].add(_new_entry("later")), key, path)
+    finally:
+        lock.release()
+
+    assert _ids(load_vault(key, path)) == ["e0", "e1", "new", "later"]
+
+
+def test_read_records_repair(path):
+    journal.append_record(path, b"one")
+    with open(journal.journal_path(path), "ab") as f:
+        f.write(journal.FRAME.pack(10) + b"tw")
+
+    assert journal.read_records(path) == [b"one"]
+    assert journal.read_records(path, repair=True) == [b"one"]
+    assert os.path.getsize(journal.journal_path(path)) == journal.FRAME.size + 3
+
+
+def test_stale_generation_skipped(path, key):
+    save_vault(make_vault(2), key, path)
+    vault = load_vault(key, path)
+    append_changes(vault, vault["entries"].add(_new_entry("new")), key, path)
+
+    # Crash between the snapshot rename and the journal discard: the
+    # journal belongs to the old snapshot and must not be replayed
+    vault = load_vault(key, path)
+    vault["entries"].delete(["new", "e0"])
+    with mock.patch.object(journal, "discard", lambda path: None):
+        save_vault(vault, key, path)
+    assert os.path.exists(journal.journal_path(path))
+
+    assert _ids(load_vault(key, path)) == ["e1"]
+
+    # Appending starts a journal of the current snapshot
+    vault = load_vault(key, path)
+    append_changes(vault, vault["entries"].add(_new_entry("next")), key, path)
+    assert _ids(load_vault(key, path)) == ["e1", "next"]
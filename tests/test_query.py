@@ -0,0 +1,135 @@
+import re
+from datetime import datetime
+
+import pytest
+
+from conftest import make_vault
+from core.entry_store import EntryStore
+from core.query import Cancelled, Term, execute, parse
+from core.search import SearchIndex
+
+NOW = datetime(2024, 6, 1, 12, 0).timestamp()
+DAY = 86400
+
+
+def test_plain_words():
+    query = parse("  GitHub   Work ", now=NOW)
+    assert query.is_plain
+    assert query.text == "github work"
+
+
+@pytest.mark.parametrize("name", ["service", "login", "domain", "url", "note", "category"])
+def test_field(name):
+    query = parse(f"{name}:Alice rest", now=NOW)
+    assert query.terms == [Term(name, "alice")]
+    assert query.text == "rest"
+
+
+def test_quoted_value():
+    query = parse('category:"Дом и быт" login:bob', now=NOW)
+    assert query.terms == [Term("category", "дом и быт"), Term("login", "bob")]
+    assert query.text == ""
+
+
+def test_phrase():
+    assert parse('"two words" x', now=NOW).text == "two words x"
+
+
+@pytest.mark.parametrize(
+    "value, span",
+    [
+        ("<90d", (NOW - 90 * DAY, float("inf"))),
+        (">1y", (float("-inf"), NOW - 365 * DAY)),
+        ("<12h", (NOW - 12 * 3600, float("inf"))),
+    ],
+)
+def test_durations(value, span):
+    assert parse(f"updated:{value}", now=NOW).terms == [Term("updated", span)]
+
+
+def test_dates():
+    day = datetime(2024, 5, 1).timestamp()
+    assert parse("created:2024-05-01", now=NOW).terms == [Term("created", (day, day + DAY))]
+    assert parse("created:<2024-05-01", now=NOW).terms == [Term("created", (float("-inf"), day))]
+    assert parse("created:>2024-05-01", now=NOW).terms == [
+        Term("created", (day + DAY, float("inf")))
+    ]
+
+
+@pytest.mark.parametrize("value, weak", [("yes", True), ("да", True), ("no", False), ("0", False)])
+def test_weak(value, weak):
+    assert parse(f"weak:{value}", now=NOW).terms == [Term("weak", weak)]
+
+
+def test_regex():
+    (term,) = parse(r"/^gh[a-z]+\d$/ x", now=NOW).terms
+    assert term.field == "regex"
+    assert term.value.flags & re.IGNORECASE
+    assert term.value.search("GHub1")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "https://example.com/login",   # unknown field
+        "updated:soon",                # bad value
+        "weak:maybe",
+        "login:",                      # empty value
+        "/[unclosed/",                 # bad regex
+    ],
+)
+def test_left_as_text(text):
+    query = parse(text, now=NOW)
+    assert query.is_plain
+    assert query.text
+
+
+def _index(count: int = 5) -> SearchIndex:
+    return SearchIndex(EntryStore(make_vault(count)["entries"]))
+
+
+def _ids(rows: list[dict]) -> list[str]:
+    return [row["id"] for row in rows]
+
+
+def test_weak_verdicts_cached():
+    index = _index()
+    checked = []
+
+    def is_weak(password):
+        checked.append(password)
+        return password.endswith(("1", "3"))
+
+    verdicts = {}
+    assert _ids(execute(parse("weak:yes"), index, is_weak=is_weak, weak_verdicts=verdicts)) == [
+        "e1", "e3",
+    ]
+    assert len(checked) == 5
+    assert _ids(execute(parse("weak:no"), index, is_weak=is_weak, weak_verdicts=verdicts)) == [
+        "e0", "e2", "e4",
+    ]
+    assert len(checked) == 5
+
+    # An edit stamps updated_at, which makes the entry checked again
+    index.store.update("e0", {"password": "secret-3", "updated_at": NOW})
+    index.changed(["e0"])
+    assert _ids(execute(parse("weak:yes"), index, is_weak=is_weak, weak_verdicts=verdicts)) == [
+        "e0", "e1", "e3",
+    ]
+    assert checked[5:] == ["secret-3"]
+
+
+def test_regex_cancelled_between_fields():
+    index = _index(1)
+    index.prepare()
+    calls = []
+
+    def check():
+        calls.append(None)
+        if len(calls) > 3:
+            raise Cancelled()
+
+    # "work" is in no field: every field is searched, with a check before each
+    with pytest.raises(Cancelled):
+        execute(parse("/work/"), index, check=check)
+    assert _ids(execute(parse("/^user0$/"), index)) == ["e0"]
@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+import textwrap
+from contextlib import contextmanager
+
+import pytest
+
+from conftest import make_vault
+from core import storage
+from core.vault import append_changes, load_vault, save_vault
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Holds the writer lock until its stdin is closed
+_HOLDER = textwrap.dedent(
+    """
+    import sys
+    from core import storage
+
+    lock = storage.lock_vault(sys.argv[1])
+    print("held" if lock.held else "busy", flush=True)
+    sys.stdin.read()
+    lock.release()
+    """
+)
+
+
+@contextmanager
+def locked_elsewhere(path: str):
+    """
+    Writer lock of `path` held by another process for the block.
+    """
+    proc = subprocess.Popen(
+        [sys.executable, "-c", _HOLDER, path],
+        cwd=ROOT,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert proc.stdout.readline().strip() == "held"
+        yield
+    finally:
+        proc.stdin.close()
+        proc.wait(timeout=10)
+
+
+def test_vault_busy(path, key):
+    with locked_elsewhere(path), pytest.raises(storage.VaultBusy):
+        save_vault(make_vault(), key, path)
+    assert not os.path.exists(path)
+
+
+def test_session_lock_not_held(path, key):
+    save_vault(make_vault(), key, path)
+    with locked_elsewhere(path):
+        lock = storage.lock_vault(path)
+        try:
+            assert not lock.held
+            assert not storage.holds(path)
+            vault = load_vault(key, path)
+            with pytest.raises(storage.VaultBusy):
+                append_changes(vault, vault["entries"].delete(["e0"]), key, path)
+        finally:
+            lock.release()
+
+    # Free again once the other process is done
+    vault = load_vault(key, path)
+    append_changes(vault, vault["entries"].delete(["e0"]), key, path)
+    assert [e["id"] for e in load_vault(key, path)["entries"]] == ["e1", "e2", "e3", "e4"]
+
+
+def test_lock_is_per_holder(path):
+    lock = storage.lock_vault(path)
+    try:
+        assert lock.held and storage.holds(path)
+        assert not storage.WriteLock(path).acquire()
+    finally:
+        lock.release()
+    assert not storage.holds(path)
@@ -0,0 +1,62 @@
+import itertools
+
+import pytest
+
+from conftest import PASSWORD, make_vault
+from core import keys
+from core.codec import CODECS, make_codec
+from core.compression import COMPRESSORS, Compression
+from core.crypto import CIPHERS
+from core.vault import (
+    BACKEND_FILE,
+    BACKEND_SQLITE,
+    load_vault,
+    save_vault,
+    unlock_vault,
+)
+
+
+def _entries(vault: dict) -> list[dict]:
+    return [dict(entry) for entry in vault["entries"]]
+
+
+@pytest.mark.parametrize(
+    "cipher, compressor, codec",
+    list(itertools.product(CIPHERS, COMPRESSORS, CODECS)),
+)
+def test_round_trip(path, key, cipher, compressor, codec):
+    vault = make_vault()
+    key = keys.with_cipher(key, cipher)
+
+    save_vault(vault, key, path, compress=Compression(compressor), codec=make_codec(codec))
+
+    assert _entries(load_vault(key, path)) == make_vault()["entries"]
+    assert _entries(unlock_vault(PASSWORD, path)[0]) == make_vault()["entries"]
+
+
+@pytest.mark.parametrize("cipher", CIPHERS)
+def test_sqlite_round_trip(path, key, cipher):
+    key = keys.with_cipher(key, cipher)
+    save_vault(make_vault(), key, path, backend=BACKEND_SQLITE)
+
+    assert _entries(load_vault(key, path)) == make_vault()["entries"]
+
+
+def test_convert_backend(path, key):
+    save_vault(make_vault(), key, path, backend=BACKEND_SQLITE)
+    save_vault(load_vault(key, path), key, path, backend=BACKEND_FILE)
+
+    assert _entries(load_vault(key, path)) == make_vault()["entries"]
+
+
+@pytest.mark.parametrize("backend", [BACKEND_FILE, BACKEND_SQLITE])
+def test_wrong_password(path, key, backend):
+    save_vault(make_vault(), key, path, backend=backend)
+
+    with pytest.raises(ValueError):
+        unlock_vault("wrong horse", path)
+
+
+def test_key_not_in_repr(key):
+    assert key.key.decode() not in repr(key)
+    assert "cipher=" in repr(key)
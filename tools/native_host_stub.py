@@ -0,0 +1,112 @@
+"""
+Browser stand-in for the native messaging host.
+
+    python -m tools.native_host_stub [--vault FILE] [--count 10000]
+
+Runs core.native_host.NativeHost.serve() on a thread and talks to it
+over pipes the way an extension does: length-prefixed JSON frames from
+encode_message, answers read back with read_message. Sends a scripted
+session (status, unlock, lookups, logins, secret, a request with a
+"path", lock) and prints every response with its round trip. Without
+--vault a generated vault of --count entries is used.
+"""
+
+import argparse
+import getpass
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_cipher import make_vault
+from core.native_host import NativeHost, encode_message, read_message
+from core.vault import save_vault
+
+DEFAULT_COUNT = 10_000
+
+PASSWORD = "stub-password"
+
+URLS = (
+    "https://service-42.example.com/login",
+    "https://accounts.service-7.example.com",
+    "https://nowhere.example.org",
+)
+
+
+def script(password: str) -> list[dict]:
+    requests = [
+        {"action": "status"},
+        {"action": "lookup", "url": URLS[0]},
+        {"action": "unlock", "password": password, "path": "/etc/passwd"},
+        {"action": "unlock", "password": password},
+        {"action": "status"},
+    ]
+    requests += [{"action": "lookup", "url": url, "limit": 5} for url in URLS]
+    requests += [
+        {"action": "logins", "offset": 0, "limit": 3},
+        {"action": "secret", "entry": None, "field": "login"},
+        {"action": "nonsense"},
+        {"action": "lock"},
+        {"action": "lookup", "url": URLS[0]},
+    ]
+    for i, request in enumerate(requests, 1):
+        request["id"] = i
+    return requests
+
+
+def show(request: dict, response: dict, ms: float) -> None:
+    shown = {k: v for k, v in request.items() if k != "password"}
+    if "password" in request:
+        shown["password"] = "***"
+    if isinstance(response.get("entries"), list):
+        entries = response["entries"]
+        response = dict(response, entries=f"{len(entries)} entries")
+        if entries:
+            response["first"] = entries[0]
+    print(f"{ms:>7.1f} ms  -> {shown}")
+    print(f"{'':>11}<- {response}")
+
+
+def run(path: str | None, password: str) -> None:
+    host_in, stub_out = os.pipe()
+    stub_in, host_out = os.pipe()
+    with open(host_in, "rb") as stdin, open(host_out, "wb") as stdout:
+        host = NativeHost(path)
+        thread = threading.Thread(target=host.serve, args=(stdin, stdout), daemon=True)
+        thread.start()
+
+        with open(stub_out, "wb") as to_host, open(stub_in, "rb") as from_host:
+            requests = script(password)
+            for request in requests:
+                start = time.perf_counter()
+                to_host.write(encode_message(request))
+                to_host.flush()
+                response = read_message(from_host)
+                show(request, response, (time.perf_counter() - start) * 1000)
+                # "secret" needs an id the stub only learns from "logins"
+                if request["action"] == "logins" and response.get("entries"):
+                    for later in requests:
+                        if later["action"] == "secret":
+                            later["entry"] = response["entries"][0]["id"]
+            to_host.close()   # end of input: the host locks and returns
+            thread.join(timeout=5)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--vault", help="vault file to serve (default: a generated one)")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT,
+                        help="entries of the generated vault")
+    args = parser.parse_args()
+
+    if args.vault:
+        run(args.vault, getpass.getpass("Мастер-пароль: "))
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stub.zippass")
+        save_vault(make_vault(args.count), PASSWORD, path)
+        run(path, PASSWORD)
+
+
+if __name__ == "__main__":
+    main()
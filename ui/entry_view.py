@@ -125,22 +125,25 @@ class EntryView:
             webbrowser.open(url)
 
     def save(self):
-        self.entry["service"] = self.service_var.get().strip()
-        self.entry["login"] = self.login_var.get().strip()
-        self.entry["password"] = self.password_var.get()
-        self.entry["url"] = self.url_var.get().strip()
-        self.entry["note"] = self.note_text.get("1.0", "end").strip()
+        fields = {
+            "service": self.service_var.get().strip(),
+            "login": self.login_var.get().strip(),
+            "password": self.password_var.get(),
+            "url": self.url_var.get().strip(),
+            "note": self.note_text.get("1.0", "end").strip(),
+        }
 
         # категория
         selected_name = self.category_var.get()
         for c in self.categories:
             if c["name"] == selected_name:
-                self.entry["category_id"] = c["id"]
+                fields["category_id"] = c["id"]
                 break
         else:
-            self.entry["category_id"] = "all"
+            fields["category_id"] = "all"
 
-        self.entry["updated_at"] = time.time()
+        fields["updated_at"] = time.time()
 
-        self.on_save()
+        # Запись меняет владелец (EntryStore), не окно
+        self.on_save(fields)
         self.window.destroy()
@@ -1,3 +1,4 @@
+import queue
 import tkinter as tk
 from tkinter import ttk
 import webbrowser
@@ -5,10 +6,14 @@ from tkinter import filedialog, messagebox
 
 from ui.entry_view import EntryView
 from ui.settings_view import SettingsWindow
-from core.vault import save_vault
+from core.frecency import Frecency
+from core.query import QueryRunner
+from core.search import SearchIndex
+from core.vault import save_search_index, save_vault
 
 from utils.csv_tools import export_to_csv, import_from_csv
 from utils.icons import load_icon
+from utils.password import estimate_strength
 
 
 # 🎨 Цветовая схема
@@ -23,8 +28,22 @@ class MainWindow:
     def __init__(self, session):
         self.session = session
         self.vault = session.vault
+        self.search_index = SearchIndex.for_vault(self.vault)
+        self.frecency = Frecency(self.vault)
         self.icons = {}
 
+        # Searches run on a worker thread; results are polled from Tk
+        self.search_results = queue.Queue()
+        self.search_runner = QueryRunner(
+            self.search_index,
+            self.vault.setdefault("categories", []),
+            is_weak=lambda p: estimate_strength(p).level == "weak",
+            on_result=self.search_results.put,
+            frecency=self.frecency,
+        )
+        self.search_runner.warm()
+        self.search_ticket = None
+
         self.root = tk.Tk()
         self.root.title("ZipPass")
         self.root.geometry("900x500")
@@ -94,16 +113,15 @@ class MainWindow:
         if not path:
             return
 
-        new_entries = import_from_csv(path)
-        existing_ids = {e["id"] for e in self.vault["entries"]}
+        store = self.vault["entries"]
+        with self.search_runner.paused():
+            new_entries = [
+                e for e in import_from_csv(path) if store.get(e["id"]) is None
+            ]
+            added = len(store.add_many(new_entries))
+            self.search_index.changed(e["id"] for e in new_entries)
 
-        added = 0
-        for e in new_entries:
-            if e["id"] not in existing_ids:
-                self.vault["entries"].append(e)
-                added += 1
-
-        save_vault(self.vault, self.session.master_password)
+        save_vault(self.vault, self.session.key, self.session.vault_path)
         self.load_entries()
 
         messagebox.showinfo("ZipPass", f"Импортировано записей: {added}")
@@ -228,25 +246,35 @@ class MainWindow:
         self.load_entries()
 
     def load_entries(self):
-        self.tree.delete(*self.tree.get_children())
-
-        cat_id = self.get_selected_category_id()
-        query = self.search_var.get().lower().strip()
+        polling = self.search_ticket is not None
+        self.search_ticket = self.search_runner.submit(
+            self.search_var.get(), self.get_selected_category_id()
+        )
+        if not polling:
+            self.root.after(20, self.poll_search)
+
+    def poll_search(self):
+        rows = None
+        while True:
+            try:
+                result = self.search_results.get_nowait()
+            except queue.Empty:
+                break
+            if result.ticket == self.search_ticket:
+                rows = result.rows
+
+        if rows is None:
+            if self.search_ticket is not None:
+                self.root.after(20, self.poll_search)
+            return
 
-        for entry in self.vault.get("entries", []):
-            if cat_id != "all" and entry.get("category_id", "all") != cat_id:
-                continue
+        self.search_ticket = None
+        self.show_entries(rows)
 
-            if query:
-                haystack = " ".join([
-                    entry.get("service", ""),
-                    entry.get("login", ""),
-                    entry.get("url", ""),
-                    entry.get("note", ""),
-                ]).lower()
-                if query not in haystack:
-                    continue
+    def show_entries(self, entries):
+        self.tree.delete(*self.tree.get_children())
 
+        for entry in entries:
             icon = None
             url = entry.get("url", "")
             if url:
@@ -269,18 +297,21 @@ class MainWindow:
 
     def get_selected_entry(self):
         selected = self.tree.focus()
-        for entry in self.vault["entries"]:
-            if entry["id"] == selected:
-                return entry
-        return None
+        if not selected:
+            return None
+        return self.vault["entries"].get(selected)
 
     def open_entry(self, event=None):
         entry = self.get_selected_entry()
         if not entry:
             return
 
-        def on_save():
-            save_vault(self.vault, self.session.master_password)
+        def on_save(fields):
+            with self.search_runner.paused():
+                self.vault["entries"].update(entry["id"], fields)
+                self.search_index.changed([entry["id"]])
+            self.frecency.record(entry["id"], "edit")
+            save_vault(self.vault, self.session.key, self.session.vault_path)
             self.load_entries()
 
         EntryView(
@@ -295,6 +326,8 @@ class MainWindow:
         entry = self.get_selected_entry()
         if entry and entry.get("url"):
             webbrowser.open(entry["url"])
+            # Saved with the vault's next save
+            self.frecency.record(entry["id"], "open_site")
 
     def focus_search(self, event=None):
         if self.search_entry:
@@ -309,3 +342,6 @@ class MainWindow:
 
     def run(self):
         self.root.mainloop()
+        self.search_runner.stop()
+        # Built this session: saved so the next start restores it
+        save_search_index(self.vault, self.session.key, self.session.vault_path)
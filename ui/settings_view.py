@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import messagebox
 
-from core.vault import save_vault
+from core.vault import change_master_password
 from ui.theme import BG_MAIN, BG_ENTRY, FG_TEXT, ACCENT
 
 
@@ -95,10 +95,6 @@ class SettingsWindow:
         new = self.new_pass.get()
         repeat = self.new_pass_repeat.get()
 
-        if old != self.session.master_password:
-            messagebox.showerror("Ошибка", "Неверный текущий пароль")
-            return
-
         if not new:
             messagebox.showerror("Ошибка", "Новый пароль пустой")
             return
@@ -107,11 +103,22 @@ class SettingsWindow:
             messagebox.showerror("Ошибка", "Пароли не совпадают")
             return
 
-        # 🔐 пересохраняем сейф с новым паролем
-        save_vault(self.session.vault, new)
+        # 🔐 перешифровываем только ключ в заголовке сейфа
+        self.session.flush()
+        try:
+            key = change_master_password(
+                self.session.key,
+                old,
+                new,
+                self.session.vault_path,
+                self.session.vault,
+            )
+        except ValueError:
+            messagebox.showerror("Ошибка", "Неверный текущий пароль")
+            return
 
         # обновляем сессию
-        self.session.master_password = new
+        self.session.key = key
 
         messagebox.showinfo("ZipPass", "Мастер-пароль изменён")
         self.window.destroy()
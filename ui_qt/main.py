@@ -6,7 +6,7 @@ from ui_qt.unlock_window import UnlockWindow
 from ui_qt.main_window import MainWindow
 
 from core.session import Session
-from core.vault import load_vault, save_vault
+from core.vault import create_vault_key, open_vault, save_vault
 
 
 def main():
@@ -30,8 +30,9 @@ def main():
             "entries": [],
         }
 
-        save_vault(vault, unlock.password, picker.selected_path)
-        session.unlock(vault, unlock.password)
+        key = create_vault_key(unlock.password)
+        save_vault(vault, key, picker.selected_path)
+        session.unlock(vault, key, picker.selected_path)
 
     # ===== Open existing =====
     else:
@@ -40,16 +41,25 @@ def main():
             return
 
         try:
-            vault = load_vault(unlock.password, picker.selected_path)
+            vault, key, write_lock = open_vault(unlock.password, picker.selected_path)
         except Exception as e:
             QMessageBox.critical(None, "Ошибка", str(e))
             return
 
-        session.unlock(vault, unlock.password)
+        session.unlock(vault, key, picker.selected_path, write_lock)
+
+    if session.read_only:
+        QMessageBox.warning(
+            None, "ZipPass",
+            "Хранилище открыто для записи другим процессом (например, агентом).\n"
+            "Изменения не будут сохранены.",
+        )
 
     win = MainWindow(session)
     win.show()
 
+    app.aboutToQuit.connect(session.flush)
+
     sys.exit(app.exec())
 
 
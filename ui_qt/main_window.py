@@ -1,7 +1,6 @@
 from PySide6.QtCore import (
     Qt,
     QSize,
-    QSortFilterProxyModel,
     QTimer,
     QEvent,
 )
@@ -27,10 +26,12 @@ from PySide6.QtWidgets import (
 from ui_qt.entry_dialog import EntryDialog
 from ui_qt.preview_panel import PreviewPanel
 from ui_qt.models.entries_model import EntriesModel
-from core.vault import save_vault
+from core import journal
+from core.frecency import Frecency
 from utils.csv_io import export_to_csv, import_from_csv
 
 import os
+import time
 
 
 class MainWindow(QMainWindow):
@@ -42,6 +43,7 @@ class MainWindow(QMainWindow):
 
         self.session = session
         self.vault = session.vault
+        self.frecency = Frecency(self.vault)
 
         self.setWindowTitle("ZipPass")
         self.setMinimumSize(1100, 620)
@@ -52,6 +54,7 @@ class MainWindow(QMainWindow):
         # ===== Auto-lock timer =====
         self._lock_timer = QTimer(self)
         self._lock_timer.setInterval(1000)
+        self._lock_timer.timeout.connect(self.update_save_state)
         self._lock_timer.timeout.connect(self.session.check_inactivity)
         self._lock_timer.start()
 
@@ -100,6 +103,22 @@ class MainWindow(QMainWindow):
             self.session.notify_minimized()
         super().changeEvent(event)
 
+    def closeEvent(self, event):
+        if self.session.is_unlocked and not self.session.flush() and not self.session.read_only:
+            # Closing would lose the changes: keep the window open
+            QMessageBox.critical(
+                self, "ZipPass",
+                f"Не удалось сохранить изменения:\n{self.session.saver.state().error}",
+            )
+            event.ignore()
+            return
+
+        self.entries_model.close()
+        if self.session.saver:
+            # Closed without locking: save the search index like lock() does
+            self.session.saver.save_index()
+        super().closeEvent(event)
+
     # ================= Toolbar =================
 
     def build_toolbar(self):
@@ -164,6 +183,9 @@ class MainWindow(QMainWindow):
 
         self.setCentralWidget(root)
 
+        self.save_state_label = QLabel()
+        self.statusBar().addPermanentWidget(self.save_state_label)
+
         self.category_list.itemSelectionChanged.connect(
             self.on_category_changed
         )
@@ -233,12 +255,13 @@ class MainWindow(QMainWindow):
         if not ok or not name:
             return
 
-        self.vault.setdefault("categories", []).append({
+        cat = {
             "id": os.urandom(8).hex(),
             "name": name,
-        })
+        }
+        self.vault.setdefault("categories", []).append(cat)
 
-        save_vault(self.vault, self.session.master_password, self.session.vault_path)
+        self.save_changes([journal.put_category(cat)])
         self.load_categories()
 
     def rename_category(self, cid):
@@ -256,19 +279,19 @@ class MainWindow(QMainWindow):
             return
 
         cat["name"] = name.strip()
-        save_vault(self.vault, self.session.master_password, self.session.vault_path)
+        self.save_changes([journal.put_category(cat)])
         self.load_categories()
 
     def delete_category(self, cid):
-        if any(e["category_id"] == cid for e in self.vault["entries"]):
+        if self.vault["entries"].has_category(cid):
             QMessageBox.warning(self, "Ошибка", "В категории есть записи")
             return
 
-        self.vault["categories"] = [
-            c for c in self.vault["categories"] if c["id"] != cid
-        ]
+        # In place: the search thread (core.query.QueryRunner) holds the list
+        categories = self.vault["categories"]
+        categories[:] = [c for c in categories if c["id"] != cid]
 
-        save_vault(self.vault, self.session.master_password, self.session.vault_path)
+        self.save_changes([journal.delete_category(cid)])
         self.load_categories()
 
     def open_category_menu(self, pos):
@@ -307,20 +330,23 @@ class MainWindow(QMainWindow):
 
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Поиск по сервису, логину или URL…")
+        self.search_input.setToolTip(
+            "Поля: login:alice domain:github.com category:Работа\n"
+            "updated:<90d (за 90 дней), updated:>1y, created:2024-05-01\n"
+            "weak:yes (слабые пароли), /регулярное выражение/"
+        )
 
-        self.entries_model = EntriesModel(self.vault)
-
-        self.proxy_model = QSortFilterProxyModel(self)
-        self.proxy_model.setSourceModel(self.entries_model)
-        self.proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)
-        self.proxy_model.setFilterKeyColumn(-1)
+        # Rows are fetched in batches; search and sort go through the
+        # model (core.search), so no proxy model in between
+        self.entries_model = EntriesModel(self.vault, frecency=self.frecency)
 
-        self.search_input.textChanged.connect(
-            self.proxy_model.setFilterFixedString
-        )
+        self.search_input.textChanged.connect(self.entries_model.set_query)
 
         self.entries_view = QTreeView()
-        self.entries_view.setModel(self.proxy_model)
+        self.entries_view.setModel(self.entries_model)
+        self.entries_view.setUniformRowHeights(True)
+        self.entries_view.header().setSortIndicator(-1, Qt.AscendingOrder)
+        self.entries_view.setSortingEnabled(True)
         self.entries_view.setRootIsDecorated(False)
         self.entries_view.setSelectionBehavior(QTreeView.SelectRows)
         self.entries_view.setSelectionMode(QTreeView.ExtendedSelection)
@@ -334,7 +360,7 @@ class MainWindow(QMainWindow):
             self.update_toolbar_state
         )
 
-        self.preview = PreviewPanel(self)
+        self.preview = PreviewPanel(self, on_use=self.record_use)
 
         splitter = QSplitter(Qt.Horizontal)
         splitter.addWidget(self.entries_view)
@@ -366,19 +392,10 @@ class MainWindow(QMainWindow):
         if confirm != QMessageBox.Yes:
             return
 
-        rows = sorted(
-            (self.proxy_model.mapToSource(i).row() for i in indexes),
-            reverse=True
-        )
-
-        for row in rows:
-            entry = self.entries_model.get_entry(row)
-            self.vault["entries"].remove(entry)
-
-        save_vault(self.vault, self.session.master_password, self.session.vault_path)
+        rows = sorted((i.row() for i in indexes), reverse=True)
 
-        self.entries_model.beginResetModel()
-        self.entries_model.endResetModel()
+        ids = [self.entries_model.get_entry(row)["id"] for row in rows]
+        self.save_changes(self.entries_model.remove_entries(ids))
         self.preview.clear()
 
     def delete_all_entries(self):
@@ -398,13 +415,46 @@ class MainWindow(QMainWindow):
         if confirm != QMessageBox.Yes:
             return
 
-        self.vault["entries"].clear()
-        save_vault(self.vault, self.session.master_password, self.session.vault_path)
-
-        self.entries_model.beginResetModel()
-        self.entries_model.endResetModel()
+        self.save_changes(self.entries_model.clear_entries())
         self.preview.clear()
 
+    # ================= Persistence =================
+
+    def save_changes(self, changes):
+        self.session.mark_dirty(changes)
+        self.update_save_state()
+
+    def update_save_state(self):
+        saver = self.session.saver
+        if not saver:
+            return
+
+        state = saver.state()
+        if state.error:
+            text = f"⚠️ Ошибка сохранения: {state.error}"
+        elif state.saving:
+            text = "Сохранение…"
+        elif state.pending:
+            text = "Есть несохранённые изменения"
+        elif state.last_saved:
+            text = "Сохранено в " + time.strftime(
+                "%H:%M:%S", time.localtime(state.last_saved)
+            )
+        else:
+            text = ""
+
+        self.save_state_label.setText(text)
+
+        tooltip = ""
+        stats = state.last_stats
+        if stats and stats.compression and stats.compression.raw_bytes:
+            packed = stats.compression
+            tooltip = (
+                f"Сжатие {packed.name}: {packed.ratio:.0%} от исходного размера, "
+                f"{packed.compress_ms:.0f} мс"
+            )
+        self.save_state_label.setToolTip(tooltip)
+
     # ================= CSV =================
 
     def export_csv(self):
@@ -424,11 +474,12 @@ class MainWindow(QMainWindow):
         if not path:
             return
 
-        count = import_from_csv(self.vault, path)
-        if count:
-            save_vault(self.vault, self.session.master_password, self.session.vault_path)
-            self.entries_model.beginResetModel()
-            self.entries_model.endResetModel()
+        changes = import_from_csv(
+            self.vault, path, add=self.entries_model.insert_entries
+        )
+        count = sum(1 for c in changes if c["op"] == "put_entry")
+        if changes:
+            self.save_changes(changes)
 
         QMessageBox.information(self, "Импорт", f"Импортировано записей: {count}")
 
@@ -445,8 +496,7 @@ class MainWindow(QMainWindow):
         indexes = self.entries_view.selectionModel().selectedRows()
         if not indexes:
             return None
-        source = self.proxy_model.mapToSource(indexes[0])
-        return self.entries_model.get_entry(source.row())
+        return self.entries_model.get_entry(indexes[0].row())
 
     def add_entry(self):
         entry = {
@@ -462,10 +512,7 @@ class MainWindow(QMainWindow):
         dialog = EntryDialog(self, entry, self.vault)
         if dialog.exec():
             entry.update(dialog.get_entry_data())
-            self.vault["entries"].append(entry)
-            save_vault(self.vault, self.session.master_password, self.session.vault_path)
-            self.entries_model.beginResetModel()
-            self.entries_model.endResetModel()
+            self.save_changes(self.entries_model.insert_entries([entry]))
 
     def edit_entry(self):
         entry = self.get_selected_entry()
@@ -474,10 +521,13 @@ class MainWindow(QMainWindow):
 
         dialog = EntryDialog(self, entry, self.vault)
         if dialog.exec():
-            entry.update(dialog.get_entry_data())
-            save_vault(self.vault, self.session.master_password, self.session.vault_path)
-            self.entries_model.beginResetModel()
-            self.entries_model.endResetModel()
+            changes = self.entries_model.update_entry(
+                entry, dialog.get_entry_data()
+            )
+            self.save_changes(changes + self.frecency.record(entry["id"], "edit"))
+
+    def record_use(self, entry, event: str):
+        self.save_changes(self.frecency.record(entry["id"], event))
 
     def open_entry(self, _):
         self.edit_entry()
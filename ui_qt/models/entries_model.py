@@ -1,28 +1,128 @@
-from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, Signal
 from PySide6.QtGui import QIcon
 
+from core import query, search
+from core.domains import DomainIndex
+from core.query import QueryRunner
+from core.search import SearchIndex
 from utils.icons import get_favicon
+from utils.password import estimate_strength
+
+
+def _is_weak(password: str) -> bool:
+    return estimate_strength(password).level == "weak"
 
 
 class EntriesModel(QAbstractTableModel):
     HEADERS = ["Service", "Login", "URL"]
+    COLUMNS = ["service", "login", "url"]
+
+    # Rows handed to the view at a time (canFetchMore / fetchMore)
+    FETCH_BATCH = 256
+
+    # core.query.QueryResult, emitted on the search thread
+    results_ready = Signal(object)
 
-    def __init__(self, vault):
+    def __init__(self, vault, batch_size: int | None = None, frecency=None):
         super().__init__()
         self.vault = vault
         self.category_id = "all"
+        self.batch_size = batch_size or self.FETCH_BATCH
+
+        # Most used entries first (core.frecency). Uses recorded while
+        # rows are on screen show up at the next refresh (category,
+        # query or sort change), not under the cursor.
+        self.frecency = frecency
+        self._frecency_version = None
+        self._by_use = False
+
+        # Search and sort run over every entry through the core index,
+        # not over the rows fetched so far, on the search thread
+        # (core.query): the rows on screen stay until the results are
+        # in. Without a sort column plain text results are ranked.
+        self.text = ""
+        self.query = ""                 # free text of the query, normalized
+        self._plain = True              # no field terms (login:, /regex/, ...)
+        self.sort_field: str | None = None
+        self.descending = False
+        self._ticket: int | None = None
+
+        # Rows of every category shown so far, kept up to date by the
+        # mutation methods below. "all" is the EntryStore itself.
+        self._views: dict[str, list[dict]] = {}
+        self._result: list[dict] | None = None   # with a query or sort
+        self._version = None
+        # Restored from the copy saved with the vault, or built, on
+        # the search thread right away
+        self._index = SearchIndex.for_vault(self.vault)
+        # Entries by site, for URL lookups; built on the first one
+        self._domains = DomainIndex(self.vault["entries"])
+        self._reorder()
+        self._loaded = min(self.batch_size, len(self._view()))
+
+        self._runner = QueryRunner(
+            self._index,
+            self.vault.setdefault("categories", []),
+            is_weak=_is_weak,
+            on_result=self.results_ready.emit,
+            frecency=frecency,
+        )
+        self.results_ready.connect(self._on_results)
+        self._runner.warm()
+
+    def close(self):
+        # Stops the search thread; call when the window goes away
+        self._runner.stop()
 
     def set_category(self, cid):
         self.category_id = cid
-        self.beginResetModel()
-        self.endResetModel()
+        if self._searching():
+            # Rows of another category must not stay on screen
+            self.beginResetModel()
+            self._result = []
+            self._loaded = 0
+            self.endResetModel()
+        self._search()
+
+    def set_query(self, text: str):
+        self.text = text.strip()
+        parsed = query.parse(self.text)
+        self.query = parsed.text
+        self._plain = parsed.is_plain
+        self._search()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Column -1 (no sort indicator) means vault order
+        if 0 <= column < len(self.COLUMNS):
+            self.sort_field = self.COLUMNS[column]
+        else:
+            self.sort_field = None
+        self.descending = order == Qt.DescendingOrder
+        self._search()
 
     def rowCount(self, parent=QModelIndex()):
-        return len(self._entries())
+        if parent.isValid():
+            return 0
+        return min(self._loaded, len(self._view()))
 
     def columnCount(self, parent=QModelIndex()):
         return len(self.HEADERS)
 
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._loaded < len(self._view())
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.batch_size, len(self._view()) - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
     def headerData(self, section, orientation, role):
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
             return self.HEADERS[section]
@@ -32,16 +132,11 @@ class EntriesModel(QAbstractTableModel):
         if not index.isValid():
             return None
 
-        entry = self._entries()[index.row()]
+        entry = self._view()[index.row()]
         col = index.column()
 
         if role == Qt.DisplayRole:
-            if col == 0:
-                return entry.get("service", "")
-            if col == 1:
-                return entry.get("login", "")
-            if col == 2:
-                return entry.get("url", "")
+            return entry.get(self.COLUMNS[col], "")
 
         if role == Qt.DecorationRole and col == 0:
             icon = get_favicon(entry.get("url", ""))
@@ -51,12 +146,324 @@ class EntriesModel(QAbstractTableModel):
         return None
 
     def get_entry(self, row: int) -> dict:
-        return self._entries()[row]
+        return self._view()[row]
+
+    def entries_for_url(self, url: str, limit: int | None = None) -> list[dict]:
+        """
+        Entries of the site of `url`, best match first (core.domains).
+        """
+        return self._domains.match(url, limit, self.frecency)
+
+    # =========================
+    # Mutations
+    # =========================
+    # Entries change through these, not through vault["entries"]
+    # (core.entry_store.EntryStore) directly: the affected rows get
+    # rowsInserted / rowsRemoved / dataChanged instead of a model
+    # reset, so selection and scroll position survive. Rows past the
+    # fetched ones change silently. The search thread is paused while
+    # the store changes; a field query (login:, weak:, ...) runs again
+    # afterwards. Each returns the store's change records.
+
+    def insert_entries(self, entries: list[dict]) -> list[dict]:
+        """
+        Add new entries; they go to the end of every view, also when
+        it is sorted.
+        """
+        store = self.vault["entries"]
+        entries = list(entries)
+
+        with self._runner.paused():
+            self._check()
+            shown = [e for e in entries if self._shows(e)]
+            first = len(self._view())
+            exposed = shown and self._loaded >= first
+
+            if exposed:
+                self.beginInsertRows(QModelIndex(), first, first + len(shown) - 1)
+            changes = store.add_many(entries)
+            for entry in entries:
+                # "all" is every entry, not only those without a category
+                for cid in {entry.get("category_id", "all"), "all"}:
+                    view = self._views.get(cid)
+                    if view is not None:
+                        view.append(entry)
+            if self._result is not None:
+                self._result.extend(shown)
+            self._synced([e["id"] for e in entries])
+            if exposed:
+                self._loaded += len(shown)
+                self.endInsertRows()
+
+        self._research()
+        return changes
+
+    def update_entry(self, entry: dict, fields: dict) -> list[dict]:
+        with self._runner.paused():
+            changes = self._update(entry, fields)
+        self._research()
+        return changes
+
+    def _update(self, entry: dict, fields: dict) -> list[dict]:
+        store = self.vault["entries"]
+        self._check()
+        old_category_id = entry.get("category_id", "all")
+        new_category_id = fields.get("category_id", old_category_id)
+
+        row = self._row_of(entry)
+        stays = self.category_id in ("all", new_category_id)
+
+        # Edited in place; stays on screen until the next search even
+        # if it no longer matches the query
+        if row is not None and stays:
+            changes = store.update(entry["id"], fields)
+            self._move(entry, old_category_id, new_category_id)
+            self._synced([entry["id"]])
+            if row < self._loaded:
+                self.dataChanged.emit(
+                    self.index(row, 0),
+                    self.index(row, len(self.HEADERS) - 1),
+                )
+            return changes
+
+        # Moved out of the category on screen
+        if row is not None:
+            visible = row < self._loaded
+            if visible:
+                self.beginRemoveRows(QModelIndex(), row, row)
+            changes = store.update(entry["id"], fields)
+            self._move(entry, old_category_id, new_category_id)
+            if self._result is not None:
+                del self._result[row]
+            self._synced([entry["id"]])
+            if visible:
+                self._loaded -= 1
+                self.endRemoveRows()
+            return changes
+
+        # Moved into it
+        preview = {f: fields.get(f, entry.get(f)) for f in search.SEARCH_FIELDS}
+        shows = stays and self._plain and (
+            not self.query or search.matches(search.entry_text(preview), self.query)
+        )
+        first = len(self._view())
+        exposed = shows and self._loaded >= first
+
+        if exposed:
+            self.beginInsertRows(QModelIndex(), first, first)
+        changes = store.update(entry["id"], fields)
+        self._move(entry, old_category_id, new_category_id)
+        if shows and self._result is not None:
+            self._result.append(entry)
+        self._synced([entry["id"]])
+        if exposed:
+            self._loaded += 1
+            self.endInsertRows()
+        return changes
+
+    def remove_entries(self, ids) -> list[dict]:
+        """
+        Remove entries by id, one rowsRemoved per contiguous run.
+        """
+        with self._runner.paused():
+            return self._remove(list(ids))
+
+    def _remove(self, ids: list[str]) -> list[dict]:
+        store = self.vault["entries"]
+        self._check()
+        current = self._view()
+
+        if current is store:
+            rows = [store.index_of(i) for i in ids]
+        else:
+            positions = {e["id"]: r for r, e in enumerate(current)}
+            rows = [positions.get(i) for i in ids]
+
+        runs = []
+        for row in sorted((r for r in rows if r is not None and r < self._loaded),
+                          reverse=True):
+            if runs and runs[-1][0] == row + 1:
+                runs[-1][0] = row
+            else:
+                runs.append([row, row])
+
+        # Bottom up, so the rows of the next run stay where they are
+        changes = []
+        for first, last in runs:
+            run_ids = [current[r]["id"] for r in range(first, last + 1)]
+            self.beginRemoveRows(QModelIndex(), first, last)
+            changes += store.delete(run_ids)
+            if current is not store:
+                del current[first:last + 1]
+            self._drop(run_ids)
+            self._synced(run_ids)
+            self._loaded -= last - first + 1
+            self.endRemoveRows()
+
+        # The rest isn't on screen (not fetched yet, other categories)
+        rest = store.delete(ids)
+        rest_ids = [c["id"] for c in rest]
+        self._drop(rest_ids)
+        self._synced(rest_ids)
+        if self.frecency is not None:
+            rest += self.frecency.forget(ids)
+        return changes + rest
+
+    def clear_entries(self) -> list[dict]:
+        # Everything goes: a reset is the cheap signal here
+        with self._runner.paused():
+            self.beginResetModel()
+            changes = self.vault["entries"].delete_all()
+            if self.frecency is not None:
+                changes += self.frecency.forget(list(self.frecency.usage))
+            self._views.clear()
+            self._index.build()
+            self._version = self.vault["entries"].version
+            self._refetch()
+            self.endResetModel()
+        return changes
+
+    def _row_of(self, entry: dict) -> int | None:
+        rows = self._view()
+        if rows is self.vault["entries"]:
+            return rows.index_of(entry["id"])
+        for i, e in enumerate(rows):
+            if e is entry:
+                return i
+        return None
+
+    def _shows(self, entry: dict) -> bool:
+        if self.category_id not in ("all", entry.get("category_id", "all")):
+            return False
+        if not self._plain:
+            return False   # left to the search thread (_research)
+        if self.query:
+            return search.matches(search.entry_text(entry), self.query)
+        return True
+
+    def _move(self, entry: dict, old_category_id: str, new_category_id: str):
+        # The "all" view has it either way
+        if old_category_id == new_category_id:
+            return
+        old = self._views.get(old_category_id) if old_category_id != "all" else None
+        if old is not None:
+            old[:] = [e for e in old if e is not entry]
+        new = self._views.get(new_category_id) if new_category_id != "all" else None
+        if new is not None:
+            new.append(entry)
+
+    def _drop(self, ids):
+        ids = set(ids)
+        if not ids:
+            return
+        views = list(self._views.values())
+        if self._result is not None:
+            views.append(self._result)
+        for view in views:
+            view[:] = [e for e in view if e["id"] not in ids]
+
+    # =========================
+    # Rows
+    # =========================
+
+    def _synced(self, ids=()):
+        self._version = self.vault["entries"].version
+        self._index.changed(ids)
+        self._domains.changed(ids)
+
+    def _check(self):
+        # Changed behind our back: rebuild, and search again
+        store = self.vault["entries"]
+        version = store.version
+        if version != self._version:
+            self._views.clear()
+            self._version = version
+            if self._result is not None:
+                self._result = [e for e in self._result if store.get(e["id"]) is e]
+                if self._searching():
+                    self._ticket = self._submit()
+
+    def _refetch(self):
+        self._result = None
+        self._loaded = min(self.batch_size, len(self._view()))
+
+    def _view(self):
+        """
+        Every row on screen: the latest search results, or the current
+        category. The view sees the first _loaded of them.
+        """
+        self._check()
+        if self._result is not None:
+            return self._result
+        return self._rows()
+
+    # =========================
+    # Search thread
+    # =========================
+
+    def _searching(self) -> bool:
+        return bool(self.text) or self.sort_field is not None
+
+    def _submit(self) -> int:
+        return self._runner.submit(
+            self.text, self.category_id, self.sort_field, self.descending
+        )
+
+    def _search(self):
+        if self._searching():
+            self._ticket = self._submit()
+            return
+        self._runner.cancel()
+        self._ticket = None
+        self.beginResetModel()
+        self._reorder()
+        self._refetch()
+        self.endResetModel()
+
+    def _reorder(self):
+        # Pick up uses recorded since the rows were built. Rows added
+        # or moved in since went to the end: rebuild what is shown.
+        version = self.frecency.version if self.frecency is not None else None
+        if version != self._frecency_version:
+            self._frecency_version = version
+            self._by_use = bool(self.frecency is not None and self.frecency.usage)
+            self._views.clear()
+        elif self._by_use:
+            self._views.pop(self.category_id, None)
+
+    def _research(self):
+        # Field queries can't tell a changed entry apart without it
+        if not self._plain and self._searching():
+            self._ticket = self._submit()
+
+    def _on_results(self, result):
+        if result.ticket != self._ticket:
+            return   # a newer search is on its way
+        if result.version != self.vault["entries"].version:
+            self._ticket = self._submit()   # entries changed since
+            return
+        self._ticket = None
+        self.beginResetModel()
+        self._result = result.rows
+        self._loaded = min(self.batch_size, len(self._result))
+        self.endResetModel()
+
+    def _rows(self):
+        entries = self.vault["entries"]
+        if self.category_id == "all" and not self._by_use:
+            return entries
+
+        rows = self._views.get(self.category_id)
+        if rows is None:
+            rows = self._views[self.category_id] = self._category(entries)
+        return rows
 
-    def _entries(self):
+    def _category(self, entries) -> list[dict]:
+        # Only used entries are sorted; the rest is sliced from the store
         if self.category_id == "all":
-            return self.vault["entries"]
-        return [
-            e for e in self.vault["entries"]
-            if e.get("category_id") == self.category_id
-        ]
+            return self.frecency.ordered(entries, entries.index_of)
+        # EntryStore keeps a category index (core.entry_store)
+        rows = entries.in_category(self.category_id)
+        if self._by_use:
+            rows = self.frecency.ordered(rows)
+        return rows
@@ -18,10 +18,12 @@ from utils.icons import get_favicon
 
 
 class PreviewPanel(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, on_use=None):
         super().__init__(parent)
 
         self._entry = None
+        # on_use(entry, event): copies and site opens (core.frecency)
+        self.on_use = on_use
         self.setObjectName("Preview")
 
         # ===== Title with icon =====
@@ -123,15 +125,21 @@ class PreviewPanel(QWidget):
         ):
             w.setEnabled(enabled)
 
+    def _used(self, event: str):
+        if self._entry is not None and self.on_use is not None:
+            self.on_use(self._entry, event)
+
     def _copy_login(self):
         if self.login_edit.text():
             self.login_edit.selectAll()
             self.login_edit.copy()
+            self._used("copy_login")
 
     def _copy_password(self):
         if self.password_edit.text():
             self.password_edit.selectAll()
             self.password_edit.copy()
+            self._used("copy_password")
 
     def _toggle_password(self, visible: bool):
         self.password_edit.setEchoMode(
@@ -148,3 +156,4 @@ class PreviewPanel(QWidget):
             return
 
         webbrowser.open(url)
+        self._used("open_site")
@@ -1,7 +1,11 @@
 import csv
+import io
 import uuid
 from pathlib import Path
 
+from core import journal, storage
+from core.entry_store import EntryStore
+
 
 # =========================
 # Export (Brave / Chrome compatible)
@@ -10,32 +14,47 @@ from pathlib import Path
 def export_to_csv(vault: dict, path: str) -> None:
     """
     Export vault entries to CSV compatible with Brave / Chrome.
+    vault["entries"] may be any iterable, e.g. core.vault.stream_vault's.
+    The passwords are in plain text, so the file is created readable
+    by its owner only (core.storage.atomic_write).
     """
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=["name", "url", "username", "password"]
-        )
-        writer.writeheader()
-
-        for entry in vault.get("entries", []):
-            writer.writerow({
-                "name": entry.get("service", ""),
-                "url": entry.get("url", ""),
-                "username": entry.get("login", ""),
-                "password": entry.get("password", ""),
-            })
+    storage.atomic_write(path, _csv_rows(vault.get("entries", [])))
+
+
+def _csv_rows(entries, batch: int = 1000):
+    buffer = io.StringIO(newline="")
+    writer = csv.DictWriter(
+        buffer,
+        fieldnames=["name", "url", "username", "password"]
+    )
+    writer.writeheader()
+
+    for i, entry in enumerate(entries, 1):
+        writer.writerow({
+            "name": entry.get("service", ""),
+            "url": entry.get("url", ""),
+            "username": entry.get("login", ""),
+            "password": entry.get("password", ""),
+        })
+        if not i % batch:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode("utf-8")
 
 
 # =========================
 # Import (ZipPass / Brave / Chrome)
 # =========================
 
-def import_from_csv(vault: dict, path: str) -> int:
+def import_from_csv(vault: dict, path: str, add=None) -> list[dict]:
     """
     Import entries from CSV into vault.
     Supports ZipPass, Brave, Chrome formats.
-    Returns number of imported entries.
+    Entries are added with `add` (default: EntryStore.add_many; the Qt
+    UI passes EntriesModel.insert_entries).
+    Returns the change records (core.journal) of the import.
     """
     path = Path(path)
     if not path.exists():
@@ -45,15 +64,18 @@ def import_from_csv(vault: dict, path: str) -> int:
     categories = vault.setdefault("categories", [])
     cat_map = {c["name"]: c["id"] for c in categories}
 
+    changes = []
     imported_cat_id = cat_map.get("Imported")
     if not imported_cat_id:
         imported_cat_id = uuid.uuid4().hex
-        categories.append({
+        category = {
             "id": imported_cat_id,
             "name": "Imported",
-        })
+        }
+        categories.append(category)
+        changes.append(journal.put_category(category))
 
-    imported = 0
+    imported = []
 
     with open(path, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -88,7 +110,10 @@ def import_from_csv(vault: dict, path: str) -> int:
                 "category_id": imported_cat_id,
             }
 
-            vault["entries"].append(entry)
-            imported += 1
+            imported.append(entry)
 
-    return imported
+    if add is None:
+        store = vault["entries"] = EntryStore.wrap(vault.get("entries", []))
+        add = store.add_many
+    changes += add(imported)
+    return changes
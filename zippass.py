@@ -0,0 +1,472 @@
+"""
+zippass: command line access to a vault, for scripts and cron.
+
+    python zippass.py [--vault FILE] <command> ...
+
+    get ENTRY               entry by id, or the only match of a query
+    search [QUERY]          matching entries (core.query syntax, --url)
+    add                     new entry from options
+    export FILE             entries to CSV (Brave / Chrome) or JSON
+    import FILE             entries from CSV
+    stats                   counts, weak and reused passwords
+    verify                  decrypt every entry and check the vault
+
+Results are JSON on stdout. The master password is read from
+$ZIPPASS_PASSWORD if set, otherwise from the terminal. When an unlock
+agent (zippass_agent.py) serves the vault at $ZIPPASS_AGENT_SOCK, get,
+search and add go through it and never unlock the vault themselves.
+
+Only core and utils are used, imported by the command that needs them,
+so no GUI toolkit is loaded and --help starts instantly.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+PASSWORD_ENV = "ZIPPASS_PASSWORD"
+
+# Exit codes
+EXIT_ERROR = 1
+EXIT_NOT_FOUND = 3
+
+
+class CliError(Exception):
+    def __init__(self, message: str, code: int = EXIT_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+# =========================
+# Vault access
+# =========================
+
+def _password() -> str:
+    password = os.environ.get(PASSWORD_ENV)
+    if password is not None:
+        return password
+    if not sys.stdin.isatty():
+        raise CliError(f"Нет мастер-пароля: задайте ${PASSWORD_ENV}")
+    import getpass
+    return getpass.getpass("Мастер-пароль: ", stream=sys.stderr)
+
+
+def _unlock(args, write: bool = False) -> tuple[dict, object, str]:
+    """
+    With `write`, the vault's writer lock (core.storage) is taken
+    before it is read and held until exit, so the copy saved back is
+    not stale. Without it nothing is written: the vault is loaded as
+    it is, without the key upgrade unlock_vault does for a writer.
+    """
+    from core import storage
+    from core.entry_store import EntryStore
+    from core.vault import derive_vault_key, load_vault, unlock_vault
+
+    path = _path(args)
+    if write and not storage.lock_vault(path).held:
+        raise CliError("Хранилище открыто для записи другим процессом (приложение или агент)")
+    password = _password()
+    try:
+        if write:
+            vault, key = unlock_vault(password, path)
+        else:
+            key = derive_vault_key(password, path)
+            vault = load_vault(key, path)
+    except Exception as e:
+        raise CliError(f"Не удалось открыть хранилище: {e}") from None
+    vault["entries"] = EntryStore.wrap(vault["entries"])
+    return vault, key, path
+
+
+def _path(args) -> str:
+    path = args.vault or os.path.join("data", "default.zippass")
+    if not os.path.exists(path):
+        raise CliError(f"Файл хранилища не найден: {path}", EXIT_NOT_FOUND)
+    return path
+
+
+def _save(vault: dict, key, path: str, changes: list[dict]) -> None:
+    from core import storage
+    from core.vault import append_changes
+
+    append_changes(vault, changes, key, path)
+    storage.sync_pending()
+
+
+def _agent(args):
+    """
+    Client of an agent that serves this vault, None if there is none.
+    """
+    if args.no_agent or sys.platform == "win32":
+        return None
+    from core.agent import SOCKET_ENV, AgentClient
+
+    if not os.environ.get(SOCKET_ENV):
+        return None
+    try:
+        client = AgentClient()
+        status = client.request("status")
+    except (OSError, ValueError):
+        return None
+    same = args.vault is None or os.path.realpath(args.vault) == os.path.realpath(status["vault"])
+    if not (status["unlocked"] and same):
+        client.close()
+        return None
+    return client
+
+
+def _call(client, action: str, **params) -> dict:
+    from core.native_host import RequestError
+
+    try:
+        return client.request(action, **params)
+    except RequestError as e:
+        code = EXIT_NOT_FOUND if e.code == "not_found" else EXIT_ERROR
+        raise CliError(f"Агент: {e}", code) from None
+
+
+def _summary(entry: dict) -> dict:
+    from core.records import INDEX_FIELDS
+    from core.search import peek_fields
+
+    return dict(zip(INDEX_FIELDS, peek_fields(entry, INDEX_FIELDS)))
+
+
+def _full(entry: dict) -> dict:
+    load = getattr(entry, "load", None)
+    if load is not None:
+        load()
+    return dict(entry)
+
+
+def _is_weak(password: str) -> bool:
+    from utils.password import estimate_strength
+
+    return estimate_strength(password).level == "weak"
+
+
+def _category_id(categories: list[dict], name: str | None) -> str:
+    if not name or name == "all":
+        return "all"
+    for category in categories:
+        if name in (category["id"], category["name"]):
+            return category["id"]
+    raise CliError(f"Нет категории: {name}", EXIT_NOT_FOUND)
+
+
+# =========================
+# Commands
+# =========================
+
+def cmd_get(args):
+    client = _agent(args)
+    if client is not None:
+        with client:
+            return _get_from_agent(client, args)
+
+    vault, _, _ = _unlock(args)
+    store = vault["entries"]
+    entry = store.get(args.entry)
+    if entry is None:
+        from core import query
+        from core.search import SearchIndex
+
+        rows = query.execute(
+            query.parse(args.entry), SearchIndex.for_vault(vault),
+            categories=vault["categories"], is_weak=_is_weak,
+        )
+        entry = _only(rows, args.entry)
+    return _field(_full(entry), args.field)
+
+
+def _get_from_agent(client, args):
+    try:
+        return _field(_call(client, "get", entry=args.entry)["entry"], args.field)
+    except CliError as e:
+        if e.code != EXIT_NOT_FOUND:
+            raise
+    rows = _call(client, "search", query=args.entry, limit=2)["entries"]
+    entry = _only(rows, args.entry)
+    return _field(_call(client, "get", entry=entry["id"])["entry"], args.field)
+
+
+def _only(rows: list[dict], text: str) -> dict:
+    if not rows:
+        raise CliError(f"Ничего не найдено: {text}", EXIT_NOT_FOUND)
+    if len(rows) > 1:
+        raise CliError(f"Найдено несколько записей: {text}; укажите id")
+    return rows[0]
+
+
+def _field(entry: dict, field: str | None):
+    if field is None:
+        return entry
+    if field not in entry:
+        raise CliError(f"Нет поля: {field}", EXIT_NOT_FOUND)
+    # A single field is printed as-is, for `$(zippass get ... -f password)`
+    return _Raw(str(entry[field] or ""))
+
+
+def cmd_search(args):
+    if args.url is None and args.query is None:
+        raise CliError("Укажите запрос или --url")
+    client = _agent(args)
+    if client is not None and args.url is None:
+        with client:
+            categories = _call(client, "categories")["categories"]
+            return _call(
+                client, "search", query=args.query,
+                category=_category_id(categories, args.category), limit=args.limit,
+            )["entries"]
+    if client is not None:
+        client.close()
+
+    vault, _, _ = _unlock(args)
+    store = vault["entries"]
+    if args.url is not None:
+        from core.domains import DomainIndex
+
+        rows = DomainIndex(store).match(args.url, args.limit)
+    else:
+        from core import query
+        from core.search import SearchIndex
+
+        rows = query.execute(
+            query.parse(args.query), SearchIndex.for_vault(vault),
+            _category_id(vault["categories"], args.category),
+            categories=vault["categories"], is_weak=_is_weak,
+        )[:args.limit]
+    return [_summary(e) for e in rows]
+
+
+def cmd_add(args):
+    fields = {
+        "service": args.service,
+        "login": args.login or "",
+        "url": args.url or "",
+        "note": args.note or "",
+        "password": _new_password(args),
+    }
+    client = _agent(args)
+    if client is not None:
+        with client:
+            categories = _call(client, "categories")["categories"]
+            fields["category_id"] = _category_id(categories, args.category)
+            return {"id": _call(client, "add", entry=fields)["entry"]}
+
+    import time
+
+    vault, key, path = _unlock(args, write=True)
+    now = time.time()
+    entry = {
+        "id": os.urandom(8).hex(),
+        **fields,
+        "category_id": _category_id(vault["categories"], args.category),
+        "created_at": now,
+        "updated_at": now,
+    }
+    _save(vault, key, path, vault["entries"].add(entry))
+    return {"id": entry["id"]}
+
+
+def _new_password(args) -> str:
+    if args.generate is not None:
+        from utils.password import generate_password
+
+        return generate_password(args.generate)
+    if args.password_stdin:
+        return sys.stdin.readline().rstrip("\n")
+    return ""
+
+
+def cmd_export(args):
+    """
+    Entries are streamed (core.vault.stream_vault), not loaded. The
+    file holds plaintext passwords: like the vault it is created
+    readable by its owner only (core.storage.atomic_write).
+    """
+    from core import storage
+    from core.vault import derive_vault_key, stream_vault
+
+    path = _path(args)
+    try:
+        key = derive_vault_key(_password(), path)
+        vault, entries = stream_vault(key, path)
+    except Exception as e:
+        raise CliError(f"Не удалось открыть хранилище: {e}") from None
+
+    exported = 0
+
+    def counted():
+        nonlocal exported
+        for entry in entries:
+            exported += 1
+            yield entry
+
+    try:
+        if args.format == "csv":
+            from utils.csv_io import export_to_csv
+
+            export_to_csv({"entries": counted()}, args.file)
+        else:
+            storage.atomic_write(args.file, _json_export(vault["categories"], counted()))
+    except OSError as e:
+        raise CliError(f"Ошибка экспорта: {e}") from None
+    return {"exported": exported, "file": args.file}
+
+
+def _json_export(categories: list[dict], entries):
+    """
+    {"categories": [...], "entries": [...]} as json.dump(indent=2)
+    writes it, one entry at a time.
+    """
+    def nested(value) -> str:
+        return json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+
+    yield ('{\n  "categories": ' + nested(categories) + ',\n  "entries": [').encode("utf-8")
+    separator = "\n    "
+    for entry in entries:
+        yield (separator + nested(entry).replace("\n", "\n  ")).encode("utf-8")
+        separator = ",\n    "
+    yield ("]\n}" if separator == "\n    " else "\n  ]\n}").encode("utf-8")
+
+
+def cmd_import(args):
+    from utils.csv_io import import_from_csv
+
+    vault, key, path = _unlock(args, write=True)
+    try:
+        changes = import_from_csv(vault, args.file)
+    except (OSError, ValueError) as e:
+        raise CliError(f"Ошибка импорта: {e}") from None
+    _save(vault, key, path, changes)
+    return {"imported": sum(1 for c in changes if c["op"] == "put_entry")}
+
+
+def cmd_stats(args):
+    from collections import Counter
+
+    from core.domains import DomainIndex
+
+    vault, key, path = _unlock(args)
+    store = vault["entries"]
+    names = {c["id"]: c["name"] for c in vault["categories"]}
+    by_category = Counter(names.get(e.get("category_id", "all"), "all") for e in store)
+    passwords = Counter(e.get("password") or "" for e in store)
+    passwords.pop("", None)
+    return {
+        "file": path,
+        "bytes": os.path.getsize(path),
+        "cipher": key.cipher,
+        "entries": len(store),
+        "categories": len(vault["categories"]),
+        "by_category": dict(by_category.most_common()),
+        "sites": len(DomainIndex(store).sites()),
+        "without_password": len(store) - sum(passwords.values()),
+        "weak": sum(n for p, n in passwords.items() if _is_weak(p)),
+        "reused": sum(n for n in passwords.values() if n > 1),
+    }
+
+
+def cmd_verify(args):
+    vault, _, path = _unlock(args)
+    store = vault["entries"]
+    categories = {c["id"] for c in vault["categories"]}
+    problems = []
+    for entry in store:
+        entry_id = dict.get(entry, "id")
+        try:
+            full = _full(entry)
+        except Exception as e:
+            problems.append({"entry": entry_id, "problem": f"unreadable: {e}"})
+            continue
+        if not full.get("service") and not full.get("url"):
+            problems.append({"entry": entry_id, "problem": "no service or url"})
+        category_id = full.get("category_id", "all")
+        if category_id != "all" and category_id not in categories:
+            problems.append({"entry": entry_id, "problem": f"unknown category {category_id}"})
+    result = {"file": path, "entries": len(store), "ok": not problems, "problems": problems}
+    if problems:
+        _print(result)
+        raise SystemExit(EXIT_ERROR)
+    return result
+
+
+# =========================
+# Entry point
+# =========================
+
+class _Raw(str):
+    """
+    Printed without JSON quoting.
+    """
+
+
+def _print(result) -> None:
+    if isinstance(result, _Raw):
+        print(result)
+        return
+    indent = 2 if sys.stdout.isatty() else None
+    print(json.dumps(result, ensure_ascii=False, indent=indent))
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="zippass", description="ZipPass command line")
+    parser.add_argument("--vault", help="vault file (default: data/default.zippass)")
+    parser.add_argument("--no-agent", action="store_true", help="do not use a running zippass-agent")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("get", help="print an entry")
+    p.add_argument("entry", help="entry id, or a query with exactly one match")
+    p.add_argument("-f", "--field", help="print only this field (e.g. password)")
+    p.set_defaults(run=cmd_get)
+
+    p = commands.add_parser("search", help="list matching entries")
+    p.add_argument("query", nargs="?", help="search text and field terms (login:, url:, weak:, ...)")
+    p.add_argument("--url", help="entries of the site of this URL instead")
+    p.add_argument("--category", help="category name or id")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(run=cmd_search)
+
+    p = commands.add_parser("add", help="add an entry")
+    p.add_argument("--service", required=True)
+    p.add_argument("--login")
+    p.add_argument("--url")
+    p.add_argument("--note")
+    p.add_argument("--category", help="category name or id")
+    secret = p.add_mutually_exclusive_group()
+    secret.add_argument("--password-stdin", action="store_true", help="read the password from stdin")
+    secret.add_argument("--generate", type=int, nargs="?", const=20, metavar="LENGTH",
+                        help="generate a password")
+    p.set_defaults(run=cmd_add)
+
+    p = commands.add_parser("export", help="write entries to a file")
+    p.add_argument("file")
+    p.add_argument("--format", choices=("csv", "json"), default="csv")
+    p.set_defaults(run=cmd_export)
+
+    p = commands.add_parser("import", help="add entries from a CSV file")
+    p.add_argument("file")
+    p.set_defaults(run=cmd_import)
+
+    p = commands.add_parser("stats", help="vault statistics")
+    p.set_defaults(run=cmd_stats)
+
+    p = commands.add_parser("verify", help="decrypt every entry and check references")
+    p.set_defaults(run=cmd_verify)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = _parser().parse_args(argv)
+    try:
+        _print(args.run(args))
+    except CliError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return e.code
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+zippass-agent: keeps a vault unlocked for scripts, like ssh-agent.
+
+    python zippass_agent.py --vault data/default.zippass &
+    export ZIPPASS_AGENT_SOCK=...   # printed on start
+
+Asks for the master password once, then serves requests on a Unix
+socket until interrupted. The protocol is described in core/agent.py.
+"""
+
+import argparse
+import asyncio
+import getpass
+import signal
+import sys
+
+from core.agent import SOCKET_ENV, Agent
+from core.vault import open_vault
+from utils.password import estimate_strength
+
+
+def _is_weak(password: str) -> bool:
+    return estimate_strength(password).level == "weak"
+
+
+async def _run(agent: Agent, vault, key, write_lock) -> None:
+    await agent.start(vault, key, write_lock)
+    serving = asyncio.create_task(agent.serve())
+    # kill / logout: lock (saving pending changes) before exiting
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+    try:
+        await serving
+    except asyncio.CancelledError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="zippass-agent", description="ZipPass unlock agent")
+    parser.add_argument("--vault", required=True, help="vault file to keep unlocked")
+    parser.add_argument("--socket", help=f"socket path (default: ${SOCKET_ENV} or the runtime directory)")
+    parser.add_argument("--auto-lock", type=int, metavar="MINUTES",
+                        help="lock after this many minutes without requests")
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        parser.error("the agent needs Unix domain sockets")
+
+    try:
+        vault, key, write_lock = open_vault(getpass.getpass("Мастер-пароль: "), args.vault)
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    agent = Agent(args.vault, args.socket, is_weak=_is_weak)
+    if args.auto_lock is not None:
+        agent.session.auto_lock_minutes = args.auto_lock
+
+    print(f"{SOCKET_ENV}={agent.socket_path}; export {SOCKET_ENV};", flush=True)
+    try:
+        asyncio.run(_run(agent, vault, key, write_lock))
+    except KeyboardInterrupt:
+        pass
+
+    # Still unlocked: the final save failed, the changes are lost
+    if agent.session.is_unlocked:
+        print(f"Ошибка: изменения не сохранены: {agent.session.saver.state().error}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
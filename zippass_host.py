@@ -0,0 +1,45 @@
+"""
+zippass-host: native messaging host for the ZipPass browser extension.
+
+The browser starts it from the host manifest, e.g. for Chrome:
+
+    {
+      "name": "com.zippass.host",
+      "description": "ZipPass",
+      "path": "/path/to/zippass-host",
+      "type": "stdio",
+      "allowed_origins": ["chrome-extension://<extension id>/"]
+    }
+
+where zippass-host runs `python zippass_host.py --vault <file>`.
+The protocol is described in core/native_host.py.
+"""
+
+import argparse
+import sys
+
+from core.native_host import NativeHost
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="zippass-host", description="ZipPass native messaging host")
+    parser.add_argument("--vault", help="vault file to serve (default: the app's vault)")
+    parser.add_argument("--auto-lock", type=int, metavar="MINUTES",
+                        help="lock after this many minutes without requests")
+    # The browser appends the caller's origin (and Firefox the
+    # manifest path); they are not ours to parse
+    args, _ = parser.parse_known_args()
+
+    host = NativeHost(args.vault)
+    if args.auto_lock is not None:
+        host.session.auto_lock_minutes = args.auto_lock
+    host.serve()
+
+    # Still unlocked: the final save failed, the changes are lost
+    if host.session.is_unlocked:
+        print(f"Ошибка: изменения не сохранены: {host.session.saver.state().error}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()